@@ -0,0 +1,161 @@
+import json
+import os
+import tempfile
+from dataclasses import dataclass
+
+import yaml
+
+# Имя бэкенда -> формат экспорта ultralytics, None - исходные веса PyTorch
+FORMATS = {"pytorch": None, "torchscript": "torchscript", "onnx": "onnx",
+           "openvino": "openvino", "ncnn": "ncnn"}
+# Форматы, для которых ultralytics умеет INT8 с калибровкой
+INT8_FORMATS = {"openvino"}
+EXPORTS_FILE = "exports.json"
+
+
+@dataclass(frozen=True, slots=True)
+class BackendConfig:
+    """
+    Чем выполнять детектор: исходные веса или экспорт в формат для CPU
+    """
+    name: str = "pytorch"
+    weights: str = "runs/detect/train2/weights/best.pt"
+    int8: bool = False
+    imgsz: int = 640
+    calibration: str = "self development dataset"
+
+    def __post_init__(self):
+        if self.name not in FORMATS:
+            raise ValueError(f"Неизвестный бэкенд {self.name}, доступны: {', '.join(FORMATS)}")
+        if self.int8 and self.name not in INT8_FORMATS:
+            raise ValueError(f"INT8 поддерживается только для {', '.join(sorted(INT8_FORMATS))}")
+
+    @classmethod
+    def from_file(cls, path: str, section: str = "backend") -> "BackendConfig":
+        """
+        Читает раздел section из YAML-конфигурации; если файла или раздела нет - значения по умолчанию
+
+        :param path: Путь к конфигурации
+        :type path: str
+        :param section: Имя раздела
+        :type section: str
+        :rtype: BackendConfig
+        """
+        if not os.path.exists(path):
+            return cls()
+        with open(path) as file:
+            config = yaml.safe_load(file) or dict()
+        return cls(**config.get(section, dict()))
+
+    @property
+    def key(self) -> str:
+        return f"{self.name}:{'int8' if self.int8 else 'fp32'}:{self.imgsz}"
+
+
+def calibration_data(dataset_dir: str, directory: str) -> str:
+    """
+    Записывает описание набора для калибровки INT8 по изображениям dataset_dir/train/images.
+
+    data.yaml набора самообучения указывает пути относительно другой папки,
+    поэтому для экспорта создаётся отдельный файл с абсолютными путями.
+
+    :param dataset_dir: Папка набора с data.yaml и train/images
+    :type dataset_dir: str
+    :param directory: Папка для нового файла
+    :type directory: str
+    :return: Путь к файлу описания
+    :rtype: str
+    """
+    with open(os.path.join(dataset_dir, "data.yaml")) as file:
+        names = yaml.safe_load(file)["names"]
+    path = os.path.join(directory, "calibration.yaml")
+    with open(path, "w") as file:
+        yaml.safe_dump({"path": os.path.abspath(dataset_dir), "train": "train/images",
+                        "val": "train/images", "names": names}, file, allow_unicode=True)
+    return path
+
+
+def _load_exports(weights: str) -> dict:
+    path = os.path.join(os.path.dirname(weights), EXPORTS_FILE)
+    if not os.path.exists(path):
+        return dict()
+    with open(path) as file:
+        return json.load(file)
+
+
+def _save_exports(weights: str, exports: dict) -> None:
+    path = os.path.join(os.path.dirname(weights), EXPORTS_FILE)
+    # Временный файл у каждого писателя свой, поэтому читатели видят либо старый, либо новый файл
+    descriptor, temporary = tempfile.mkstemp(prefix=EXPORTS_FILE, dir=os.path.dirname(path))
+    with os.fdopen(descriptor, "w") as file:
+        json.dump(exports, file, indent=2)
+    os.replace(temporary, path)
+
+
+def export(config: BackendConfig) -> str:
+    """
+    Экспортирует веса в формат бэкенда, если экспорт ещё не сделан или веса изменились.
+
+    Сделанные экспорты записываются в exports.json рядом с весами.
+
+    :param config: Бэкенд
+    :type config: BackendConfig
+    :return: Путь к модели для YOLO(...)
+    :rtype: str
+    """
+    export_format = FORMATS[config.name]
+    if export_format is None:
+        return config.weights
+    weights_mtime = os.path.getmtime(config.weights)
+    exports = _load_exports(config.weights)
+    known = exports.get(config.key)
+    if known is not None and known["weights_mtime"] == weights_mtime and os.path.exists(known["path"]):
+        return known["path"]
+
+    from ultralytics import YOLO
+
+    with tempfile.TemporaryDirectory() as directory:
+        args = dict(format=export_format, imgsz=config.imgsz)
+        if config.int8:
+            args.update(int8=True, data=calibration_data(config.calibration, directory))
+        path = str(YOLO(config.weights).export(**args))
+    exports[config.key] = {"path": path, "weights_mtime": weights_mtime}
+    _save_exports(config.weights, exports)
+    return path
+
+
+def resolve(config: BackendConfig | str) -> str:
+    """
+    Путь к модели бэкенда для load_model, при необходимости после экспорта.
+
+    Вызывается в родительском процессе до запуска рабочих: иначе каждый рабочий
+    экспортирует одну и ту же модель в один и тот же файл одновременно.
+
+    :param config: Бэкенд или путь к весам PyTorch
+    :type config: BackendConfig | str
+    :return: Путь к весам PyTorch или к экспортированной модели
+    :rtype: str
+    """
+    return export(config) if isinstance(config, BackendConfig) else config
+
+
+def load_model(config: BackendConfig | str):
+    """
+    Загружает детектор выбранного бэкенда
+
+    :param config: Бэкенд, путь к весам PyTorch (.pt) или к экспортированной модели, см. resolve
+    :type config: BackendConfig | str
+    :return: Модель с тем же интерфейсом predict/track
+    :rtype: YOLO
+    """
+    from ultralytics import YOLO
+
+    if isinstance(config, str):
+        if os.path.splitext(config)[1] != ".pt":
+            return YOLO(config, task="detect")
+        config = BackendConfig(weights=config)
+    if FORMATS[config.name] is None:
+        model = YOLO(config.weights)
+        model.fuse()
+        return model
+    return YOLO(export(config), task="detect")
@@ -0,0 +1,141 @@
+from __future__ import annotations
+
+import queue
+import threading
+from typing import TYPE_CHECKING, Generator
+
+import cv2
+import numpy as np
+
+if TYPE_CHECKING:
+    from ultralytics import YOLO
+    from ultralytics.engine.results import Results
+
+_END = object()
+
+
+def read_batches(video_path: str, stride: int, batch_size: int,
+                 prefetch: int = 4) -> Generator[list[np.ndarray], None, None]:
+    """
+    Читает кадры с шагом stride в отдельном потоке и отдаёт их пачками по batch_size.
+
+    Пока модель обрабатывает одну пачку, поток уже декодирует следующие (не больше prefetch).
+
+    :param video_path: Путь к видео
+    :type video_path: str
+    :param stride: Шаг по кадрам, как vid_stride у ultralytics
+    :type stride: int
+    :param batch_size: Размер пачки
+    :type batch_size: int
+    :param prefetch: Сколько пачек может ждать в очереди
+    :type prefetch: int
+    :return: Пачки кадров в порядке видео
+    """
+    batches: queue.Queue = queue.Queue(prefetch)
+    stop = threading.Event()
+
+    def decode():
+        capture = cv2.VideoCapture(video_path)
+        batch = list()
+        try:
+            while not stop.is_set():
+                for _ in range(stride - 1):
+                    capture.grab()
+                ok, frame = capture.read()
+                if not ok:
+                    break
+                batch.append(frame)
+                if len(batch) == batch_size:
+                    batches.put(batch)
+                    batch = list()
+            if batch:
+                batches.put(batch)
+        finally:
+            capture.release()
+            batches.put(_END)
+
+    thread = threading.Thread(target=decode, daemon=True)
+    thread.start()
+    try:
+        while (batch := batches.get()) is not _END:
+            yield batch
+    finally:
+        stop.set()
+        while thread.is_alive():
+            try:
+                batches.get_nowait()
+            except queue.Empty:
+                thread.join(0.1)
+
+
+class BatchTracker:
+    """
+    Трекер ultralytics, который получает обнаружения от model.predict по пачкам.
+
+    Обновление трекера повторяет колбэк on_predict_postprocess_end из ultralytics:
+    на кадрах без обнаружений трекер не вызывается, поэтому при тех же кадрах
+    результаты совпадают с model.track(..., stream=True).
+    """
+
+    def __init__(self, tracker: str = "botsort.yaml", frame_rate: int = 30) -> None:
+        """
+        :param tracker: Конфигурация трекера
+        :type tracker: str
+        :param frame_rate: Частота кадров трекера; model.track использует 30
+        :type frame_rate: int
+        """
+        from ultralytics.trackers.track import TRACKER_MAP
+        from ultralytics.utils import IterableSimpleNamespace, yaml_load
+        from ultralytics.utils.checks import check_yaml
+
+        cfg = IterableSimpleNamespace(**yaml_load(check_yaml(tracker)))
+        self.tracker = TRACKER_MAP[cfg.tracker_type](args=cfg, frame_rate=frame_rate)
+
+    def update(self, results: Results) -> Results:
+        """
+        Обновляет трекер обнаружениями одного кадра и добавляет к ним идентификаторы
+
+        :param results: Результат model.predict для одного кадра
+        :type results: Results
+        :return: Результат с идентификаторами треков, как у model.track
+        :rtype: Results
+        """
+        det = results.boxes.cpu().numpy()
+        if len(det) == 0:
+            # Как в ultralytics: пустой кадр не двигает frame_id трекера и не старит потерянные треки
+            return results
+        tracks = self.tracker.update(det, results.orig_img)
+        if len(tracks) == 0:
+            return results
+        import torch
+
+        idx = tracks[:, -1].astype(int)
+        results = results[idx]
+        results.update(boxes=torch.as_tensor(tracks[:, :-1]))
+        return results
+
+
+def track_batched(model: YOLO, video_path: str, model_args: dict, batch_size: int = 8,
+                  prefetch: int = 4) -> Generator[Results, None, None]:
+    """
+    Аналог model.track(video_path, stream=True, **model_args) для записанного видео:
+    детектор работает по пачкам кадров, а трекер получает кадры строго по порядку
+
+    :param model: Модель YOLO
+    :type model: YOLO
+    :param video_path: Путь к видео
+    :type video_path: str
+    :param model_args: Аргументы, как для model.track (persist, tracker, vid_stride учитываются здесь)
+    :type model_args: dict
+    :param batch_size: Размер пачки
+    :type batch_size: int
+    :param prefetch: Сколько пачек декодировать заранее
+    :type prefetch: int
+    :return: Результаты трекера по кадрам
+    """
+    predict_args = {key: value for key, value in model_args.items()
+                    if key not in ("persist", "tracker", "vid_stride")}
+    tracker = BatchTracker(model_args.get("tracker", "botsort.yaml"))
+    for batch in read_batches(video_path, model_args.get("vid_stride", 1), batch_size, prefetch):
+        for results in model.predict(batch, **predict_args):
+            yield tracker.update(results)
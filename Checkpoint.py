@@ -0,0 +1,94 @@
+import os
+import pickle
+import time
+from dataclasses import dataclass, field
+
+
+@dataclass(slots=True)
+class Checkpoint:
+    """
+    Состояние подсчёта, достаточное для продолжения обработки видео
+
+    position - сколько кадров источника уже прочитано (включая пропущенные vid_stride),
+    tracker - сериализованный трекер ultralytics или None, если его не удалось сохранить,
+    tracker_frame - число кадров с обнаружениями, по которому считается TTL треков,
+    window - буфер DetectionWindow (см. DetectionWindow.snapshot) или None без окна.
+    """
+    video_path: str
+    position: int
+    frame_number: int
+    in_out: list[int]
+    door_in_out: dict[str, list[int]]
+    tracks: list[tuple]
+    tracker: bytes | None = None
+    tracker_frame: int = 0
+    window: dict | None = None
+    saved_at: float = field(default_factory=time.time)
+
+
+def save_checkpoint(path: str, checkpoint: Checkpoint) -> None:
+    """
+    Атомарно записывает контрольную точку: сначала во временный файл, затем os.replace.
+    При сбое во время записи на диске остаётся предыдущая точка.
+
+    :param path: Путь к файлу
+    :type path: str
+    :param checkpoint: Контрольная точка
+    :type checkpoint: Checkpoint
+    """
+    temporary = path + ".tmp"
+    with open(temporary, "wb") as file:
+        pickle.dump(checkpoint, file, protocol=pickle.HIGHEST_PROTOCOL)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(temporary, path)
+
+
+def load_checkpoint(path: str) -> Checkpoint | None:
+    """
+    Читает контрольную точку
+
+    :param path: Путь к файлу
+    :type path: str
+    :return: Контрольная точка или None, если файла нет
+    :rtype: Checkpoint | None
+    """
+    if not os.path.exists(path):
+        return None
+    with open(path, "rb") as file:
+        return pickle.load(file)
+
+
+def tracker_state(model) -> bytes | None:
+    """
+    Сериализует трекер модели ultralytics
+
+    :param model: Модель YOLO, на которой уже вызывался track
+    :return: Трекер в pickle или None, если трекера нет или его нельзя сериализовать
+    :rtype: bytes | None
+    """
+    trackers = getattr(getattr(model, "predictor", None), "trackers", None)
+    if not trackers:
+        return None
+    try:
+        return pickle.dumps(trackers[0], protocol=pickle.HIGHEST_PROTOCOL)
+    except (pickle.PicklingError, TypeError, AttributeError):
+        return None
+
+
+def restore_tracker(model, state: bytes, warmup, **track_args) -> None:
+    """
+    Восстанавливает трекер модели.
+
+    Трекер ultralytics создаётся при первом вызове track, поэтому модель сначала
+    прогоняется по кадру warmup, а созданный трекер заменяется сохранённым.
+
+    :param model: Модель YOLO
+    :param state: Результат tracker_state
+    :type state: bytes
+    :param warmup: Кадр того же размера, что и видео
+    :type warmup: np.ndarray
+    :param track_args: Аргументы model.track, с которыми идёт обработка
+    """
+    model.track(warmup, **track_args)
+    model.predictor.trackers[0] = pickle.loads(state)
@@ -1,55 +1,133 @@
+from __future__ import annotations
+
+from typing import TYPE_CHECKING
+
 import cv2
 import numpy as np
 from cv2.typing import MatLike
-from ultralytics.engine.results import Results
-
-from Doors import Door, Doors
+from Doors import Door, DoorList, default_doors
 from misc import Distances
-from People import parse_results
+from People import FrameDetections, parse_detections
+
+if TYPE_CHECKING:
+    from ultralytics.engine.results import Results
 
 
 def draw_debug(results: Results,
-               draw_boxes=True, draw_doors=True, draw_lines=True) -> MatLike:
+               draw_boxes=True, draw_doors=True, draw_lines=True,
+               doors: DoorList | None = None) -> MatLike:
+    doors = default_doors() if doors is None else doors
     frame = results.orig_img
     if draw_boxes:
         frame = results.plot()
     if draw_lines:
-        line_door_person(frame, results)
+        line_door_person(frame, parse_detections(results), doors=doors)
     if draw_doors:
-        for door in Doors:
-            draw_door(frame, door)
+        for door in doors:
+            draw_door(frame, door, doors.close, doors.around)
     return cv2.resize(frame, (0, 0), fx=0.75, fy=0.75)
 
 
-def draw_door(frame: MatLike, door: Door):
-    x, y = door.center
+def draw_door(frame: MatLike, door: Door,
+              close: int = Distances.Close, around: int = Distances.Around):
+    x, y = door.center.tolist()
     r = 10
-    pt1 = door.corners[:2]
-    pt2 = door.corners[2:]
+    pt1 = door.corners[:2].tolist()
+    pt2 = door.corners[2:].tolist()
     cv2.rectangle(frame, pt1, pt2, color=(255, 255, 255))
-    cv2.circle(frame, (x, y), radius=Distances.Close, color=(0, 0, 255))
-    cv2.circle(frame, (x, y), radius=Distances.Around, color=(0, 255, 0))
+    for zone, radius, color in ((door.close_zone, close, (0, 0, 255)), (door.around_zone, around, (0, 255, 0))):
+        if zone is None:
+            cv2.circle(frame, (x, y), radius=radius, color=color)
+        else:
+            cv2.polylines(frame, [np.asarray(zone, dtype=np.int32).reshape(-1, 1, 2)], True, color)
     cv2.putText(frame, door.name[0], org=(x - r, y - r * 2),
                 fontFace=cv2.FONT_HERSHEY_SIMPLEX,
                 fontScale=1, color=(255, 255, 255),
                 thickness=2)
 
 
-def line_door_person(frame: np.ndarray, results: Results, coef: float = 1) -> None:
+def line_door_person(frame: np.ndarray, detections: FrameDetections, coef: float = 1,
+                     doors: DoorList | None = None) -> None:
     """
     Рисует линии от человека к 3м дверям, обращаясь к координатам из enum Doors
 
     :param frame: Кадр из записи для обработки
     :type frame: np.ndarray
-    :param results: Результат обнаружения объектов
-    :type results: Results
+    :param detections: Обнаружения кадра
+    :type detections: FrameDetections
     :param coef: Коэффициент масштабирования изображения
     :type coef: float
+    :param doors: Двери камеры, по умолчанию default_doors()
+    :type doors: DoorList | None
     :return: Ничего
     :rtype: None
     """
-    people_objects = parse_results(results)
-    for person in people_objects:
-        for door in Doors.centers:
-            cv2.line(frame, person.position, door,
+    doors = default_doors() if doors is None else doors
+    door_centers = [tuple(door.tolist()) for door in doors.centers]
+    for position in detections.centers.tolist():
+        for door in door_centers:
+            cv2.line(frame, tuple(position), door,
                      color=(102, 255, 51), thickness=5)
+
+
+class DebugRenderer:
+    """
+    Отладочная отрисовка, при которой каждый кадр рисуется один раз.
+
+    Статический слой дверей рисуется один раз на размер кадра и набор дверей,
+    а на кадр переносится только по заранее найденным пикселям слоя. Рамки рисует
+    один вызов results.plot(); полученный кадр идёт и в файл, и (уменьшенный) на экран.
+    """
+
+    def __init__(self, doors: DoorList | None = None, scale: float = 0.75) -> None:
+        """
+        :param doors: Двери камеры, по умолчанию default_doors()
+        :type doors: DoorList | None
+        :param scale: Масштаб кадра для отображения
+        :type scale: float
+        """
+        self.doors = default_doors() if doors is None else doors
+        self.scale = scale
+        self._key = None
+        self._pixels: np.ndarray | None = None
+        self._colors: np.ndarray | None = None
+
+    def _door_layer(self, shape: tuple[int, ...]) -> tuple[np.ndarray, np.ndarray]:
+        key = (shape, self.doors.version, self.doors.close, self.doors.around)
+        if key != self._key:
+            layer = np.zeros(shape, dtype=np.uint8)
+            for door in self.doors:
+                draw_door(layer, door, self.doors.close, self.doors.around)
+            flat = layer.reshape(-1, shape[-1])
+            self._pixels = np.flatnonzero(flat.any(axis=1))
+            self._colors = flat[self._pixels]
+            self._key = key
+        return self._pixels, self._colors
+
+    def render(self, results: Results, detections: FrameDetections | None = None,
+               draw_boxes=True, draw_doors=True, draw_lines=False) -> MatLike:
+        """
+        Рисует кадр в полном разрешении
+
+        :param results: Результат обнаружения объектов
+        :type results: Results
+        :param detections: Уже разобранные обнаружения кадра (например, Tracking.last_detections)
+        :type detections: FrameDetections | None
+        :return: Размеченный кадр
+        :rtype: MatLike
+        """
+        frame = np.ascontiguousarray(results.plot() if draw_boxes else results.orig_img.copy())
+        if draw_lines:
+            if detections is None:
+                detections = parse_detections(results)
+            line_door_person(frame, detections, doors=self.doors)
+        if draw_doors:
+            pixels, colors = self._door_layer(frame.shape)
+            frame.reshape(-1, frame.shape[-1])[pixels] = colors
+        return frame
+
+    def display(self, frame: MatLike) -> MatLike:
+        """
+        Уменьшает размеченный кадр для окна отладки
+        """
+        return cv2.resize(frame, (0, 0), fx=self.scale, fy=self.scale)
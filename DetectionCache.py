@@ -0,0 +1,190 @@
+import json
+import os
+from typing import Generator
+
+import numpy as np
+
+from People import FrameDetections
+
+# Колонки кэша: имя -> (тип, число значений на обнаружение)
+COLUMNS = {"ids": (np.int32, 1), "classes": (np.int16, 1),
+           "confidences": (np.float32, 1), "xyxy": (np.float32, 4)}
+META_FILE = "meta.json"
+OFFSETS_FILE = "offsets.bin"
+FRAMES_FILE = "frames.bin"
+
+
+class DetectionRecorder:
+    """
+    Записывает выход трекера по кадрам в папку с колонками в бинарных файлах.
+
+    Каждая колонка дописывается в свой файл, поэтому запись идёт потоково,
+    а прочитать кэш можно через np.memmap без загрузки в память (см. DetectionCache).
+    """
+
+    def __init__(self, path: str, append: bool = False, **meta) -> None:
+        """
+        :param path: Папка кэша, будет создана
+        :type path: str
+        :param append: Дописывать существующий кэш, например при продолжении с контрольной точки (см. rewind)
+        :type append: bool
+        :param meta: Дополнительные сведения о записи, например vid_stride
+        """
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.meta = meta
+        self.detections = 0
+        self.frames = 0
+        mode = "ab" if append else "wb"
+        self._files = {name: open(os.path.join(path, f"{name}.bin"), mode) for name in COLUMNS}
+        self._offsets = open(os.path.join(path, OFFSETS_FILE), mode)
+        self._frames = open(os.path.join(path, FRAMES_FILE), mode)
+        if self._offsets.tell() == 0:
+            self._offsets.write(np.int64(0).tobytes())
+        else:
+            # Запись могла оборваться посреди кадра: остаются только кадры, записанные целиком
+            frames = min(self._frames.tell(), self._offsets.tell() - 8) // 8
+            self.frames = frames
+            self.rewind(frames)
+
+    def rewind(self, frames: int) -> None:
+        """
+        Отбрасывает всё, что записано после первых frames кадров
+
+        :param frames: Сколько кадров оставить
+        :type frames: int
+        """
+        if frames > self.frames:
+            raise ValueError(f"В кэше {self.path} записано {self.frames} кадров, а нужно {frames}: "
+                             f"для продолжения записи откройте DetectionRecorder с append=True")
+        for file in (*self._files.values(), self._offsets, self._frames):
+            file.flush()
+        with open(self._offsets.name, "rb") as file:
+            file.seek(frames * 8)
+            detections = int(np.frombuffer(file.read(8), dtype=np.int64)[0])
+        for name, (dtype, width) in COLUMNS.items():
+            os.truncate(self._files[name].name, detections * width * np.dtype(dtype).itemsize)
+        os.truncate(self._offsets.name, (frames + 1) * 8)
+        os.truncate(self._frames.name, frames * 8)
+        self.frames = frames
+        self.detections = detections
+
+    def append_arrays(self, frame_index: int, ids: np.ndarray, classes: np.ndarray,
+                      confidences: np.ndarray, xyxy: np.ndarray) -> None:
+        """
+        Дописывает обнаружения одного кадра
+
+        :param frame_index: Номер кадра
+        :type frame_index: int
+        :param ids: Идентификаторы треков размера (n,)
+        :param classes: Классы размера (n,)
+        :param confidences: Уверенность размера (n,)
+        :param xyxy: Рамки размера (n, 4)
+        """
+        columns = {"ids": ids, "classes": classes, "confidences": confidences, "xyxy": xyxy}
+        for name, (dtype, width) in COLUMNS.items():
+            data = np.ascontiguousarray(columns[name], dtype=dtype).reshape(-1, width)
+            self._files[name].write(data.tobytes())
+        self.detections += len(ids)
+        self.frames += 1
+        self._offsets.write(np.int64(self.detections).tobytes())
+        self._frames.write(np.int64(frame_index).tobytes())
+
+    def append(self, frame_index: int, results) -> None:
+        """
+        Дописывает выход трекера для одного кадра
+
+        :param frame_index: Номер кадра
+        :type frame_index: int
+        :param results: Результат трекера ultralytics
+        :type results: Results
+        """
+        if results.boxes.id is None:
+            empty = np.empty(0)
+            self.append_arrays(frame_index, empty, empty, empty, np.empty((0, 4)))
+            return
+        boxes = results.boxes.numpy()
+        self.append_arrays(frame_index, boxes.id, boxes.cls, boxes.conf, boxes.xyxy)
+
+    def close(self) -> None:
+        for file in (*self._files.values(), self._offsets, self._frames):
+            file.close()
+        meta = dict(self.meta, frames=self.frames, detections=self.detections)
+        with open(os.path.join(self.path, META_FILE), "w") as file:
+            json.dump(meta, file)
+
+    def __enter__(self) -> "DetectionRecorder":
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        self.close()
+
+
+class DetectionCache:
+    """
+    Кэш обнаружений, записанный DetectionRecorder, отображённый в память
+    """
+
+    def __init__(self, path: str) -> None:
+        """
+        :param path: Папка кэша
+        :type path: str
+        """
+        with open(os.path.join(path, META_FILE)) as file:
+            self.meta = json.load(file)
+        self.path = path
+        count = self.meta["detections"]
+        self.columns = {name: self._map(f"{name}.bin", dtype, (count, width) if width > 1 else (count,))
+                        for name, (dtype, width) in COLUMNS.items()}
+        self.offsets = self._map(OFFSETS_FILE, np.int64, (self.meta["frames"] + 1,))
+        self.frame_indices = self._map(FRAMES_FILE, np.int64, (self.meta["frames"],))
+
+    def _map(self, name: str, dtype, shape: tuple[int, ...]) -> np.ndarray:
+        if shape[0] == 0:
+            return np.empty(shape, dtype=dtype)
+        return np.memmap(os.path.join(self.path, name), dtype=dtype, mode="r", shape=shape)
+
+    def __len__(self) -> int:
+        return self.meta["frames"]
+
+    def frame(self, index: int) -> dict[str, np.ndarray]:
+        """
+        Колонки обнаружений кадра index (срезы без копирования)
+        """
+        start, stop = self.offsets[index], self.offsets[index + 1]
+        return {name: column[start:stop] for name, column in self.columns.items()}
+
+    def frame_detections(self, index: int) -> FrameDetections:
+        """
+        Обнаружения кадра index. В память читается и приводится к рабочим типам только
+        этот кадр, поэтому проход по кэшу длинного видео не загружает колонки целиком.
+        Кадр собирается через FrameDetections.from_arrays, чтобы центры совпадали с живым подсчётом.
+
+        :param index: Номер записанного кадра
+        :type index: int
+        :rtype: FrameDetections
+        """
+        start, stop = int(self.offsets[index]), int(self.offsets[index + 1])
+        columns = {name: np.array(column[start:stop]) for name, column in self.columns.items()}
+        return FrameDetections.from_arrays(columns["ids"], columns["classes"],
+                                           columns["confidences"], columns["xyxy"])
+
+    def detections(self) -> Generator[FrameDetections, None, None]:
+        """
+        Отдаёт FrameDetections по кадрам в порядке записи
+        """
+        for index in range(len(self)):
+            yield self.frame_detections(index)
+
+
+def replay(cache: DetectionCache, tracking) -> None:
+    """
+    Прогоняет кэшированные обнаружения через логику подсчёта без инференса
+
+    :param cache: Кэш обнаружений
+    :type cache: DetectionCache
+    :param tracking: Объект подсчёта
+    :type tracking: Tracking
+    """
+    for detections in cache.detections():
+        tracking.track_detections(detections)
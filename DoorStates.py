@@ -0,0 +1,173 @@
+import numpy as np
+
+from Events import EventKind
+from misc import Location
+from People import State
+from TrackStates import TrackStateStore
+
+# Коды событий в таблице переходов, индекс в EVENT_KINDS
+NO_EVENT, ENTER, EXIT, PASS_BY = range(4)
+EVENT_KINDS = (None, EventKind.Enter, EventKind.Exit, EventKind.PassBy)
+# Положение трека, который ещё не был виден
+NEW = -1
+
+
+def _transition_tables() -> tuple[np.ndarray, np.ndarray]:
+    """
+    Таблицы переходов состояния трека у двери.
+
+    Индекс - [положение до + 1, трек новорождённый, положение сейчас]; строка 0 - новый трек.
+    Новорождённым считается трек, появившийся в раме двери (Close), пока он не сменил положение.
+
+    :return: Код события и новый признак новорождённого
+    :rtype: tuple[np.ndarray, np.ndarray]
+    """
+    shape = (len(Location) + 1, 2, len(Location))
+    events = np.zeros(shape, dtype=np.int8)
+    newborn = np.zeros(shape, dtype=bool)
+    close, around = Location.Close.value, Location.Around.value
+    for before in range(NEW, len(Location)):
+        for was_newborn in (0, 1):
+            for now in range(len(Location)):
+                index = before + 1, was_newborn, now
+                if before == NEW:
+                    events[index] = ENTER if now == close else NO_EVENT
+                    newborn[index] = now == close
+                    continue
+                if now == close and before == around:
+                    events[index] = EXIT
+                elif not was_newborn and now == around and before == close:
+                    events[index] = PASS_BY
+                newborn[index] = was_newborn and now == before
+    return events, newborn
+
+
+EVENTS, NEWBORN = _transition_tables()
+
+
+class DoorStates:
+    """
+    Состояния всех активных треков в массивах, по слоту на трек.
+
+    Слот хранит идентификатор, предыдущий код Location и признак новорождённого.
+    Время жизни треков ведёт TrackStateStore,
+    значения в нём - номера слотов; слоты вытесненных треков используются повторно.
+    """
+
+    def __init__(self, store: TrackStateStore[int] | None = None, capacity: int = 64) -> None:
+        """
+        :param store: Хранилище слотов треков с TTL, по умолчанию TTL 50 кадров
+        :type store: TrackStateStore[int] | None
+        :param capacity: Начальное число слотов; при нехватке массивы расширяются
+        :type capacity: int
+        """
+        self.store = store if store is not None else TrackStateStore(ttl_frames=50)
+        self.store.on_evict = self._release
+        self._reset(capacity)
+
+    def _reset(self, capacity: int) -> None:
+        self.ids = np.full(capacity, -1, dtype=np.int64)
+        self.location = np.full(capacity, NEW, dtype=np.int8)
+        self.newborn = np.zeros(capacity, dtype=bool)
+        self._free = list(range(capacity - 1, -1, -1))
+        # Слоты, вытесненные во время кадра, освобождаются только к следующему кадру
+        self._released: list[int] = []
+
+    def __len__(self) -> int:
+        return len(self.store)
+
+    def __contains__(self, track_id: int) -> bool:
+        return track_id in self.store
+
+    def get(self, track_id: int) -> State | None:
+        """
+        Состояние трека в виде State или None, если трек неизвестен
+        """
+        slot = self.store.get(track_id)
+        if slot is None or self.location[slot] == NEW:
+            return None
+        return State(Location(int(self.location[slot])), bool(self.newborn[slot]))
+
+    def _release(self, track_id: int, slot: int) -> None:
+        self._released.append(slot)
+
+    def _grow(self) -> None:
+        size = len(self.ids)
+        self.ids = np.concatenate([self.ids, np.full(size, -1, dtype=np.int64)])
+        self.location = np.concatenate([self.location, np.full(size, NEW, dtype=np.int8)])
+        self.newborn = np.concatenate([self.newborn, np.zeros(size, dtype=bool)])
+        self._free.extend(range(2 * size - 1, size - 1, -1))
+
+    def _allocate(self, track_id: int) -> int:
+        if not self._free:
+            self._grow()
+        slot = self._free.pop()
+        self.ids[slot] = track_id
+        self.location[slot] = NEW
+        self.newborn[slot] = False
+        return slot
+
+    def _slots(self, ids: np.ndarray, codes: np.ndarray, frame: int) -> np.ndarray:
+        slots = np.full(len(ids), -1, dtype=np.intp)
+        for i, (track_id, code) in enumerate(zip(ids.tolist(), codes.tolist())):
+            slot = self.store.get(track_id)
+            if slot is not None:
+                self.store.touch(track_id, frame)
+            elif code >= 0:
+                slot = self._allocate(track_id)
+                self.store.put(track_id, slot, frame)
+            else:
+                continue
+            slots[i] = slot
+        return slots
+
+    def update(self, ids: np.ndarray, codes: np.ndarray, frame: int) -> np.ndarray:
+        """
+        Переводит треки кадра в новое положение по таблице переходов.
+
+        Код -1 - положение ещё не подтверждено: известный трек только отмечается
+        как увиденный, неизвестный не заводится. Идентификаторы в кадре уникальны.
+
+        :param ids: Идентификаторы треков, (n,)
+        :type ids: np.ndarray
+        :param codes: Коды Location или -1, (n,)
+        :type codes: np.ndarray
+        :param frame: Номер обработанного кадра
+        :type frame: int
+        :return: Коды событий по обнаружениям, (n,), см. EVENT_KINDS
+        :rtype: np.ndarray
+        """
+        self._free.extend(self._released)
+        self._released.clear()
+        slots = self._slots(ids, codes, frame)
+        decided = codes >= 0
+        events = np.zeros(len(ids), dtype=np.int8)
+        slots, now = slots[decided], codes[decided]
+        before, was_newborn = self.location[slots] + 1, self.newborn[slots].astype(np.intp)
+        events[decided] = EVENTS[before, was_newborn, now]
+        self.newborn[slots] = NEWBORN[before, was_newborn, now]
+        self.location[slots] = now
+        return events
+
+    def evict(self, frame: int) -> int:
+        return self.store.evict(frame)
+
+    def snapshot(self) -> list[tuple[int, State, int]]:
+        """
+        Состояния треков для контрольной точки: (идентификатор, State, последний кадр)
+        """
+        return [(track_id, State(Location(int(self.location[slot])), bool(self.newborn[slot])), last_frame)
+                for track_id, slot, last_frame in self.store.snapshot()]
+
+    def restore(self, entries: list[tuple[int, State, int]]) -> None:
+        """
+        Заменяет состояния треков сохранёнными в snapshot
+        """
+        self._reset(max(len(entries), len(self.ids)))
+        slots = []
+        for track_id, state, last_frame in entries:
+            slot = self._allocate(track_id)
+            self.location[slot] = state.location.value
+            self.newborn[slot] = state.newborn
+            slots.append((track_id, slot, last_frame))
+        self.store.restore(slots)
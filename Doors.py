@@ -1,8 +1,14 @@
+import functools
+import logging
+import os
 from dataclasses import dataclass, field
 from typing import Generator
 
+import cv2
 import numpy as np
-from misc import boxes_center
+from misc import Distances, Location, boxes_center
+
+logger = logging.getLogger(__name__)
 
 corners_path = "doors_corners.txt"
 door_names = ("women", "men", "kid")
@@ -13,30 +19,292 @@ class Door:
     name: str
     corners: np.ndarray[int]
     center: tuple[int, int] = field(init=False)
+    # Зоны в виде многоугольников (k, 2); None - круг радиуса close/around вокруг центра
+    close_zone: np.ndarray | None = None
+    around_zone: np.ndarray | None = None
 
     def __post_init__(self):
         self.center = np.ravel(boxes_center(self.corners)).astype(int)
 
 
+class ZoneRaster:
+    """
+    Растр размером с кадр, в котором для каждого пикселя заранее записаны код Location
+    (uint8) и индекс ближайшей двери (uint16). Классификация любого числа людей -
+    одна выборка из массивов по их координатам.
+
+    Растр совпадает с DoorList.locate пиксель в пиксель, включая зоны-многоугольники
+    (Door.close_zone, Door.around_zone), но не перебирает двери на каждом кадре.
+    """
+
+    def __init__(self, doors: "DoorList", frame_shape: tuple[int, int]) -> None:
+        """
+        :param doors: Двери
+        :type doors: DoorList
+        :param frame_shape: Размер кадра (h, w)
+        :type frame_shape: tuple[int, int]
+        """
+        h, w = self.shape = tuple(frame_shape)
+        self.location = np.full((h, w), Location.Far.value, dtype=np.uint8)
+        self.nearest = np.zeros((h, w), dtype=np.uint16)
+
+        # Первая дверь в порядке файла важнее, поэтому рисуем с конца
+        for door in reversed(doors.doors):
+            self._paint(door, door.around_zone, doors.around, Location.Around)
+            self._paint(door, door.close_zone, doors.close, Location.Close)
+
+        ys, xs = np.ogrid[:h, :w]
+        best = np.full((h, w), np.inf)
+        for index, (cx, cy) in enumerate(doors.centers):
+            sq = (xs - cx) ** 2 + (ys - cy) ** 2
+            closer = sq < best
+            best[closer] = sq[closer]
+            self.nearest[closer] = index
+
+    def _paint(self, door: Door, polygon: np.ndarray | None, radius: int, location: Location) -> None:
+        if polygon is not None:
+            mask = np.zeros(self.shape, dtype=np.uint8)
+            cv2.fillPoly(mask, [np.asarray(polygon, dtype=np.int32).reshape(-1, 1, 2)], 1)
+            self.location[mask.astype(bool)] = location.value
+            return
+        h, w = self.shape
+        cx, cy = door.center
+        x1, x2 = max(cx - radius, 0), min(cx + radius + 1, w)
+        y1, y2 = max(cy - radius, 0), min(cy + radius + 1, h)
+        if x1 >= x2 or y1 >= y2:
+            return
+        ys, xs = np.ogrid[y1:y2, x1:x2]
+        inside = (xs - cx) ** 2 + (ys - cy) ** 2 < radius ** 2
+        self.location[y1:y2, x1:x2][inside] = location.value
+
+    def lookup(self, points: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Коды Location и индексы ближайших дверей для точек внутри кадра
+
+        :param points: Целочисленные координаты размера (n, 2) формата xy
+        :type points: np.ndarray
+        :return: Коды Location размера (n,) и индексы ближайших дверей размера (n,)
+        :rtype: tuple[np.ndarray, np.ndarray]
+        """
+        xs, ys = points[:, 0], points[:, 1]
+        return self.location[ys, xs].astype(np.int8), self.nearest[ys, xs].astype(np.intp)
+
+    def contains(self, points: np.ndarray) -> np.ndarray:
+        h, w = self.shape
+        return (points[:, 0] >= 0) & (points[:, 0] < w) & (points[:, 1] >= 0) & (points[:, 1] < h)
+
+
+class DoorGrid:
+    """
+    Равномерная сетка по центрам дверей с ячейкой не меньше радиуса зоны.
+
+    Все двери, до которых от точки меньше одной ячейки, лежат в её ячейке или в 8 соседних,
+    поэтому запросы по пачке точек смотрят только на двери этих 9 ячеек.
+    """
+
+    def __init__(self, centers: np.ndarray, cell: float) -> None:
+        """
+        :param centers: Центры дверей размера (d, 2)
+        :type centers: np.ndarray
+        :param cell: Размер ячейки
+        :type cell: float
+        """
+        self.cell = float(max(cell, 1))
+        self.origin = centers.min(axis=0)
+        cells = np.floor((centers - self.origin) / self.cell).astype(int)
+        self.shape = cells.max(axis=0) + 1
+        flat = cells[:, 1] * self.shape[0] + cells[:, 0]
+        self.order = np.lexsort((np.arange(len(centers)), flat))
+        self.counts = np.bincount(flat, minlength=int(np.prod(self.shape)))
+        self.offsets = np.concatenate(([0], np.cumsum(self.counts)))
+        self.per_cell = int(self.counts.max())
+
+    def candidates(self, points: np.ndarray) -> np.ndarray:
+        """
+        Индексы дверей из 9 ячеек вокруг каждой точки
+
+        :param points: Массив координат размера (n, 2)
+        :type points: np.ndarray
+        :return: Матрица индексов размера (n, 9 * k), пустые места заполнены -1
+        :rtype: np.ndarray
+        """
+        cells = np.floor((points - self.origin) / self.cell).astype(int)
+        slots = np.arange(self.per_cell)
+        blocks = list()
+        for dy in (-1, 0, 1):
+            for dx in (-1, 0, 1):
+                x, y = cells[:, 0] + dx, cells[:, 1] + dy
+                inside = (x >= 0) & (x < self.shape[0]) & (y >= 0) & (y < self.shape[1])
+                flat = np.where(inside, y * self.shape[0] + x, 0)
+                count = np.where(inside, self.counts[flat], 0)
+                index = np.minimum(self.offsets[flat][:, None] + slots, len(self.order) - 1)
+                blocks.append(np.where(slots < count[:, None], self.order[index], -1))
+        return np.hstack(blocks)
+
+
 class DoorList:
+    # С какого количества дверей locate использует DoorGrid вместо полного перебора
+    index_threshold = 32
+
+    def __init__(self, doors: list[Door], close: int = Distances.Close, around: int = Distances.Around,
+                 path: str | None = None) -> None:
+        """
+        :param doors: Двери
+        :type doors: list[Door]
+        :param close: Радиус зоны Close вокруг центра двери
+        :type close: int
+        :param around: Радиус зоны Around вокруг центра двери
+        :type around: int
+        :param path: Файл, из которого прочитаны двери, нужен для reload
+        :type path: str | None
+        """
+        self.close = int(close)
+        self.around = int(around)
+        self.path = path
+        self.zones_path: str | None = None
+        # Растёт при каждой замене дверей или зон; по нему кэши сверяют, не устарели ли они
+        self.version = 0
+        self._mtime = os.stat(path).st_mtime_ns if path is not None else None
+        self._raster: ZoneRaster | None = None
+        self._set_doors(doors)
 
-    def __init__(self, doors: list[Door]) -> None:
-        self.doors = doors
+    def _set_doors(self, doors: list[Door]) -> None:
+        centers = np.array([d.center for d in doors], dtype=float).reshape(-1, 2)
+        grid = None
+        if len(doors) >= max(self.index_threshold, 1):
+            # Ячейка порядка среднего расстояния между дверями: в ней ~1 дверь, и ближайшая
+            # дверь почти всегда находится среди 9 соседних ячеек
+            spacing = np.sqrt(np.prod(np.ptp(centers, axis=0) + 1) / len(doors))
+            grid = DoorGrid(centers, max(self.around, spacing))
+        self.doors, self._centers, self._grid = doors, centers, grid
+        self._masks = self._zone_masks(doors)
+        self.version += 1
+        if self._raster is not None:
+            self._raster = ZoneRaster(self, self._raster.shape)
 
-    @classmethod
-    def from_file(cls, path: str):
+    @property
+    def raster(self) -> ZoneRaster | None:
+        return self._raster
+
+    def rasterize(self, frame_shape: tuple[int, int]) -> ZoneRaster:
         """
-        TODO: документация
-        :param path:
-        :return:
+        Строит растр зон ZoneRaster, после чего locate для точек внутри кадра
+        сводится к выборке из массивов. Растр перестраивается при reload и load_zones.
+
+        :param frame_shape: Размер кадра (h, w)
+        :type frame_shape: tuple[int, int]
+        :return: Растр зон
+        :rtype: ZoneRaster
+        """
+        self._raster = ZoneRaster(self, frame_shape)
+        return self._raster
+
+    def load_zones(self, path: str) -> None:
+        """
+        Читает зоны-многоугольники. Формат строки: "имя close|around x1 y1 x2 y2 x3 y3 ...".
+        Двери без строки в файле сохраняют круглые зоны. При reload зоны применяются заново.
+
+        :param path: Путь к файлу зон
+        :type path: str
         """
+        self._apply_zones(self.doors, path)
+        self.zones_path = path
+        self._masks = self._zone_masks(self.doors)
+        self.version += 1
+        if self._raster is not None:
+            self._raster = ZoneRaster(self, self._raster.shape)
+
+    @staticmethod
+    def _zone_masks(doors: list[Door]) -> dict[tuple[int, str], tuple[np.ndarray, np.ndarray]]:
+        """
+        Маски зон-многоугольников по их описывающим прямоугольникам: (левый верхний угол, маска).
+        Маски заливаются cv2.fillPoly, как в ZoneRaster, поэтому границы зон совпадают с растром.
+        """
+        masks = dict()
+        for index, door in enumerate(doors):
+            for zone in ("close", "around"):
+                polygon = getattr(door, f"{zone}_zone")
+                if polygon is None:
+                    continue
+                polygon = np.asarray(polygon, dtype=np.int32).reshape(-1, 2)
+                low = polygon.min(axis=0)
+                w, h = polygon.max(axis=0) - low + 1
+                mask = np.zeros((h, w), dtype=np.uint8)
+                cv2.fillPoly(mask, [(polygon - low).reshape(-1, 1, 2)], 1)
+                masks[index, zone] = low, mask.astype(bool)
+        return masks
+
+    @staticmethod
+    def _apply_zones(doors: list[Door], path: str) -> None:
+        by_name = {door.name: door for door in doors}
+        with open(path) as file:
+            for row in file.readlines():
+                if not row.strip():
+                    continue
+                name, zone, *points = row.split()
+                polygon = np.fromiter(map(int, points), int).reshape(-1, 2)
+                setattr(by_name[name], f"{zone}_zone", polygon)
+
+    @staticmethod
+    def _read(path: str) -> list[Door]:
         doors = list()
         with open(path) as file:
             for row in file.readlines():
+                if not row.strip():
+                    continue
                 name, *corners = row.split()
                 corners = np.fromiter(map(int, corners), int)
                 doors.append(Door(name, corners))
-        return cls(doors)
+        return doors
+
+    @classmethod
+    def from_file(cls, path: str, **kwargs):
+        """
+        TODO: документация
+        :param path:
+        :param kwargs: Радиусы зон close и around, см. __init__
+        :return:
+        """
+        return cls(cls._read(path), path=path, **kwargs)
+
+    def reload(self) -> None:
+        """
+        Перечитывает файл дверей и перестраивает индекс без пересоздания объекта.
+        Зоны из load_zones применяются к новым дверям заново.
+        """
+        if self.path is None:
+            raise ValueError("Список дверей создан не из файла, перечитывать нечего")
+        mtime = os.stat(self.path).st_mtime_ns
+        doors = self._read(self.path)
+        if not doors:
+            # Пустой файл - скорее всего редактор обрезал его и ещё не записал двери
+            raise ValueError(f"В файле {self.path} нет ни одной двери")
+        if self.zones_path is not None:
+            self._apply_zones(doors, self.zones_path)
+        # Время изменения запоминается только после удачного чтения, чтобы неудачное повторилось
+        self._mtime = mtime
+        self._set_doors(doors)
+
+    def reload_if_changed(self) -> bool:
+        """
+        Перечитывает файл дверей, если он изменился с прошлого чтения.
+
+        Файл, который редактор ещё не дописал или временно удалил, не останавливает обработку:
+        остаются прежние двери, а чтение повторяется при следующей проверке.
+
+        :return: Был ли файл перечитан
+        :rtype: bool
+        """
+        if self.path is None:
+            return False
+        try:
+            if os.stat(self.path).st_mtime_ns == self._mtime:
+                return False
+            self.reload()
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning("Не удалось перечитать двери из %s, остаются прежние: %r", self.path, e)
+            return False
+        return True
 
     def __iter__(self) -> Generator[Door, None, None]:
         yield from self.doors
@@ -49,6 +317,168 @@ class DoorList:
         """
         return tuple(d.center for d in self.doors)
 
+    def squared_distances(self, points: np.ndarray) -> np.ndarray:
+        """
+        Считает квадраты расстояний от каждой точки до центра каждой двери.
+
+        :param points: Массив координат размера (n, 2) формата xy
+        :type points: np.ndarray
+        :return: Матрица размера (n, d), где d - количество дверей
+        :rtype: np.ndarray
+        """
+        points = np.asarray(points, dtype=float).reshape(-1, 2)
+        diff = points[:, None, :] - self._centers[None, :, :]
+        return np.einsum("ndk,ndk->nd", diff, diff)
+
+    def locate(self, points: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Определяет положение сразу всех людей относительно дверей.
+
+        Для каждой точки код положения берётся по первой (в порядке файла) двери,
+        в радиус around которой точка попадает, как в People.check_how_close_to_door.
+        Корень не извлекается: сравниваются квадраты расстояний.
+
+        :param points: Массив координат размера (n, 2) формата xy, например из boxes_center
+        :type points: np.ndarray
+        :return: Коды Location размера (n,) и индексы ближайших дверей размера (n,)
+        :rtype: tuple[np.ndarray, np.ndarray]
+        """
+        if self._raster is not None:
+            return self._locate_rasterized(np.asarray(points).reshape(-1, 2))
+        if self._masks:
+            return self._locate_zoned(np.asarray(points, dtype=float).reshape(-1, 2))
+        if self._grid is not None:
+            return self._locate_indexed(np.asarray(points, dtype=float).reshape(-1, 2))
+        sq = self.squared_distances(points)
+        n = len(sq)
+        if not self.doors:
+            return np.zeros(n, dtype=np.int8), np.full(n, -1, dtype=np.intp)
+        around = sq < self.around ** 2
+        first = np.argmax(around, axis=1)
+        first_sq = sq[np.arange(n), first]
+        codes = np.where(first_sq < self.close ** 2,
+                         Location.Close.value, Location.Around.value)
+        codes = np.where(around.any(axis=1), codes, Location.Far.value).astype(np.int8)
+        return codes, np.argmin(sq, axis=1)
+
+    def _locate_rasterized(self, points: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        pixels = np.floor(points).astype(np.intp)
+        inside = self._raster.contains(pixels)
+        if inside.all():
+            return self._raster.lookup(pixels)
+        codes = np.full(len(points), Location.Far.value, dtype=np.int8)
+        nearest = np.zeros(len(points), dtype=np.intp)
+        codes[inside], nearest[inside] = self._raster.lookup(pixels[inside])
+        raster, self._raster = self._raster, None
+        try:
+            codes[~inside], nearest[~inside] = self.locate(points[~inside])
+        finally:
+            self._raster = raster
+        return codes, nearest
+
+    def _locate_zoned(self, points: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """
+        То же, что locate, но с зонами-многоугольниками: принадлежность пикселя точки зоне
+        двери берётся из маски _zone_masks, круглые зоны проверяются по расстоянию, как в ZoneRaster.
+        """
+        sq = self.squared_distances(points)
+        pixels = np.floor(points).astype(np.intp)
+        codes = np.full(len(points), Location.Far.value, dtype=np.int8)
+        free = np.ones(len(points), dtype=bool)
+        for index in range(len(self.doors)):
+            close = self._inside(index, "close", pixels, sq[:, index] < self.close ** 2)
+            around = close | self._inside(index, "around", pixels, sq[:, index] < self.around ** 2)
+            codes[free & around] = np.where(close, Location.Close.value, Location.Around.value)[free & around]
+            free &= ~around
+        return codes, np.argmin(sq, axis=1)
+
+    def _inside(self, index: int, zone: str, pixels: np.ndarray, circle: np.ndarray) -> np.ndarray:
+        if (index, zone) not in self._masks:
+            return circle
+        low, mask = self._masks[index, zone]
+        xs, ys = (pixels - low).T
+        h, w = mask.shape
+        inside = (xs >= 0) & (xs < w) & (ys >= 0) & (ys < h)
+        result = np.zeros(len(pixels), dtype=bool)
+        result[inside] = mask[ys[inside], xs[inside]]
+        return result
+
+    def _locate_indexed(self, points: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """
+        То же, что locate, но через DoorGrid: расстояния считаются только до дверей соседних ячеек.
+        Точки, у которых ближайшая дверь может лежать дальше соседних ячеек, досчитываются перебором.
+        """
+        candidates = self._grid.candidates(points)
+        valid = candidates >= 0
+        diff = points[:, None, :] - self._centers[np.maximum(candidates, 0)]
+        sq = np.where(valid, np.einsum("nmk,nmk->nm", diff, diff), np.inf)
+        missing = len(self.doors)
+
+        around = sq < self.around ** 2
+        first = np.where(around, candidates, missing).min(axis=1)
+        first_sq = np.where(candidates == first[:, None], sq, np.inf).min(axis=1)
+        codes = np.where(first_sq < self.close ** 2, Location.Close.value, Location.Around.value)
+        codes = np.where(first < missing, codes, Location.Far.value).astype(np.int8)
+
+        best_sq = sq.min(axis=1)
+        nearest = np.where(sq == best_sq[:, None], candidates, missing).min(axis=1)
+        far = best_sq > self._grid.cell ** 2
+        if far.any():
+            nearest[far] = np.argmin(self.squared_distances(points[far]), axis=1)
+        return codes, nearest.astype(np.intp)
+
+    def shifted(self, dx: int = 0, dy: int = 0, close: int | None = None,
+                around: int | None = None) -> "DoorList":
+        """
+        Копия списка дверей, сдвинутая на (dx, dy), при необходимости с другими радиусами зон
+
+        :param dx: Сдвиг по x
+        :type dx: int
+        :param dy: Сдвиг по y
+        :type dy: int
+        :param close: Новый радиус Close, None - оставить
+        :type close: int | None
+        :param around: Новый радиус Around, None - оставить
+        :type around: int | None
+        :return: Новый список дверей
+        :rtype: DoorList
+        """
+        offset = np.array([dx, dy, dx, dy])
+        doors = [Door(door.name, door.corners + offset,
+                      close_zone=None if door.close_zone is None else door.close_zone + offset[:2],
+                      around_zone=None if door.around_zone is None else door.around_zone + offset[:2])
+                 for door in self.doors]
+        return DoorList(doors,
+                        close=self.close if close is None else close,
+                        around=self.around if around is None else around)
+
+    def roi(self, frame_shape: tuple[int, int], margin: int = 150) -> np.ndarray:
+        """
+        Прямоугольник, который покрывает зоны Around всех дверей с запасом margin
+
+        Запас нужен, чтобы в кадр целиком попадали люди, центр которых лежит в зоне двери.
+
+        :param frame_shape: Размер кадра (h, w)
+        :type frame_shape: tuple[int, int]
+        :param margin: Запас в пикселях вокруг зон
+        :type margin: int
+        :return: Координаты формата xyxy, обрезанные по границам кадра
+        :rtype: np.ndarray
+        """
+        h, w = frame_shape
+        if not self.doors:
+            return np.array([0, 0, w, h])
+        reach = self.around + margin
+        low, high = self._centers - reach, self._centers + reach
+        polygons = [door.around_zone for door in self.doors if door.around_zone is not None]
+        if polygons:
+            vertices = np.vstack(polygons)
+            low = np.vstack((low, vertices - margin))
+            high = np.vstack((high, vertices + margin))
+        x1, y1 = np.floor(low.min(axis=0)).astype(int)
+        x2, y2 = np.ceil(high.max(axis=0)).astype(int)
+        return np.clip([x1, y1, x2, y2], 0, [w, h, w, h])
+
 
 def update_corners(corners: list[list[float]]):
     """
@@ -86,7 +516,16 @@ def corners_from_width_height(data: list[list[int]]) -> np.ndarray[int, int]:
     return data
 
 
-Doors = DoorList.from_file(corners_path)
+@functools.cache
+def default_doors() -> DoorList:
+    """
+    Двери из corners_path. Файл читается при первом вызове, а не при импорте модуля,
+    поэтому импорт не зависит от рабочей папки.
+
+    :rtype: DoorList
+    """
+    return DoorList.from_file(corners_path)
+
 
 if __name__ == "__main__":
     image_size = 1920, 1080
@@ -108,7 +547,7 @@ if __name__ == "__main__":
     corners = corners_from_width_height(width_height)
     update_corners(corners)
 
-    for d in Doors:
+    for d in default_doors():
         print(d)
 
-    print(Doors.centers)
+    print(default_doors().centers)
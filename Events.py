@@ -0,0 +1,178 @@
+import queue
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from dataclasses import astuple, dataclass, fields
+from enum import Enum
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
+
+
+class EventKind(Enum):
+    """
+    Тип события у двери:
+    Enter  : Человек появился в дверной раме (счётчик "Зашло")
+    Exit   : Человек подошёл к двери и вошёл в раму (счётчик "Вышло")
+    PassBy : Человек, отмеченный Exit, вышел из рамы обратно - проходил мимо
+    """
+    Enter = "enter"
+    Exit = "exit"
+    PassBy = "pass_by"
+
+
+@dataclass(frozen=True, slots=True)
+class Event:
+    kind: str
+    track_id: int
+    door: str
+    model_class: int
+    frame: int
+    timestamp: float
+
+
+class EventSink(ABC):
+    """
+    Буферизованный приёмник событий.
+
+    emit только кладёт событие в очередь; фоновый поток собирает события в пачки
+    и записывает их раз в flush_interval секунд или по накоплении batch_size событий.
+    Если запись упала, следующий emit поднимает ошибку, а не копит события в очереди.
+    """
+
+    def __init__(self, flush_interval: float = 1.0, batch_size: int = 1000) -> None:
+        """
+        :param flush_interval: Максимальное время между записями в секундах
+        :type flush_interval: float
+        :param batch_size: Размер пачки, при котором запись идёт сразу
+        :type batch_size: int
+        """
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.written = 0
+        self.error: BaseException | None = None
+        self._queue: queue.SimpleQueue = queue.SimpleQueue()
+        self._closed = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=type(self).__name__, daemon=True)
+        self._thread.start()
+
+    def emit(self, kind: EventKind, track_id: int, door: str, model_class: int, frame: int) -> None:
+        if self.error is not None:
+            raise self.error
+        if not self._thread.is_alive():
+            raise RuntimeError(f"{type(self).__name__} остановлен, события не принимаются")
+        self._queue.put(Event(kind.value, track_id, door, model_class, frame, time.time()))
+
+    def _run(self) -> None:
+        try:
+            self._open()
+            batch = list()
+            deadline = time.monotonic() + self.flush_interval
+            while True:
+                timeout = max(0.0, deadline - time.monotonic())
+                try:
+                    event = self._queue.get(timeout=timeout)
+                    if event is not None:
+                        batch.append(event)
+                except queue.Empty:
+                    pass
+                closing = self._closed.is_set() and self._queue.empty()
+                if len(batch) >= self.batch_size or time.monotonic() >= deadline or closing:
+                    if batch:
+                        self._write(batch)
+                        self.written += len(batch)
+                        batch = list()
+                    deadline = time.monotonic() + self.flush_interval
+                if closing:
+                    break
+        except BaseException as e:
+            self.error = e
+        finally:
+            self._close()
+
+    def close(self) -> None:
+        """
+        Записывает оставшиеся события и останавливает фоновый поток
+        """
+        self._closed.set()
+        self._queue.put(None)
+        self._thread.join()
+        if self.error is not None:
+            raise self.error
+
+    def __enter__(self) -> "EventSink":
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        self.close()
+
+    def _open(self) -> None:
+        pass
+
+    @abstractmethod
+    def _write(self, batch: list[Event]) -> None:
+        pass
+
+    def _close(self) -> None:
+        pass
+
+
+class SQLiteEventSink(EventSink):
+    """
+    Записывает события в таблицу events базы SQLite.
+
+    Событие однозначно задаётся (kind, track_id, door, frame): при продолжении с контрольной
+    точки кадры после неё обрабатываются повторно, и уже записанные события пропускаются.
+    Поэтому одна база - для одного видео или потока.
+    """
+
+    def __init__(self, path: str, **kwargs) -> None:
+        self.path = path
+        self._connection: sqlite3.Connection | None = None
+        super().__init__(**kwargs)
+
+    def _open(self) -> None:
+        self._connection = sqlite3.connect(self.path)
+        self._connection.execute("CREATE TABLE IF NOT EXISTS events (kind TEXT, track_id INTEGER, door TEXT, "
+                                 "model_class INTEGER, frame INTEGER, timestamp REAL)")
+        self._connection.execute("CREATE UNIQUE INDEX IF NOT EXISTS events_key ON events (kind, track_id, door, frame)")
+
+    def _write(self, batch: list[Event]) -> None:
+        with self._connection:
+            self._connection.executemany("INSERT OR IGNORE INTO events VALUES (?, ?, ?, ?, ?, ?)",
+                                         map(astuple, batch))
+
+    def _close(self) -> None:
+        if self._connection is not None:
+            self._connection.close()
+
+
+class ParquetEventSink(EventSink):
+    """
+    Записывает события в файл Parquet, каждая пачка - отдельная группа строк. Нужен pyarrow.
+    """
+
+    def __init__(self, path: str, **kwargs) -> None:
+        if pa is None:
+            raise ImportError("Для ParquetEventSink нужен pyarrow: pip install pyarrow")
+        self.path = path
+        self._schema = pa.schema([("kind", pa.string()), ("track_id", pa.int64()), ("door", pa.string()),
+                                  ("model_class", pa.int64()), ("frame", pa.int64()),
+                                  ("timestamp", pa.float64())])
+        self._writer = None
+        super().__init__(**kwargs)
+
+    def _open(self) -> None:
+        self._writer = pq.ParquetWriter(self.path, self._schema)
+
+    def _write(self, batch: list[Event]) -> None:
+        columns = {field.name: [getattr(event, field.name) for event in batch] for field in fields(Event)}
+        self._writer.write_table(pa.table(columns, schema=self._schema))
+
+    def _close(self) -> None:
+        if self._writer is not None:
+            self._writer.close()
@@ -0,0 +1,151 @@
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Generator, Iterable
+
+import cv2
+import numpy as np
+
+
+@dataclass(frozen=True, slots=True)
+class CapturedFrame:
+    index: int
+    captured_at: float
+    image: np.ndarray
+
+
+class LatestFrameCapture:
+    """
+    Захват кадров в отдельном потоке, который хранит только ring_size последних кадров.
+
+    Если обработка не успевает, старые кадры вытесняются новыми и учитываются в dropped,
+    поэтому задержка между захватом и обработкой ограничена, а не растёт со временем.
+
+    Источник - адрес камеры, путь к файлу или номер устройства для cv2.VideoCapture,
+    либо любой итерируемый набор кадров (например, синтетический генератор).
+    Для файлов и итерируемых источников fps задаёт темп, с которым "камера" отдаёт кадры;
+    None - читать так быстро, как получается.
+    """
+
+    def __init__(self, source: str | int | Iterable[np.ndarray], ring_size: int = 1,
+                 fps: float | None = None) -> None:
+        """
+        :param source: Источник кадров
+        :type source: str | int | Iterable[np.ndarray]
+        :param ring_size: Сколько последних кадров хранить
+        :type ring_size: int
+        :param fps: Темп выдачи кадров для файлов и генераторов, None - без ограничения
+        :type fps: float | None
+        """
+        self.source = source
+        self.fps = fps
+        self.captured = 0
+        self.dropped = 0
+        self._ring: deque[CapturedFrame] = deque(maxlen=ring_size)
+        self._condition = threading.Condition()
+        self._finished = False
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="capture", daemon=True)
+
+    def _frames(self) -> Generator[np.ndarray, None, None]:
+        if not isinstance(self.source, (str, int)):
+            yield from self.source
+            return
+        capture = cv2.VideoCapture(self.source)
+        try:
+            while True:
+                ok, frame = capture.read()
+                if not ok:
+                    return
+                yield frame
+        finally:
+            capture.release()
+
+    def _run(self) -> None:
+        period = 1 / self.fps if self.fps else 0.0
+        next_time = time.perf_counter()
+        try:
+            for index, image in enumerate(self._frames()):
+                if self._stop.is_set():
+                    break
+                if period:
+                    next_time += period
+                    delay = next_time - time.perf_counter()
+                    if delay > 0:
+                        time.sleep(delay)
+                frame = CapturedFrame(index, time.perf_counter(), image)
+                with self._condition:
+                    if len(self._ring) == self._ring.maxlen:
+                        self.dropped += 1
+                    self._ring.append(frame)
+                    self.captured += 1
+                    self._condition.notify()
+        finally:
+            with self._condition:
+                self._finished = True
+                self._condition.notify_all()
+
+    def start(self) -> "LatestFrameCapture":
+        self._thread.start()
+        return self
+
+    def read(self) -> CapturedFrame | None:
+        """
+        Ждёт и возвращает самый старый из хранимых кадров
+
+        :return: Кадр или None, если источник закончился
+        :rtype: CapturedFrame | None
+        """
+        with self._condition:
+            self._condition.wait_for(lambda: self._ring or self._finished)
+            if self._ring:
+                return self._ring.popleft()
+            return None
+
+    def __iter__(self) -> Generator[CapturedFrame, None, None]:
+        while (frame := self.read()) is not None:
+            yield frame
+
+    def stop(self) -> None:
+        self._stop.set()
+        with self._condition:
+            self._ring.clear()
+        self._thread.join()
+
+    def __enter__(self) -> "LatestFrameCapture":
+        return self.start()
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        self.stop()
+
+
+@dataclass(slots=True)
+class LiveStats:
+    captured: int
+    dropped: int
+    processed: int
+    latency_mean_ms: float
+    latency_p95_ms: float
+
+
+def synthetic_frames(count: int, shape: tuple[int, int] = (1080, 1920),
+                     seed: int = 0) -> Generator[np.ndarray, None, None]:
+    """
+    Генератор кадров вместо камеры: движущийся по кадру прямоугольник на шуме
+
+    :param count: Количество кадров
+    :type count: int
+    :param shape: Размер кадра (h, w)
+    :type shape: tuple[int, int]
+    :param seed: Зерно генератора шума
+    :type seed: int
+    """
+    rng = np.random.default_rng(seed)
+    h, w = shape
+    background = rng.integers(0, 64, (h, w, 3), dtype=np.uint8)
+    for i in range(count):
+        frame = background.copy()
+        x = (i * 15) % max(1, w - 100)
+        cv2.rectangle(frame, (x, h // 3), (x + 100, h // 3 + 250), color=(200, 200, 200), thickness=-1)
+        yield frame
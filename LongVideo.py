@@ -0,0 +1,281 @@
+import multiprocessing
+import os
+import shutil
+import subprocess
+import tempfile
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from typing import Generator
+
+import cv2
+import numpy as np
+
+from Backends import BackendConfig, load_model, resolve
+from DetectionCache import DetectionCache, DetectionRecorder
+from Doors import DoorList
+from MultiCamera import SourceCounts
+from People import FrameDetections
+from Tracking import MODEL_ARGS, Tracking
+
+
+@dataclass(frozen=True, slots=True)
+class Segment:
+    """
+    Часть видео для одного процесса.
+
+    Кадры [warmup, start) нужны только для разгона трекера и сшивки с предыдущей частью,
+    подсчёт идёт по кадрам [start, stop).
+    """
+    index: int
+    warmup: int
+    start: int
+    stop: int
+
+
+def keyframe_indices(video_path: str, fps: float) -> np.ndarray | None:
+    """
+    Номера ключевых кадров по данным контейнера (без декодирования), нужен ffprobe
+
+    :param video_path: Путь к видео
+    :type video_path: str
+    :param fps: Частота кадров видео
+    :type fps: float
+    :return: Отсортированные номера кадров или None, если ffprobe недоступен
+    :rtype: np.ndarray | None
+    """
+    if shutil.which("ffprobe") is None:
+        return None
+    command = ["ffprobe", "-v", "error", "-select_streams", "v:0",
+               "-show_entries", "packet=pts_time,flags", "-of", "csv=p=0", video_path]
+    try:
+        output = subprocess.run(command, capture_output=True, text=True, check=True).stdout
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    times = [float(time) for time, flags in (line.split(",")[:2] for line in output.splitlines() if "," in line)
+             if flags.startswith("K") and time not in ("", "N/A")]
+    return np.unique(np.round(np.array(times) * fps).astype(np.int64)) if times else None
+
+
+def plan_segments(frame_count: int, segments: int, stride: int, overlap_frames: int,
+                  keyframes: np.ndarray | None = None) -> list[Segment]:
+    """
+    Делит видео на части с равным числом обрабатываемых кадров.
+
+    Границы лежат на сетке vid_stride последовательного прохода (кадры stride-1, 2*stride-1, ...),
+    поэтому части вместе обрабатывают ровно те же кадры. Разгон каждой части начинается
+    с ключевого кадра не позже start - overlap_frames, чтобы перемотка не декодировала лишнего.
+
+    :param frame_count: Число кадров видео
+    :type frame_count: int
+    :param segments: Желаемое число частей
+    :type segments: int
+    :param stride: Шаг по кадрам, как vid_stride у ultralytics
+    :type stride: int
+    :param overlap_frames: Длина окна перекрытия в кадрах видео
+    :type overlap_frames: int
+    :param keyframes: Номера ключевых кадров, None - перематывать точно на нужный кадр
+    :type keyframes: np.ndarray | None
+    :return: Части по порядку
+    :rtype: list[Segment]
+    """
+    if frame_count < 1:
+        raise ValueError(f"Число кадров видео неизвестно или равно нулю: {frame_count}")
+    sampled = frame_count // stride
+    bounds = sorted({round(sampled * k / segments) for k in range(segments + 1)})
+    starts = [stride - 1 + stride * bound for bound in bounds[:-1]]
+    plan = list()
+    for index, start in enumerate(starts):
+        stop = starts[index + 1] if index + 1 < len(starts) else frame_count
+        warmup = max(0, start - overlap_frames) if index else 0
+        if keyframes is not None and index:
+            before = keyframes[keyframes <= warmup]
+            warmup = int(before[-1]) if len(before) else 0
+        plan.append(Segment(index, warmup, start, stop))
+    return plan
+
+
+def segment_frames(capture: cv2.VideoCapture, segment: Segment,
+                   stride: int) -> Generator[tuple[int, np.ndarray], None, None]:
+    """
+    Кадры части с шагом stride, номера совпадают с номерами последовательного прохода
+
+    :return: Пары (номер кадра в видео, кадр)
+    """
+    capture.set(cv2.CAP_PROP_POS_FRAMES, segment.warmup)
+    position = segment.warmup
+    index = position + (stride - 1 - position) % stride
+    while index < segment.stop:
+        for _ in range(index - position):
+            capture.grab()
+        ok, frame = capture.read()
+        if not ok:
+            return
+        yield index, frame
+        position = index + 1
+        index += stride
+
+
+def _process_segment(video_path: str, weights: str, segment: Segment, stride: int,
+                     cache_path: str, threads: int) -> str:
+    """
+    Запускает трекер на части видео в отдельном процессе и записывает его выход в кэш
+
+    :return: Путь к кэшу обнаружений
+    :rtype: str
+    """
+    import torch
+
+    torch.set_num_threads(threads)
+    model = load_model(weights)
+    capture = cv2.VideoCapture(video_path)
+    try:
+        with DetectionRecorder(cache_path, video=video_path, vid_stride=stride, warmup=segment.warmup,
+                               start=segment.start, stop=segment.stop) as recorder:
+            for index, frame in segment_frames(capture, segment, stride):
+                recorder.append(index, Tracking.track_frame(model, frame))
+    finally:
+        capture.release()
+    return cache_path
+
+
+def _iou(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    top_left = np.maximum(a[:, None, :2], b[None, :, :2])
+    bottom_right = np.minimum(a[:, None, 2:], b[None, :, 2:])
+    intersection = np.prod(np.clip(bottom_right - top_left, 0, None), axis=2)
+    area_a = np.prod(a[:, 2:] - a[:, :2], axis=1)
+    area_b = np.prod(b[:, 2:] - b[:, :2], axis=1)
+    return intersection / np.maximum(area_a[:, None] + area_b[None, :] - intersection, 1e-9)
+
+
+def match_tracks(previous: DetectionCache, current: DetectionCache, min_iou: float = 0.5) -> dict[int, int]:
+    """
+    Сопоставляет треки части current трекам предыдущей части по окну перекрытия.
+
+    На каждом общем кадре окна обнаружение current голосует за рамку previous с наибольшим
+    IoU; пары треков выбираются жадно по числу голосов, каждый трек - не больше одного раза.
+
+    :param previous: Кэш предыдущей части
+    :type previous: DetectionCache
+    :param current: Кэш текущей части
+    :type current: DetectionCache
+    :param min_iou: Минимальное IoU, при котором обнаружения считаются одним человеком
+    :type min_iou: float
+    :return: Идентификатор в current -> идентификатор в previous
+    :rtype: dict[int, int]
+    """
+    previous_rows = {index: row for row, index in enumerate(previous.frame_indices.tolist())}
+    votes = Counter()
+    for row, index in enumerate(current.frame_indices.tolist()):
+        if index >= current.meta["start"]:
+            break
+        if index not in previous_rows:
+            continue
+        a, b = current.frame(row), previous.frame(previous_rows[index])
+        if len(a["ids"]) == 0 or len(b["ids"]) == 0:
+            continue
+        iou = _iou(np.asarray(a["xyxy"]), np.asarray(b["xyxy"]))
+        best = iou.argmax(axis=1)
+        for i, j in enumerate(best.tolist()):
+            if iou[i, j] >= min_iou:
+                votes[int(a["ids"][i]), int(b["ids"][j])] += 1
+    mapping, used = dict(), set()
+    for (track_id, previous_id), _ in votes.most_common():
+        if track_id not in mapping and previous_id not in used:
+            mapping[track_id] = previous_id
+            used.add(previous_id)
+    return mapping
+
+
+def stitched_detections(caches: list[DetectionCache],
+                        min_iou: float = 0.5) -> Generator[FrameDetections, None, None]:
+    """
+    Склеивает кэши частей в один поток обнаружений с общими идентификаторами треков.
+
+    Из каждой части берутся только кадры [start, stop); трек, сопоставленный треку
+    предыдущей части (см. match_tracks), получает его идентификатор, остальные - новые.
+
+    :param caches: Кэши частей по порядку
+    :type caches: list[DetectionCache]
+    :param min_iou: Порог IoU для сопоставления треков
+    :type min_iou: float
+    :return: Обнаружения по кадрам, как при последовательном проходе
+    """
+    next_id = 1
+    previous, previous_ids = None, dict()
+    for cache in caches:
+        local = np.unique(cache.columns["ids"]).astype(int)
+        mapping = match_tracks(previous, cache, min_iou) if previous is not None else dict()
+        global_ids = np.empty(len(local), dtype=int)
+        for i, track_id in enumerate(local.tolist()):
+            if track_id in mapping:
+                global_ids[i] = previous_ids[mapping[track_id]]
+            else:
+                global_ids[i] = next_id
+                next_id += 1
+        first = int(np.searchsorted(cache.frame_indices, cache.meta["start"]))
+        for index in range(first, len(cache)):
+            detections = cache.frame_detections(index)
+            yield FrameDetections(global_ids[np.searchsorted(local, detections.ids)], detections.classes,
+                                  detections.confidences, detections.centers)
+        previous, previous_ids = cache, dict(zip(local.tolist(), global_ids.tolist()))
+
+
+def process_long_video(video_path: str, weights: str | BackendConfig, doors_path: str, processes: int | None = None,
+                       segments: int | None = None, overlap_seconds: float = 10.0,
+                       cache_dir: str | None = None) -> SourceCounts:
+    """
+    Обрабатывает длинную запись параллельно по частям.
+
+    Видео не перекодируется и не режется на файлы: каждый процесс перематывает исходный
+    файл к ключевому кадру перед своей частью, разгоняет трекер на окне перекрытия и
+    записывает выход трекера в кэш. Затем треки сшиваются по окнам перекрытия, и общий
+    поток проходит через один Tracking, поэтому трек, пересекающий границу частей,
+    считается один раз. Если число кадров источника неизвестно (поток, повреждённый
+    контейнер), видео обрабатывается последовательно одним процессом.
+
+    :param video_path: Путь к видео
+    :type video_path: str
+    :param weights: Путь к весам модели или бэкенд
+    :type weights: str | BackendConfig
+    :param doors_path: Файл с углами дверей
+    :type doors_path: str
+    :param processes: Число процессов, по умолчанию os.cpu_count()
+    :type processes: int | None
+    :param segments: Число частей, по умолчанию равно числу процессов
+    :type segments: int | None
+    :param overlap_seconds: Длина окна перекрытия в секундах
+    :type overlap_seconds: float
+    :param cache_dir: Папка для временных кэшей частей
+    :type cache_dir: str | None
+    :return: Итоговые счётчики
+    :rtype: SourceCounts
+    """
+    capture = cv2.VideoCapture(video_path)
+    frame_count = int(capture.get(cv2.CAP_PROP_FRAME_COUNT))
+    fps = capture.get(cv2.CAP_PROP_FPS) or 25
+    capture.release()
+
+    weights = resolve(weights)
+    tracking = Tracking(doors=DoorList.from_file(doors_path))
+    if frame_count < 1:
+        tracking.process_video_with_tracking(load_model(weights), video_path, show_video=False)
+        return SourceCounts(os.path.basename(video_path), tracking.in_out, tracking.door_in_out)
+
+    cpu_count = os.cpu_count() or 1
+    processes = processes or cpu_count
+    stride = MODEL_ARGS["vid_stride"]
+    plan = plan_segments(frame_count, segments or processes, stride, round(overlap_seconds * fps),
+                         keyframe_indices(video_path, fps))
+    threads = max(1, cpu_count // processes)
+    context = multiprocessing.get_context("spawn")
+    with tempfile.TemporaryDirectory(dir=cache_dir) as directory:
+        with ProcessPoolExecutor(max_workers=processes, mp_context=context) as executor:
+            futures = [executor.submit(_process_segment, video_path, weights, segment, stride,
+                                       os.path.join(directory, f"segment_{segment.index:04d}"), threads)
+                       for segment in plan]
+            caches = [DetectionCache(future.result()) for future in futures]
+        for detections in stitched_detections(caches):
+            tracking.track_detections(detections)
+        del caches
+    return SourceCounts(os.path.basename(video_path), tracking.in_out, tracking.door_in_out)
@@ -0,0 +1,228 @@
+import bisect
+import json
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import ContextManager
+
+# Границы корзин гистограммы задержек в секундах
+BUCKETS = (0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1.0, 2.0, float("inf"))
+
+
+class Histogram:
+    """
+    Гистограмма задержек с фиксированными корзинами, как в Prometheus
+    """
+
+    def __init__(self, buckets: tuple[float, ...] = BUCKETS) -> None:
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, seconds: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, seconds)] += 1
+        self.sum += seconds
+        self.count += 1
+
+    def cumulative(self) -> list[int]:
+        total = 0
+        result = list()
+        for count in self.counts:
+            total += count
+            result.append(total)
+        return result
+
+
+class Metrics:
+    """
+    Задержки по стадиям обработки кадра и частота кадров.
+
+    Снимки периодически дописываются в файл JSON lines (если задан jsonl_path),
+    а serve_prometheus отдаёт их в текстовом формате Prometheus.
+
+    >>> metrics = Metrics()
+    >>> with metrics.timer("parse_results"):
+    ...     pass
+    >>> metrics.snapshot()["stages"]["parse_results"]["count"]
+    1
+    """
+    enabled = True
+
+    def __init__(self, jsonl_path: str | None = None, flush_interval: float = 10.0) -> None:
+        """
+        :param jsonl_path: Файл для периодических снимков, None - не писать
+        :type jsonl_path: str | None
+        :param flush_interval: Период записи снимков в секундах
+        :type flush_interval: float
+        """
+        self.jsonl_path = jsonl_path
+        self.flush_interval = flush_interval
+        self.stages: dict[str, Histogram] = dict()
+        self.counters: dict[str, int] = dict()
+        self.frames = 0
+        self.fps = 0.0
+        self._lock = threading.Lock()
+        self._window_start = time.perf_counter()
+        self._window_frames = 0
+        self._last_flush = time.monotonic()
+        self._server: ThreadingHTTPServer | None = None
+
+    def observe(self, stage: str, seconds: float) -> None:
+        with self._lock:
+            histogram = self.stages.get(stage)
+            if histogram is None:
+                histogram = self.stages[stage] = Histogram()
+            histogram.observe(seconds)
+
+    def count(self, name: str, value: int = 1) -> None:
+        """
+        Прибавляет value к счётчику name, например к числу отброшенных кадров записи
+        """
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    @contextmanager
+    def _timer(self, stage: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - start)
+
+    def timer(self, stage: str) -> ContextManager:
+        """
+        Контекстный менеджер, который замеряет время выполнения стадии
+
+        :param stage: Название стадии
+        :type stage: str
+        """
+        return self._timer(stage)
+
+    def frame_done(self) -> None:
+        """
+        Отмечает конец обработки кадра: обновляет частоту кадров и,
+        если пора, дописывает снимок в jsonl_path
+        """
+        now = time.perf_counter()
+        with self._lock:
+            self.frames += 1
+            self._window_frames += 1
+            elapsed = now - self._window_start
+            if elapsed >= 1.0:
+                self.fps = self._window_frames / elapsed
+                self._window_start = now
+                self._window_frames = 0
+        if self.jsonl_path is not None and time.monotonic() - self._last_flush >= self.flush_interval:
+            self.flush()
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {"time": time.time(),
+                    "frames": self.frames,
+                    "fps": self.fps,
+                    "counters": dict(self.counters),
+                    "stages": {name: {"count": h.count, "sum": h.sum,
+                                      "buckets": dict(zip(map(str, h.buckets), h.cumulative()))}
+                               for name, h in self.stages.items()}}
+
+    def flush(self) -> None:
+        """
+        Дописывает текущий снимок строкой в jsonl_path
+        """
+        self._last_flush = time.monotonic()
+        if self.jsonl_path is None:
+            return
+        with open(self.jsonl_path, "a") as file:
+            file.write(json.dumps(self.snapshot()) + "\n")
+
+    def prometheus(self) -> str:
+        """
+        Текущие метрики в текстовом формате Prometheus
+        """
+        lines = ["# TYPE traffic_vision_stage_seconds histogram"]
+        with self._lock:
+            for name, h in self.stages.items():
+                for bound, count in zip(h.buckets, h.cumulative()):
+                    le = "+Inf" if bound == float("inf") else repr(bound)
+                    lines.append(f'traffic_vision_stage_seconds_bucket{{stage="{name}",le="{le}"}} {count}')
+                lines.append(f'traffic_vision_stage_seconds_sum{{stage="{name}"}} {h.sum}')
+                lines.append(f'traffic_vision_stage_seconds_count{{stage="{name}"}} {h.count}')
+            lines.append("# TYPE traffic_vision_fps gauge")
+            lines.append(f"traffic_vision_fps {self.fps}")
+            lines.append("# TYPE traffic_vision_frames_total counter")
+            lines.append(f"traffic_vision_frames_total {self.frames}")
+            if self.counters:
+                lines.append("# TYPE traffic_vision_events_total counter")
+            for name, value in self.counters.items():
+                lines.append(f'traffic_vision_events_total{{name="{name}"}} {value}')
+        return "\n".join(lines) + "\n"
+
+    def serve_prometheus(self, port: int = 9108, host: str = "127.0.0.1") -> ThreadingHTTPServer:
+        """
+        Запускает в фоновом потоке HTTP-сервер, который отдаёт метрики по /metrics
+
+        :param port: Порт
+        :type port: int
+        :param host: Адрес, по умолчанию только локальный
+        :type host: str
+        :return: Сервер, у которого можно вызвать shutdown
+        :rtype: ThreadingHTTPServer
+        """
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path != "/metrics":
+                    self.send_error(404)
+                    return
+                body = metrics.prometheus().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self._server
+
+    def close(self) -> None:
+        if self._server is not None:
+            self._server.shutdown()
+            self._server = None
+        if self.jsonl_path is not None:
+            self.flush()
+
+
+class NullMetrics(Metrics):
+    """
+    Выключенные метрики: все методы ничего не делают
+    """
+    enabled = False
+
+    def __init__(self) -> None:
+        super().__init__()
+        self._null = nullcontext()
+
+    def observe(self, stage: str, seconds: float) -> None:
+        pass
+
+    def count(self, name: str, value: int = 1) -> None:
+        pass
+
+    def timer(self, stage: str) -> ContextManager:
+        return self._null
+
+    def frame_done(self) -> None:
+        pass
+
+    def flush(self) -> None:
+        pass
+
+
+NULL_METRICS = NullMetrics()
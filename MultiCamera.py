@@ -0,0 +1,105 @@
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+
+from Backends import BackendConfig, resolve
+
+
+@dataclass(frozen=True, slots=True)
+class Source:
+    """
+    Один входной поток: видео (или адрес камеры) и файл с углами его дверей
+    """
+    name: str
+    video_path: str
+    doors_path: str
+    save_path: str | None = None
+
+
+@dataclass(slots=True)
+class SourceCounts:
+    name: str
+    in_out: list[int]
+    door_in_out: dict[str, list[int]]
+
+
+def _process_source(source: Source, weights: str, threads: int) -> SourceCounts:
+    """
+    Обрабатывает один поток в отдельном процессе со своей моделью и своим Tracking
+
+    :param source: Входной поток
+    :type source: Source
+    :param weights: Путь к модели, см. Backends.resolve
+    :type weights: str
+    :param threads: Количество потоков torch на процесс
+    :type threads: int
+    :return: Итоговые счётчики потока
+    :rtype: SourceCounts
+    """
+    import torch
+
+    from Backends import load_model
+    from Doors import DoorList
+    from Tracking import Tracking
+
+    torch.set_num_threads(threads)
+    model = load_model(weights)
+    tracking = Tracking(doors=DoorList.from_file(source.doors_path))
+    tracking.process_video_with_tracking(model, source.video_path,
+                                         show_video=False, save_path=source.save_path)
+    return SourceCounts(source.name, tracking.in_out, tracking.door_in_out)
+
+
+def aggregate_counts(counts: list[SourceCounts]) -> dict[str, dict[str, list[int]]]:
+    """
+    Сводит счётчики всех потоков в одно представление
+
+    :param counts: Счётчики отдельных потоков
+    :type counts: list[SourceCounts]
+    :return: Словарь {поток: {дверь: [зашло, вышло], "all": итог потока}}; поток "total" содержит
+        двери всех потоков с ключами "поток/дверь" и сумму по потокам "all"
+    :rtype: dict[str, dict[str, list[int]]]
+    """
+    view = dict()
+    total = {"all": [0, 0]}
+    for source_counts in counts:
+        doors = {door: list(in_out) for door, in_out in source_counts.door_in_out.items()}
+        for door, in_out in doors.items():
+            total[f"{source_counts.name}/{door}"] = list(in_out)
+        doors["all"] = list(source_counts.in_out)
+        view[source_counts.name] = doors
+        total["all"][0] += source_counts.in_out[0]
+        total["all"][1] += source_counts.in_out[1]
+    view["total"] = total
+    return view
+
+
+def process_sources(sources: list[Source], weights: str | BackendConfig,
+                    processes: int | None = None) -> dict[str, dict[str, list[int]]]:
+    """
+    Обрабатывает несколько потоков параллельно, по процессу на поток
+
+    Процессы запускаются через spawn, чтобы не наследовать состояние torch родителя,
+    а ядра процессора делятся между ними поровну. Модель экспортируется один раз до запуска процессов.
+
+    :param sources: Входные потоки
+    :type sources: list[Source]
+    :param weights: Путь к весам модели или бэкенд
+    :type weights: str | BackendConfig
+    :param processes: Максимальное число процессов, по умолчанию min(len(sources), os.cpu_count())
+    :type processes: int | None
+    :return: Сводные счётчики, см. aggregate_counts
+    :rtype: dict[str, dict[str, list[int]]]
+    """
+    if not sources:
+        raise ValueError("Не задано ни одного потока")
+    weights = resolve(weights)
+    cpu_count = os.cpu_count() or 1
+    processes = processes or min(len(sources), cpu_count)
+    threads = max(1, cpu_count // processes)
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=processes, mp_context=context) as executor:
+        futures = [executor.submit(_process_source, source, weights, threads) for source in sources]
+        counts = [future.result() for future in futures]
+    return aggregate_counts(counts)
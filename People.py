@@ -1,9 +1,14 @@
+from __future__ import annotations
+
 from dataclasses import dataclass
+from typing import TYPE_CHECKING, Generator
 
-from ultralytics.engine.results import Results
+import numpy as np
+from Doors import Door, DoorList, default_doors
+from misc import Location, boxes_center
 
-from Doors import Doors, Door
-from misc import Distances, Location, boxes_center, dist
+if TYPE_CHECKING:
+    from ultralytics.engine.results import Results
 
 
 @dataclass(frozen=True, slots=True)
@@ -27,27 +32,23 @@ class People:
         print("X:", self.position[0])
         print("Y:", self.position[1])
     
-    def nearest_door(self) -> Door:
-        return min(Doors, key=lambda d: dist(*d.center, *self.position))
+    def nearest_door(self, doors: DoorList | None = None) -> Door:
+        doors = default_doors() if doors is None else doors
+        _, nearest = doors.locate(self.position)
+        return doors.doors[nearest[0]]
 
-    def check_how_close_to_door(self) -> Location:
+    def check_how_close_to_door(self, doors: DoorList | None = None) -> Location:
         """
         Смотрим насколько близко находится к двери
+        :param doors: Двери камеры, по умолчанию default_doors()
+        :type doors: DoorList | None
         :return: Возвращаем код, который означает как далеко человек находится от двери 
             0 - далеко; 1 - около дверной рамы; 2 - в пределах дверной рамы.
         :rtype: int
         """
-        door_centers = Doors.centers
-        # print(door_centers)
-        for door_center in door_centers:
-            distance_to_door = dist(*self.position, *door_center)
-            # print(distance_to_door, door_center, (self.center_x, self.center_y))
-            if distance_to_door < Distances.Close:
-                # self.print_person()
-                return Location.Close
-            elif distance_to_door < Distances.Around:
-                return Location.Around
-        return Location.Far
+        doors = default_doors() if doors is None else doors
+        codes, _ = doors.locate(self.position)
+        return Location(int(codes[0]))
 
 
 @dataclass
@@ -68,6 +69,84 @@ class State:
         self.newborn = False
 
 
+@dataclass(frozen=True, slots=True)
+class FrameDetections:
+    """
+    Все обнаружения одного кадра в виде непрерывных массивов (структура массивов).
+
+    Объекты People создаются только по запросу: через индексацию или итерацию.
+    """
+    ids: np.ndarray
+    classes: np.ndarray
+    confidences: np.ndarray
+    centers: np.ndarray
+
+    @classmethod
+    def empty(cls) -> "FrameDetections":
+        return cls(np.empty(0, dtype=int), np.empty(0, dtype=int),
+                   np.empty(0, dtype=np.float32), np.empty((0, 2), dtype=int))
+
+    @classmethod
+    def from_arrays(cls, ids: np.ndarray, classes: np.ndarray,
+                    confidences: np.ndarray, xyxy: np.ndarray) -> "FrameDetections":
+        """
+        Собирает обнаружения кадра из сырых массивов трекера
+
+        :param ids: Идентификаторы треков размера (n,)
+        :type ids: np.ndarray
+        :param classes: Классы модели размера (n,)
+        :type classes: np.ndarray
+        :param confidences: Уверенность модели размера (n,)
+        :type confidences: np.ndarray
+        :param xyxy: Рамки размера (n, 4) формата xyxy
+        :type xyxy: np.ndarray
+        :return: Обнаружения кадра
+        :rtype: FrameDetections
+        """
+        centers = boxes_center(np.asarray(xyxy, dtype=float)).astype(int)
+        return cls(np.ascontiguousarray(ids, dtype=int).ravel(),
+                   np.ascontiguousarray(classes, dtype=int).ravel(),
+                   np.ascontiguousarray(confidences, dtype=np.float32).ravel(),
+                   np.ascontiguousarray(centers))
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def __getitem__(self, index: int) -> People:
+        return People(int(self.ids[index]), int(self.classes[index]),
+                      float(self.confidences[index]), tuple(self.centers[index].tolist()))
+
+    def __iter__(self) -> Generator[People, None, None]:
+        for index in range(len(self)):
+            yield self[index]
+
+    def locate(self, doors: DoorList | None = None) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Положение всех людей кадра относительно дверей, см. DoorList.locate
+
+        :param doors: Двери камеры, по умолчанию default_doors()
+        :type doors: DoorList | None
+        :return: Коды Location и индексы ближайших дверей
+        :rtype: tuple[np.ndarray, np.ndarray]
+        """
+        return (default_doors() if doors is None else doors).locate(self.centers)
+
+
+def parse_detections(results: Results) -> FrameDetections:
+    """
+    Создаёт FrameDetections на основе result без создания объектов People
+
+    :param results: Результат обнаружения объектов
+    :type results: Results
+    :return: Обнаружения кадра
+    :rtype: FrameDetections
+    """
+    if results.boxes.id is None:
+        return FrameDetections.empty()
+    boxes = results.boxes.numpy()
+    return FrameDetections.from_arrays(boxes.id, boxes.cls, boxes.conf, boxes.xyxy)
+
+
 def parse_results(results: Results) -> list[People]:
     """
     Создаёт список объектов People на основе result
@@ -77,11 +156,4 @@ def parse_results(results: Results) -> list[People]:
     :return: Список объектов People
     :rtype: list[People]
     """
-    if results.boxes.id is None:
-        return list()
-    boxes = results.boxes.numpy()
-    centers = boxes_center(boxes.xyxy)
-    people = list()
-    for box, center in zip(boxes, centers.astype(int)):
-        people.append(People(int(*box.id), int(*box.cls), *box.conf, tuple(center)))
-    return people
+    return list(parse_detections(results))
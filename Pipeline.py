@@ -0,0 +1,137 @@
+import queue
+import threading
+from typing import Any, Callable
+
+_STOP = object()
+
+
+class Stage(threading.Thread):
+    """
+    Стадия конвейера: отдельный поток с ограниченной очередью на входе.
+
+    Если очередь заполнена, submit либо ждёт (обратное давление на предыдущую стадию),
+    либо, при drop_when_full, отбрасывает элемент и увеличивает счётчик dropped.
+    """
+
+    def __init__(self, name: str, handler: Callable[[Any], None], maxsize: int = 8,
+                 drop_when_full: bool = False, stop_event: threading.Event | None = None) -> None:
+        """
+        :param name: Имя стадии
+        :type name: str
+        :param handler: Функция, которая обрабатывает один элемент
+        :type handler: Callable[[Any], None]
+        :param maxsize: Размер входной очереди
+        :type maxsize: int
+        :param drop_when_full: Отбрасывать элементы вместо ожидания, если стадия не успевает
+        :type drop_when_full: bool
+        :param stop_event: Общее событие остановки конвейера, выставляется при ошибке стадии
+        :type stop_event: threading.Event | None
+        """
+        super().__init__(name=name, daemon=True)
+        self.handler = handler
+        self.drop_when_full = drop_when_full
+        self.stop_event = stop_event if stop_event is not None else threading.Event()
+        self.queue: queue.Queue = queue.Queue(maxsize)
+        self.dropped = 0
+        self.from_source = True
+        self.error: BaseException | None = None
+
+    def submit(self, item: Any) -> bool:
+        """
+        Передаёт элемент стадии
+
+        :param item: Элемент для обработки
+        :return: True, если элемент принят, False, если отброшен или стадия остановилась
+        :rtype: bool
+        """
+        if self.drop_when_full:
+            try:
+                self.queue.put_nowait(item)
+                return True
+            except queue.Full:
+                self.dropped += 1
+                return False
+        return self._put(item)
+
+    def _put(self, item: Any) -> bool:
+        while self.is_alive():
+            try:
+                self.queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def run(self) -> None:
+        while True:
+            item = self.queue.get()
+            if item is _STOP:
+                return
+            try:
+                self.handler(item)
+            except BaseException as e:
+                self.error = e
+                self.stop_event.set()
+                return
+
+    def close(self) -> None:
+        """
+        Дожидается обработки всех принятых элементов и останавливает поток.
+        Пробрасывает исключение, если оно возникло в стадии.
+        """
+        self._put(_STOP)
+        self.join()
+        if self.error is not None:
+            raise self.error
+
+
+class Pipeline:
+    """
+    Набор стадий, которые получают каждый элемент от источника и работают параллельно ему.
+
+    Стадия с from_source=False не получает элементы источника: их передаёт ей другая
+    стадия через Stage.submit. Стадии останавливаются в порядке добавления, поэтому
+    такую стадию нужно добавлять после той, что её питает.
+    """
+
+    def __init__(self) -> None:
+        self.stop_event = threading.Event()
+        self.stages: list[Stage] = list()
+
+    def add_stage(self, name: str, handler: Callable[[Any], None], maxsize: int = 8,
+                  drop_when_full: bool = False, from_source: bool = True) -> Stage:
+        stage = Stage(name, handler, maxsize, drop_when_full, self.stop_event)
+        stage.from_source = from_source
+        self.stages.append(stage)
+        return stage
+
+    def stop(self) -> None:
+        self.stop_event.set()
+
+    @property
+    def stopped(self) -> bool:
+        return self.stop_event.is_set()
+
+    def __enter__(self) -> "Pipeline":
+        for stage in self.stages:
+            stage.start()
+        return self
+
+    def submit(self, item: Any) -> None:
+        for stage in self.stages:
+            if stage.from_source:
+                stage.submit(item)
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        errors = list()
+        for stage in self.stages:
+            try:
+                stage.close()
+            except BaseException as e:
+                errors.append(e)
+        if errors and exc_type is None:
+            raise errors[0]
+
+    @property
+    def dropped(self) -> dict[str, int]:
+        return {stage.name: stage.dropped for stage in self.stages}
@@ -0,0 +1,155 @@
+import os
+
+import cv2
+import numpy as np
+
+from Metrics import NULL_METRICS, Metrics
+from Pipeline import Stage
+
+DEFAULT_FPS = 25
+
+
+def source_fps(video_path: str | int, vid_stride: int = 1, default: float = DEFAULT_FPS) -> float:
+    """
+    Частота кадров, с которой обработанные кадры идут из источника
+
+    :param video_path: Путь к видео, адрес потока или номер камеры
+    :type video_path: str | int
+    :param vid_stride: Шаг по кадрам, как vid_stride у ultralytics
+    :type vid_stride: int
+    :param default: Частота источника, если он её не сообщает
+    :type default: float
+    :return: Частота источника, делённая на vid_stride
+    :rtype: float
+    """
+    capture = cv2.VideoCapture(video_path)
+    try:
+        fps = capture.get(cv2.CAP_PROP_FPS)
+    finally:
+        capture.release()
+    if not fps or not np.isfinite(fps) or fps > 1000:
+        fps = default
+    return fps / vid_stride
+
+
+class SegmentedRecorder:
+    """
+    Запись размеченных кадров в фоновом потоке.
+
+    write только кладёт кадр в очередь; уменьшение и кодирование идут в отдельном потоке.
+    Если кодирование не успевает, новые кадры отбрасываются и учитываются в dropped,
+    чтобы запись не тормозила подсчёт. При segment_seconds запись делится на файлы
+    path_0000.mp4, path_0001.mp4, ...; без него пишется один файл path.
+    """
+
+    def __init__(self, path: str, fps: float = DEFAULT_FPS, segment_seconds: float | None = None,
+                 scale: float = 1.0, fourcc: str = "mp4v", queue_size: int = 16,
+                 drop_when_full: bool = True, metrics: Metrics = NULL_METRICS) -> None:
+        """
+        :param path: Путь к файлу записи
+        :type path: str
+        :param fps: Частота кадров записи
+        :type fps: float
+        :param segment_seconds: Длина одного файла в секундах, None - один файл
+        :type segment_seconds: float | None
+        :param scale: Масштаб кадра в записи
+        :type scale: float
+        :param fourcc: Кодек cv2.VideoWriter
+        :type fourcc: str
+        :param queue_size: Сколько кадров может ждать кодирования
+        :type queue_size: int
+        :param drop_when_full: Отбрасывать кадры вместо ожидания, если кодирование не успевает
+        :type drop_when_full: bool
+        :param metrics: Куда писать время кодирования кадра (стадия write)
+        :type metrics: Metrics
+        """
+        self.path = path
+        self.fps = fps
+        self.scale = scale
+        self.metrics = metrics
+        self.fourcc = cv2.VideoWriter_fourcc(*fourcc)
+        self.segment_frames = max(1, round(fps * segment_seconds)) if segment_seconds else None
+        self.segments: list[str] = list()
+        self.written = 0
+        self._writer: cv2.VideoWriter | None = None
+        self._segment_written = 0
+        self._stage = Stage("recorder", self._encode, queue_size, drop_when_full)
+        self._stage.start()
+
+    @classmethod
+    def for_source(cls, path: str, video_path: str | int, vid_stride: int = 1, **kwargs) -> "SegmentedRecorder":
+        """
+        Запись с частотой, взятой из источника с учётом vid_stride
+        """
+        return cls(path, source_fps(video_path, vid_stride), **kwargs)
+
+    @property
+    def dropped(self) -> int:
+        return self._stage.dropped
+
+    def write(self, frame: np.ndarray) -> bool:
+        """
+        Передаёт кадр на запись
+
+        :param frame: Кадр BGR
+        :type frame: np.ndarray
+        :return: True, если кадр принят, False, если отброшен
+        :rtype: bool
+        """
+        if self._stage.error is not None:
+            raise self._stage.error
+        return self._stage.submit(frame)
+
+    def _segment_path(self) -> str:
+        if self.segment_frames is None:
+            return self.path
+        root, ext = os.path.splitext(self.path)
+        return f"{root}_{len(self.segments):04d}{ext or '.mp4'}"
+
+    def _open(self, shape: tuple[int, ...]) -> None:
+        path = self._segment_path()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        h, w = shape[:2]
+        self._writer = cv2.VideoWriter(path, self.fourcc, self.fps, (w, h))
+        if not self._writer.isOpened():
+            raise OSError(f"Не удалось открыть запись {path}")
+        self.segments.append(path)
+        self._segment_written = 0
+
+    def _encode(self, frame: np.ndarray) -> None:
+        with self.metrics.timer("write"):
+            self._write_frame(frame)
+
+    def _write_frame(self, frame: np.ndarray) -> None:
+        if self.scale != 1.0:
+            frame = cv2.resize(frame, (0, 0), fx=self.scale, fy=self.scale, interpolation=cv2.INTER_AREA)
+        if self._writer is not None and self.segment_frames is not None \
+                and self._segment_written >= self.segment_frames:
+            self._release()
+        if self._writer is None:
+            self._open(frame.shape)
+        self._writer.write(frame)
+        self._segment_written += 1
+        self.written += 1
+
+    def _release(self) -> None:
+        if self._writer is not None:
+            self._writer.release()
+            self._writer = None
+
+    def close(self) -> None:
+        """
+        Дописывает кадры из очереди и закрывает текущий файл
+        """
+        try:
+            self._stage.close()
+        finally:
+            self._release()
+
+    def __enter__(self) -> "SegmentedRecorder":
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        self.close()
@@ -0,0 +1,106 @@
+import cv2
+import numpy as np
+
+from Doors import DoorList
+
+
+class MotionGate:
+    """
+    Решает, нужно ли запускать детектор на кадре.
+
+    Дешёвая проверка: разница яркости с предыдущим проверенным кадром внутри зон
+    Around дверей на уменьшенном изображении. Детектор запускается, если в зонах есть
+    движение, если рядом с дверью есть треки или если пропущено max_skip кадров подряд.
+    """
+
+    def __init__(self, doors: DoorList, frame_shape: tuple[int, int], max_skip: int = 10,
+                 pixel_threshold: int = 25, changed_fraction: float = 0.01, downscale: int = 4) -> None:
+        """
+        :param doors: Двери камеры
+        :type doors: DoorList
+        :param frame_shape: Размер кадра (h, w)
+        :type frame_shape: tuple[int, int]
+        :param max_skip: Максимальное число пропущенных подряд кадров
+        :type max_skip: int
+        :param pixel_threshold: Изменение яркости, при котором пиксель считается изменившимся
+        :type pixel_threshold: int
+        :param changed_fraction: Доля изменившихся пикселей зоны, при которой есть движение
+        :type changed_fraction: float
+        :param downscale: Во сколько раз уменьшать кадр перед сравнением
+        :type downscale: int
+        """
+        self.doors = doors
+        self.frame_shape = frame_shape
+        self.max_skip = max_skip
+        self.pixel_threshold = pixel_threshold
+        self.changed_fraction = changed_fraction
+        self.downscale = downscale
+        self.skipped = 0
+        self.inferred = 0
+        self._since_inference = 0
+        self._build_mask()
+
+    def _build_mask(self) -> None:
+        """
+        Строит маску зон дверей; вызывается заново, когда двери изменились (DoorList.version)
+        """
+        self._version = self.doors.version
+        self._previous: np.ndarray | None = None
+        h, w = self.frame_shape
+        downscale = self.downscale
+        mask = np.zeros((h // downscale, w // downscale), dtype=np.uint8)
+        for x, y in self.doors.centers:
+            cv2.circle(mask, (int(x) // downscale, int(y) // downscale),
+                       radius=self.doors.around // downscale, color=1, thickness=-1)
+        ys, xs = np.nonzero(mask)
+        if len(ys):
+            self._crop = (slice(ys.min(), ys.max() + 1), slice(xs.min(), xs.max() + 1))
+        else:
+            self._crop = (slice(0, 0), slice(0, 0))
+        self._mask = mask[self._crop].astype(bool)
+        self._min_changed = max(1, int(self._mask.sum() * self.changed_fraction))
+
+    def _zone(self, frame: np.ndarray) -> np.ndarray:
+        h, w = frame.shape[:2]
+        small = cv2.resize(frame, (w // self.downscale, h // self.downscale), interpolation=cv2.INTER_AREA)
+        if small.ndim == 3:
+            small = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+        return small[self._crop]
+
+    def has_motion(self, frame: np.ndarray) -> bool:
+        """
+        Проверяет, изменились ли зоны дверей с предыдущего проверенного кадра
+
+        :param frame: Кадр BGR или в оттенках серого
+        :type frame: np.ndarray
+        :return: Есть ли движение
+        :rtype: bool
+        """
+        if self.doors.version != self._version:
+            self._build_mask()
+        zone = self._zone(frame)
+        previous, self._previous = self._previous, zone
+        if previous is None:
+            return True
+        changed = cv2.absdiff(zone, previous) > self.pixel_threshold
+        return np.count_nonzero(changed & self._mask) >= self._min_changed
+
+    def should_infer(self, frame: np.ndarray, near_door: bool) -> bool:
+        """
+        Нужно ли запускать детектор на этом кадре
+
+        :param frame: Кадр
+        :type frame: np.ndarray
+        :param near_door: Есть ли сейчас треки в зонах дверей
+        :type near_door: bool
+        :return: Запускать ли детектор
+        :rtype: bool
+        """
+        motion = self.has_motion(frame)
+        if near_door or motion or self._since_inference >= self.max_skip:
+            self._since_inference = 0
+            self.inferred += 1
+            return True
+        self._since_inference += 1
+        self.skipped += 1
+        return False
@@ -0,0 +1,139 @@
+import numpy as np
+
+
+class DetectionWindow:
+    """
+    Обнаружения последних size кадров в заранее выделенном кольцевом буфере.
+
+    Хранятся только идентификаторы, центры и коды Location, поэтому память и время
+    на кадр не зависят от того, сколько кадров помнит окно в виде Results.
+    Слот кадра - строка массивов; незанятые ячейки имеют идентификатор -1.
+    """
+
+    def __init__(self, size: int = 10, max_detections: int = 64, confirm: int = 3) -> None:
+        """
+        :param size: Число кадров в окне
+        :type size: int
+        :param confirm: Сколько последних наблюдений по умолчанию должны совпасть в confirmed, не больше size
+        :type confirm: int
+        :param max_detections: Начальная ёмкость строки; при переполнении буфер расширяется
+        :type max_detections: int
+        """
+        if size < 1:
+            raise ValueError(f"size должен быть положительным, получено {size}")
+        self._check_confirm(size, confirm)
+        self.size = size
+        self.confirm = confirm
+        self.frames = 0
+        self.ids = np.full((size, max_detections), -1, dtype=np.int64)
+        self.centers = np.zeros((size, max_detections, 2), dtype=np.int32)
+        self.codes = np.zeros((size, max_detections), dtype=np.int8)
+        self.counts = np.zeros(size, dtype=np.intp)
+
+    @staticmethod
+    def _check_confirm(size: int, confirm: int) -> None:
+        # При confirm > size окно никогда не наберёт нужного числа наблюдений
+        if not 1 <= confirm <= size:
+            raise ValueError(f"confirm должен быть от 1 до размера окна {size}, получено {confirm}")
+
+    def snapshot(self) -> dict[str, np.ndarray | int]:
+        """
+        Копия буфера окна для контрольной точки
+        """
+        return {"frames": self.frames, "ids": self.ids.copy(), "centers": self.centers.copy(),
+                "codes": self.codes.copy(), "counts": self.counts.copy()}
+
+    def restore(self, state: dict[str, np.ndarray | int]) -> None:
+        """
+        Заменяет буфер окна сохранённым в snapshot; размер окна должен совпадать
+        """
+        if len(state["counts"]) != self.size:
+            raise ValueError(f"Окно сохранено на {len(state['counts'])} кадров, а задано {self.size}")
+        self.frames = int(state["frames"])
+        self.ids, self.centers = state["ids"].copy(), state["centers"].copy()
+        self.codes, self.counts = state["codes"].copy(), state["counts"].copy()
+
+    def _grow(self, capacity: int) -> None:
+        extra = capacity - self.ids.shape[1]
+        self.ids = np.pad(self.ids, ((0, 0), (0, extra)), constant_values=-1)
+        self.centers = np.pad(self.centers, ((0, 0), (0, extra), (0, 0)))
+        self.codes = np.pad(self.codes, ((0, 0), (0, extra)))
+
+    def push(self, ids: np.ndarray, centers: np.ndarray, codes: np.ndarray) -> None:
+        """
+        Добавляет кадр, вытесняя самый старый
+
+        :param ids: Идентификаторы треков, (n,)
+        :param centers: Центры рамок, (n, 2)
+        :param codes: Коды Location, (n,)
+        """
+        n = len(ids)
+        if n > self.ids.shape[1]:
+            self._grow(max(n, 2 * self.ids.shape[1]))
+        slot = self.frames % self.size
+        stale = self.counts[slot]
+        self.ids[slot, :n] = ids
+        self.ids[slot, n:stale] = -1
+        self.centers[slot, :n] = centers
+        self.codes[slot, :n] = codes
+        self.counts[slot] = n
+        self.frames += 1
+
+    def _order(self) -> np.ndarray:
+        if self.frames < self.size:
+            return np.arange(self.frames)
+        return (np.arange(self.size) + self.frames) % self.size
+
+    def _locate(self, ids: np.ndarray) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        order = self._order()
+        # Хотя бы один столбец: argmax по пустой оси не определён, а -1 ни с каким треком не совпадёт
+        width = max(int(self.counts.max(initial=0)), 1)
+        match = self.ids[order, :width][None, :, :] == np.asarray(ids)[:, None, None]
+        return order, match.any(axis=2), match.argmax(axis=2)
+
+    def history(self, ids: np.ndarray) -> np.ndarray:
+        """
+        Коды Location треков ids по кадрам окна, от старого к новому
+
+        :param ids: Идентификаторы треков, (n,)
+        :type ids: np.ndarray
+        :return: Матрица (n, кадров в окне), -1 - трека не было на кадре
+        :rtype: np.ndarray
+        """
+        order, present, column = self._locate(ids)
+        codes = self.codes[order[None, :], column]
+        return np.where(present, codes, -1)
+
+    def center_history(self, ids: np.ndarray) -> np.ndarray:
+        """
+        Центры треков ids по кадрам окна, от старого к новому
+
+        :return: Массив (n, кадров в окне, 2); на кадрах без трека - (-1, -1)
+        :rtype: np.ndarray
+        """
+        order, present, column = self._locate(ids)
+        centers = self.centers[order[None, :], column]
+        return np.where(present[..., None], centers, -1)
+
+    def confirmed(self, ids: np.ndarray, confirm: int | None = None) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Положение треков, подтверждённое последними confirm наблюдениями.
+
+        Пропуски трека на отдельных кадрах окна не мешают: учитываются его последние
+        confirm появлений. Одиночный кадр с другим кодом положение не меняет.
+
+        :param ids: Идентификаторы треков, (n,)
+        :type ids: np.ndarray
+        :param confirm: Сколько последних наблюдений должны совпасть, None - заданное в конструкторе
+        :type confirm: int | None
+        :return: Коды последнего наблюдения и маска треков, у которых они подтверждены
+        :rtype: tuple[np.ndarray, np.ndarray]
+        """
+        confirm = self.confirm if confirm is None else confirm
+        self._check_confirm(self.size, confirm)
+        history = self.history(ids)
+        observed_last = np.argsort(history >= 0, axis=1, kind="stable")[:, -confirm:]
+        recent = np.take_along_axis(history, observed_last, axis=1)
+        latest = recent[:, -1]
+        agreed = (recent >= 0).all(axis=1) & (recent == latest[:, None]).all(axis=1) & (recent.shape[1] == confirm)
+        return latest, agreed
@@ -1,7 +1,42 @@
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
 import unittest
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import redirect_stdout
+from io import StringIO
+from unittest import mock
 
+import cv2
 import numpy as np
-from misc import boxes_center
+from Backends import BackendConfig, calibration_data, export, resolve
+from Batching import BatchTracker, read_batches
+import benchmark
+from Checkpoint import Checkpoint, load_checkpoint, save_checkpoint
+from Debug_drawer import DebugRenderer
+from DetectionCache import DetectionCache, DetectionRecorder
+from DoorStates import DoorStates
+from Doors import Door, DoorList
+from Events import EventKind, EventSink, SQLiteEventSink
+from Live import LatestFrameCapture, synthetic_frames
+from LongVideo import plan_segments, segment_frames, stitched_detections
+import main
+from Metrics import NULL_METRICS, Metrics
+from misc import Distances, Location, boxes_center, dist
+from MultiCamera import SourceCounts, aggregate_counts, process_sources
+from People import FrameDetections, State
+from Pipeline import Pipeline
+from Recorder import SegmentedRecorder
+from Sampling import MotionGate
+from self_development import auto_label, file_hash, load_manifest, plan, save_manifest, yolo_lines
+import sweep
+from TemporalWindow import DetectionWindow
+from Tracking import Tracking
+from TrackStates import TrackStateStore
 
 class TestBoxesCenter(unittest.TestCase):
     
@@ -18,5 +53,1050 @@ class TestBoxesCenter(unittest.TestCase):
         np.testing.assert_array_equal((boxes_center(corners)), expected)
 
 
+class TestDoorListLocate(unittest.TestCase):
+
+    def setUp(self):
+        self.doors = DoorList([Door("a", np.array([0, 0, 100, 100])),
+                               Door("b", np.array([100, 0, 200, 100])),
+                               Door("c", np.array([700, 0, 800, 100]))])
+
+    @staticmethod
+    def scalar_location(point, centers):
+        for center in centers:
+            distance = dist(*point, *center)
+            if distance < Distances.Close:
+                return Location.Close
+            elif distance < Distances.Around:
+                return Location.Around
+        return Location.Far
+
+    def test_matches_scalar(self):
+        rng = np.random.default_rng(0)
+        points = rng.integers(0, 900, size=(500, 2))
+        codes, nearest = self.doors.locate(points)
+        for point, code, door_index in zip(points, codes, nearest):
+            self.assertIs(Location(int(code)), self.scalar_location(point, self.doors.centers))
+            expected = min(range(3), key=lambda i: dist(*self.doors.centers[i], *point))
+            self.assertEqual(door_index, expected)
+
+    def test_shifted_thresholds(self):
+        shifted = self.doors.shifted(dx=10, around=60)
+        self.assertEqual(shifted.centers[0].tolist(), [60, 50])
+        codes, _ = shifted.locate(np.array([[60, 100], [60, 115]]))
+        self.assertEqual(codes.tolist(), [Location.Close.value, Location.Far.value])
+
+    def test_roi(self):
+        roi = self.doors.roi((1080, 1920), margin=0)
+        np.testing.assert_array_equal(roi, [0, 0, 850, 150])
+
+    def test_empty(self):
+        codes, nearest = self.doors.locate(np.empty((0, 2)))
+        self.assertEqual(codes.shape, (0,))
+        self.assertEqual(nearest.shape, (0,))
+
+
+class TestDoorGrid(unittest.TestCase):
+
+    def test_matches_brute_force(self):
+        rng = np.random.default_rng(1)
+        corners = rng.integers(0, 1800, size=(300, 2)).repeat(2, axis=0).reshape(-1, 4)
+        corners[:, 2:] += 40
+        doors = [Door(f"gate{i}", c) for i, c in enumerate(corners)]
+        points = np.vstack((rng.integers(-200, 2100, size=(2000, 2)), [[-5000, -5000]]))
+        with mock.patch.object(DoorList, "index_threshold", 10 ** 9):
+            brute = DoorList(doors).locate(points)
+        indexed_doors = DoorList(doors)
+        self.assertIsNotNone(indexed_doors._grid)
+        indexed = indexed_doors.locate(points)
+        np.testing.assert_array_equal(indexed[0], brute[0])
+        np.testing.assert_array_equal(indexed[1], brute[1])
+
+    def test_reload_if_changed(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "doors.txt")
+            with open(path, "w") as file:
+                file.write("a 0 0 10 10\n")
+            doors = DoorList.from_file(path)
+            self.assertFalse(doors.reload_if_changed())
+            with open(path, "w") as file:
+                file.write("a 0 0 10 10\nb 100 100 110 110\n")
+            os.utime(path, ns=(0, doors._mtime + 1))
+            self.assertTrue(doors.reload_if_changed())
+            self.assertEqual([door.name for door in doors], ["a", "b"])
+
+    def test_reload_survives_bad_file(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "doors.txt")
+            with open(path, "w") as file:
+                file.write("a 0 0 10 10\n\nb 100 100 110 110\n\n")
+            doors = DoorList.from_file(path)
+            self.assertEqual([door.name for door in doors], ["a", "b"])
+            # Файл, оборванный посреди строки, а затем удалённый редактором перед сохранением
+            with open(path, "w") as file:
+                file.write("a 0 0 10 10\nb 100 10")
+            os.utime(path, ns=(0, doors._mtime + 1))
+            with self.assertLogs("Doors", "WARNING"):
+                self.assertFalse(doors.reload_if_changed())
+            open(path, "w").close()
+            os.utime(path, ns=(0, doors._mtime + 2))
+            with self.assertLogs("Doors", "WARNING"):
+                self.assertFalse(doors.reload_if_changed())
+            os.unlink(path)
+            with self.assertLogs("Doors", "WARNING"):
+                self.assertFalse(doors.reload_if_changed())
+            self.assertEqual([door.name for door in doors], ["a", "b"])
+            with open(path, "w") as file:
+                file.write("c 0 0 10 10\n")
+            self.assertTrue(doors.reload_if_changed())
+            self.assertEqual([door.name for door in doors], ["c"])
+
+
+class TestZoneRaster(unittest.TestCase):
+
+    def test_matches_circles(self):
+        rng = np.random.default_rng(2)
+        corners = rng.integers(0, 600, size=(8, 2)).repeat(2, axis=0).reshape(-1, 4)
+        corners[:, 2:] += rng.integers(1, 80, size=(8, 2))
+        doors = [Door(f"door{i}", c) for i, c in enumerate(corners)]
+        points = np.column_stack((rng.integers(-20, 660, 3000), rng.integers(-20, 500, 3000)))
+        expected = DoorList(doors).locate(points)
+        rasterized = DoorList(doors)
+        rasterized.rasterize((480, 640))
+        actual = rasterized.locate(points)
+        np.testing.assert_array_equal(actual[0], expected[0])
+        np.testing.assert_array_equal(actual[1], expected[1])
+
+    def test_polygon_zone(self):
+        door = Door("a", np.array([100, 100, 120, 120]),
+                    close_zone=np.array([[90, 90], [300, 90], [300, 130], [90, 130]]))
+        doors = DoorList([door])
+        doors.rasterize((240, 320))
+        codes, _ = doors.locate(np.array([[280, 110], [110, 200], [280, 200]]))
+        self.assertEqual(codes.tolist(), [Location.Close.value, Location.Around.value, Location.Far.value])
+
+    def test_polygon_zone_without_raster(self):
+        rng = np.random.default_rng(3)
+        doors = [Door("a", np.array([100, 100, 120, 120]),
+                      close_zone=np.array([[90, 90], [300, 90], [300, 130], [90, 130]])),
+                 Door("b", np.array([200, 150, 220, 170]),
+                      around_zone=np.array([[150, 100], [310, 140], [250, 230], [140, 220]]))]
+        points = np.column_stack((rng.integers(-10, 330, 3000), rng.integers(-10, 250, 3000)))
+        expected = DoorList(doors).locate(points)
+        rasterized = DoorList(doors)
+        rasterized.rasterize((240, 320))
+        actual = rasterized.locate(points)
+        np.testing.assert_array_equal(expected[0], actual[0])
+        self.assertEqual(DoorList(doors).locate(np.array([[280, 110]]))[0].tolist(), [Location.Close.value])
+
+    def test_reload_keeps_zones(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "doors.txt")
+            with open(path, "w") as file:
+                file.write("a 100 100 120 120\n")
+            zones_path = os.path.join(directory, "zones.txt")
+            with open(zones_path, "w") as file:
+                file.write("a close 90 90 300 90 300 130 90 130\n")
+            doors = DoorList.from_file(path)
+            doors.load_zones(zones_path)
+            doors.rasterize((240, 320))
+            doors.reload()
+            self.assertIsNotNone(doors.doors[0].close_zone)
+            codes, _ = doors.locate(np.array([[280, 110]]))
+            self.assertEqual(codes.tolist(), [Location.Close.value])
+
+    def test_renderer_layer_follows_zones(self):
+        with tempfile.TemporaryDirectory() as directory:
+            zones_path = os.path.join(directory, "zones.txt")
+            with open(zones_path, "w") as file:
+                file.write("a close 90 90 300 90 300 130 90 130\n")
+            doors = DoorList([Door("a", np.array([100, 100, 120, 120]))])
+            renderer = DebugRenderer(doors)
+            before = renderer._door_layer((240, 320, 3))[0].copy()
+            doors.load_zones(zones_path)
+            after = renderer._door_layer((240, 320, 3))[0]
+            self.assertFalse(np.array_equal(before, after))
+
+
+class TestDoorReload(unittest.TestCase):
+
+    def test_tracking_follows_changed_door_file(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "doors.txt")
+            with open(path, "w") as file:
+                file.write("a 0 0 20 20\nb 400 0 420 20\n")
+            doors = DoorList.from_file(path, close=50, around=150)
+            tracking = Tracking(doors=doors, reload_doors_every=1)
+            box = np.array([[400., 0., 420., 20.]])
+            tracking.track_detections(FrameDetections.from_arrays(np.array([1]), np.array([0]),
+                                                                  np.array([0.9]), box))
+            self.assertEqual(tracking.door_in_out["b"], [1, 0])
+            with open(path, "w") as file:
+                file.write("b 400 0 420 20\nc 800 0 820 20\n")
+            os.utime(path, ns=(0, doors._mtime + 1))
+            self.assertTrue(tracking.reload_doors())
+            self.assertEqual([door.name for door in doors], ["b", "c"])
+            self.assertEqual(tracking.door_in_out, {"a": [0, 0], "b": [1, 0], "c": [0, 0]})
+
+            os.utime(path, ns=(0, doors._mtime + 1))
+            tracking.track_detections(FrameDetections.from_arrays(np.array([2]), np.array([0]),
+                                                                  np.array([0.9]), np.array([[800., 0., 820., 20.]])))
+            self.assertEqual(tracking.door_in_out["c"], [1, 0])
+
+
+class TestTrackTtl(unittest.TestCase):
+
+    def test_track_survives_empty_frames(self):
+        tracking = Tracking(doors=DoorList([Door("a", np.array([0, 0, 20, 20]))], close=40, around=120))
+
+        def person(x):
+            return FrameDetections.from_arrays(np.array([1]), np.array([0]), np.array([0.9]),
+                                               np.array([[x, 0., x + 20, 20.]]))
+
+        tracking.track_detections(person(70.))
+        for _ in range(100):
+            tracking.track_detections(FrameDetections.empty())
+        self.assertIn(1, tracking.states)
+        tracking.track_detections(person(0.))
+        self.assertEqual(tracking.in_out, [0, 1])
+
+
+class TestTrackStateStore(unittest.TestCase):
+
+    def test_ttl_frames(self):
+        store = TrackStateStore(ttl_frames=2)
+        store.put(1, "a", frame=0)
+        store.put(2, "b", frame=1)
+        store.touch(1, frame=2)
+        self.assertEqual(store.evict(frame=4), 1)
+        self.assertIn(1, store)
+        self.assertNotIn(2, store)
+        self.assertEqual(store.counters["evicted_ttl"], 1)
+
+    def test_ttl_seconds(self):
+        now = [0.0]
+        store = TrackStateStore(ttl_frames=None, ttl_seconds=5, clock=lambda: now[0])
+        store.put(1, "a", frame=0)
+        now[0] = 6.0
+        self.assertEqual(store.evict(frame=1000), 1)
+        self.assertEqual(len(store), 0)
+
+    def test_capacity(self):
+        store = TrackStateStore(ttl_frames=None, capacity=2)
+        for track_id in range(5):
+            store.put(track_id, track_id, frame=track_id)
+        self.assertEqual(list(store), [3, 4])
+        self.assertEqual(store.counters["evicted_capacity"], 3)
+
+    def test_snapshot_restore(self):
+        store = TrackStateStore(ttl_frames=2)
+        store.put(1, "a", frame=0)
+        store.put(2, "b", frame=1)
+        restored = TrackStateStore(ttl_frames=2)
+        restored.restore(store.snapshot())
+        self.assertEqual(list(restored.items()), [(1, "a"), (2, "b")])
+        self.assertEqual(restored.evict(frame=3), 1)
+
+
+class TestPipeline(unittest.TestCase):
+
+    def test_ordered_without_drops(self):
+        seen = list()
+        pipeline = Pipeline()
+        pipeline.add_stage("count", seen.append, maxsize=2)
+        with pipeline:
+            for i in range(100):
+                pipeline.submit(i)
+        self.assertEqual(seen, list(range(100)))
+        self.assertEqual(pipeline.dropped, {"count": 0})
+
+    def test_drop_when_full(self):
+        release = threading.Event()
+        pipeline = Pipeline()
+        pipeline.add_stage("display", lambda item: release.wait(), maxsize=1, drop_when_full=True)
+        with pipeline:
+            for i in range(10):
+                pipeline.submit(i)
+            release.set()
+        self.assertGreater(pipeline.dropped["display"], 0)
+
+    def test_chained_stage_gets_only_forwarded_items(self):
+        shown = list()
+        pipeline = Pipeline()
+        stages = dict()
+        pipeline.add_stage("encode", lambda item: stages["display"].submit(item * 10))
+        stages["display"] = pipeline.add_stage("display", shown.append, from_source=False)
+        with pipeline:
+            for i in range(5):
+                pipeline.submit(i)
+        self.assertEqual(shown, [0, 10, 20, 30, 40])
+
+    def test_error_stops_pipeline(self):
+        def fail(item):
+            raise RuntimeError(item)
+
+        pipeline = Pipeline()
+        pipeline.add_stage("count", fail)
+        with self.assertRaises(RuntimeError):
+            with pipeline:
+                pipeline.submit(1)
+                pipeline.stages[0].join()
+        self.assertTrue(pipeline.stopped)
+
+
+class TestMotionGate(unittest.TestCase):
+
+    def setUp(self):
+        doors = DoorList([Door("a", np.array([180, 180, 220, 220]))])
+        self.gate = MotionGate(doors, (480, 640), max_skip=3)
+        self.frame = np.zeros((480, 640, 3), dtype=np.uint8)
+
+    def test_static_scene_skips(self):
+        decisions = [self.gate.should_infer(self.frame, near_door=False) for _ in range(9)]
+        self.assertEqual(decisions, [True, False, False, False, True, False, False, False, True])
+
+    def test_motion_outside_doors_ignored(self):
+        self.gate.should_infer(self.frame, near_door=False)
+        moved = self.frame.copy()
+        moved[400:, 500:] = 255
+        self.assertFalse(self.gate.should_infer(moved, near_door=False))
+
+    def test_motion_and_tracks_near_door(self):
+        self.gate.should_infer(self.frame, near_door=False)
+        moved = self.frame.copy()
+        moved[170:230, 170:230] = 255
+        self.assertTrue(self.gate.should_infer(moved, near_door=False))
+        self.assertTrue(self.gate.should_infer(moved, near_door=True))
+
+    def test_mask_follows_reloaded_doors(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "doors.txt")
+            with open(path, "w") as file:
+                file.write("a 180 180 220 220\n")
+            doors = DoorList.from_file(path)
+            gate = MotionGate(doors, (480, 640), max_skip=100)
+            gate.should_infer(self.frame, near_door=False)
+            moved = self.frame.copy()
+            moved[400:, 500:] = 255
+            self.assertFalse(gate.should_infer(moved, near_door=False))
+            with open(path, "w") as file:
+                file.write("a 540 400 580 440\n")
+            os.utime(path, ns=(0, doors._mtime + 1))
+            self.assertTrue(doors.reload_if_changed())
+            gate.should_infer(moved, near_door=False)
+            self.assertTrue(gate.should_infer(self.frame, near_door=False))
+
+
+class TestBenchmarkCli(unittest.TestCase):
+
+    def test_defaults_without_arguments(self):
+        args = benchmark.build_parser().parse_args([])
+        config = benchmark.StreamConfig(frames=args.frames, crowd=args.crowd, doors=args.doors,
+                                        churn=args.churn, seed=args.seed)
+        self.assertEqual(config, benchmark.StreamConfig())
+
+    def test_main_runs(self):
+        output = StringIO()
+        with redirect_stdout(output):
+            benchmark.main(["--frames", "3", "--crowd", "2"])
+        self.assertIn("tracking", output.getvalue())
+
+
+def write_numbered_clip(path, count):
+    """
+    Записывает MJPG-клип, в каждом кадре которого яркостью половин записан его номер
+    """
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"MJPG"), 25, (32, 32))
+    for i in range(count):
+        frame = np.zeros((32, 32, 3), dtype=np.uint8)
+        frame[:, :16], frame[:, 16:] = i % 10 * 20, i // 10 * 20
+        writer.write(frame)
+    writer.release()
+    return path
+
+
+def frame_number(frame):
+    return round(frame[:, :16].mean() / 20) + 10 * round(frame[:, 16:].mean() / 20)
+
+
+class TestBatching(unittest.TestCase):
+
+    def test_read_batches_order_and_stride(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = write_numbered_clip(os.path.join(directory, "clip.avi"), 20)
+            batches = [[frame_number(frame) for frame in batch] for batch in read_batches(path, 3, 4, prefetch=1)]
+        self.assertEqual(batches, [[2, 5, 8, 11], [14, 17]])
+
+    def test_empty_frame_skips_tracker(self):
+        tracker = BatchTracker.__new__(BatchTracker)
+        tracker.tracker = mock.Mock()
+        results = mock.Mock()
+        results.boxes.cpu.return_value.numpy.return_value = np.empty((0, 6))
+        self.assertIs(tracker.update(results), results)
+        tracker.tracker.update.assert_not_called()
+
+
+class TestLongVideo(unittest.TestCase):
+
+    def test_segments_read_the_sequential_stride_grid(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = write_numbered_clip(os.path.join(directory, "clip.avi"), 100)
+            capture = cv2.VideoCapture(path)
+            sequential = [frame_number(frame) for frame in Tracking._read_frames(capture, 7)]
+            capture.release()
+            counted = list()
+            for segment in plan_segments(100, 3, 7, 10):
+                capture = cv2.VideoCapture(path)
+                for index, frame in segment_frames(capture, segment, 7):
+                    self.assertEqual(frame_number(frame), index)
+                    if index >= segment.start:
+                        counted.append(index)
+                capture.release()
+            self.assertEqual(counted, sequential)
+
+    def test_unknown_frame_count(self):
+        with self.assertRaises(ValueError):
+            plan_segments(0, 4, 7, 10)
+
+    @staticmethod
+    def people(frame):
+        # Трек 1 идёт к двери через границу частей, трек 2 появляется в двери и уходит
+        boxes = dict()
+        if 20 <= frame <= 80:
+            x = 300 - 5 * (frame - 20)
+            boxes[1] = [x - 10, 0, x + 10, 20]
+        if frame >= 60:
+            x = 10 + 6 * (frame - 60)
+            boxes[2] = [x - 10, 0, x + 10, 20]
+        return boxes
+
+    def record(self, path, frames, id_offset, **meta):
+        with DetectionRecorder(path, **meta) as recorder:
+            for frame in frames:
+                boxes = self.people(frame)
+                recorder.append_arrays(frame, np.array([i + id_offset for i in boxes], dtype=int),
+                                       np.zeros(len(boxes)), np.full(len(boxes), 0.9),
+                                       np.array(list(boxes.values()), dtype=float).reshape(-1, 4))
+
+    def test_stitched_counts_match_single_pass(self):
+        doors = DoorList([Door("a", np.array([0, 0, 20, 20]))], close=50, around=150)
+        with tempfile.TemporaryDirectory() as directory:
+            self.record(os.path.join(directory, "full"), range(100), 0)
+            single = Tracking(doors=doors)
+            for detections in DetectionCache(os.path.join(directory, "full")).detections():
+                single.track_detections(detections)
+
+            caches = list()
+            for segment in plan_segments(100, 2, 1, 10):
+                path = os.path.join(directory, f"segment_{segment.index}")
+                self.record(path, range(segment.warmup, segment.stop), 100 * (segment.index + 1),
+                            warmup=segment.warmup, start=segment.start, stop=segment.stop)
+                caches.append(DetectionCache(path))
+            stitched = Tracking(doors=doors)
+            ids = set()
+            for detections in stitched_detections(caches):
+                ids.update(detections.ids.tolist())
+                stitched.track_detections(detections)
+
+        self.assertEqual(len(ids), 2)
+        self.assertEqual(single.in_out, [1, 1])
+        self.assertEqual(stitched.in_out, single.in_out)
+        self.assertEqual(stitched.door_in_out, single.door_in_out)
+
+
+class TestMetrics(unittest.TestCase):
+
+    def test_histogram_and_prometheus(self):
+        metrics = Metrics()
+        metrics.observe("draw", 0.003)
+        metrics.observe("draw", 0.3)
+        text = metrics.prometheus()
+        self.assertIn('traffic_vision_stage_seconds_bucket{stage="draw",le="0.005"} 1', text)
+        self.assertIn('traffic_vision_stage_seconds_bucket{stage="draw",le="+Inf"} 2', text)
+        self.assertIn('traffic_vision_stage_seconds_count{stage="draw"} 2', text)
+
+    def test_disabled(self):
+        with NULL_METRICS.timer("draw"):
+            pass
+        NULL_METRICS.frame_done()
+        self.assertEqual(NULL_METRICS.snapshot()["stages"], {})
+
+
+class TestSQLiteEventSink(unittest.TestCase):
+
+    def test_batched_write(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "events.db")
+            with SQLiteEventSink(path, flush_interval=60, batch_size=3) as sink:
+                for frame in range(5):
+                    sink.emit(EventKind.Enter, frame, "men", 0, frame)
+                sink.emit(EventKind.PassBy, 1, "kid", 0, 7)
+            self.assertEqual(sink.written, 6)
+            with sqlite3.connect(path) as connection:
+                rows = connection.execute("SELECT kind, track_id, door, frame FROM events").fetchall()
+            connection.close()
+        self.assertEqual(rows[-1], ("pass_by", 1, "kid", 7))
+        self.assertEqual(len(rows), 6)
+
+    def test_resumed_events_are_not_duplicated(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "events.db")
+            with SQLiteEventSink(path) as sink:
+                sink.emit(EventKind.Enter, 1, "men", 0, 3)
+                sink.emit(EventKind.Exit, 2, "men", 0, 4)
+            # Продолжение с точки до кадра 3: те же события кадров 3 и 4 и новое событие
+            with SQLiteEventSink(path) as sink:
+                sink.emit(EventKind.Enter, 1, "men", 0, 3)
+                sink.emit(EventKind.Exit, 2, "men", 0, 4)
+                sink.emit(EventKind.PassBy, 2, "men", 0, 5)
+            with sqlite3.connect(path) as connection:
+                rows = connection.execute("SELECT kind, frame FROM events ORDER BY frame").fetchall()
+            connection.close()
+        self.assertEqual(rows, [("enter", 3), ("exit", 4), ("pass_by", 5)])
+
+    def test_failed_writer_rejects_events(self):
+        class FailingSink(EventSink):
+            def _write(self, batch):
+                raise OSError("disk full")
+
+        with self.assertRaises(TypeError):
+            EventSink()
+        sink = FailingSink(flush_interval=60, batch_size=1)
+        sink.emit(EventKind.Enter, 1, "men", 0, 0)
+        sink._thread.join(5)
+        with self.assertRaises(OSError):
+            sink.emit(EventKind.Enter, 2, "men", 0, 1)
+        with self.assertRaises(OSError):
+            sink.close()
+
+
+class TestLatestFrameCapture(unittest.TestCase):
+
+    def test_large_ring_keeps_everything(self):
+        with LatestFrameCapture(synthetic_frames(20, (48, 64)), ring_size=32) as capture:
+            indices = [frame.index for frame in capture]
+        self.assertEqual(indices, list(range(20)))
+        self.assertEqual(capture.dropped, 0)
+
+    def test_slow_consumer_drops_stale_frames(self):
+        with LatestFrameCapture(synthetic_frames(40, (48, 64)), ring_size=2, fps=400) as capture:
+            indices = list()
+            for frame in capture:
+                indices.append(frame.index)
+                time.sleep(0.02)
+        self.assertGreater(capture.dropped, 0)
+        self.assertEqual(capture.captured, 40)
+        self.assertEqual(len(indices) + capture.dropped, 40)
+        self.assertEqual(indices, sorted(indices))
+
+
+class TestSegmentedRecorder(unittest.TestCase):
+
+    def test_segments_and_scale(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "clip.mp4")
+            with SegmentedRecorder(path, fps=10, segment_seconds=1, scale=0.5, drop_when_full=False) as recorder:
+                for frame in synthetic_frames(25, shape=(240, 320)):
+                    recorder.write(frame)
+            self.assertEqual(recorder.written, 25)
+            self.assertEqual([os.path.basename(p) for p in recorder.segments],
+                             ["clip_0000.mp4", "clip_0001.mp4", "clip_0002.mp4"])
+            capture = cv2.VideoCapture(recorder.segments[0])
+            ok, frame = capture.read()
+            count = 1 + sum(1 for _ in iter(lambda: capture.read()[0], False))
+            capture.release()
+            self.assertTrue(ok)
+            self.assertEqual(frame.shape[:2], (120, 160))
+            self.assertEqual(count, 10)
+
+    def test_encode_time_is_measured(self):
+        metrics = Metrics()
+        with tempfile.TemporaryDirectory() as directory:
+            with SegmentedRecorder(os.path.join(directory, "clip.mp4"), fps=10, drop_when_full=False,
+                                   metrics=metrics) as recorder:
+                for frame in synthetic_frames(5, shape=(120, 160)):
+                    recorder.write(frame)
+        self.assertEqual(metrics.snapshot()["stages"]["write"]["count"], 5)
+
+
+class TestAutoLabel(unittest.TestCase):
+
+    def test_yolo_lines(self):
+        text = yolo_lines(np.array([0., 2.]), np.array([[0, 0, 100, 50], [50, 25, 150, 75]]), (100, 200, 3))
+        self.assertEqual(text, "0 0.250000 0.250000 0.500000 0.500000\n"
+                               "2 0.500000 0.500000 0.500000 0.500000\n")
+        self.assertEqual(yolo_lines(np.empty(0), np.empty((0, 4)), (100, 200)), "")
+
+    def test_plan_only_new_and_changed(self):
+        with tempfile.TemporaryDirectory() as directory, ThreadPoolExecutor(2) as executor:
+            for name, content in (("a.jpg", b"a"), ("b.jpg", b"b"), ("notes.txt", b"x")):
+                with open(os.path.join(directory, name), "wb") as file:
+                    file.write(content)
+            manifest = os.path.join(directory, "manifest.json")
+            entries, changed, removed = plan(directory, load_manifest(manifest, "m"), executor)
+            self.assertEqual(changed, ["a.jpg", "b.jpg"])
+            save_manifest(manifest, "m", dict(entries, gone="0"))
+
+            with open(os.path.join(directory, "b.jpg"), "wb") as file:
+                file.write(b"changed")
+            _, changed, removed = plan(directory, load_manifest(manifest, "m"), executor)
+            self.assertEqual((changed, removed), (["b.jpg"], ["gone"]))
+            self.assertEqual(load_manifest(manifest, "other model"), {})
+
+    def test_plan_hashes_only_touched_files(self):
+        with tempfile.TemporaryDirectory() as directory, ThreadPoolExecutor(2) as executor:
+            for name in ("a.jpg", "b.jpg", "c.jpg"):
+                with open(os.path.join(directory, name), "wb") as file:
+                    file.write(name.encode())
+            entries, _, _ = plan(directory, {}, executor)
+            with mock.patch("self_development.file_hash", side_effect=file_hash) as hashed:
+                self.assertEqual(plan(directory, entries, executor)[1], [])
+                self.assertEqual(hashed.call_count, 0)
+                # Время изменения другое, а содержимое прежнее - файл хэшируется, но не размечается заново
+                os.utime(os.path.join(directory, "a.jpg"), ns=(0, 1))
+                with open(os.path.join(directory, "c.jpg"), "wb") as file:
+                    file.write(b"changed")
+                _, changed, _ = plan(directory, entries, executor)
+            self.assertEqual(changed, ["c.jpg"])
+            self.assertEqual(sorted(call.args[0] for call in hashed.call_args_list),
+                             [os.path.join(directory, "a.jpg"), os.path.join(directory, "c.jpg")])
+
+    def test_stale_dataset_files_are_removed(self):
+        with tempfile.TemporaryDirectory() as directory:
+            source, dataset = os.path.join(directory, "frames"), os.path.join(directory, "train")
+            for folder in (source, os.path.join(dataset, "images"), os.path.join(dataset, "labels")):
+                os.makedirs(folder)
+            weights = os.path.join(directory, "best.pt")
+            for path, content in ((weights, b"w"), (os.path.join(source, "a.jpg"), b"a"),
+                                  (os.path.join(dataset, "images", "a.jpg"), b"a"),
+                                  (os.path.join(dataset, "labels", "a.txt"), b""),
+                                  (os.path.join(dataset, "images", "old.jpg"), b"o"),
+                                  (os.path.join(dataset, "labels", "old.txt"), b"")):
+                with open(path, "wb") as file:
+                    file.write(content)
+            model_key = f"{file_hash(weights)}:0.5"
+            save_manifest(os.path.join(dataset, "manifest.json"), model_key,
+                          {"a.jpg": file_hash(os.path.join(source, "a.jpg"))})
+            with redirect_stdout(StringIO()):
+                counts = auto_label(source, dataset, weights)
+            self.assertEqual(counts, {"labelled": 0, "failed": 0, "skipped": 1, "removed": 1})
+            self.assertEqual(os.listdir(os.path.join(dataset, "images")), ["a.jpg"])
+            self.assertEqual(os.listdir(os.path.join(dataset, "labels")), ["a.txt"])
+
+
+class TestCheckpoint(unittest.TestCase):
+
+    def test_round_trip_replaces_atomically(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "run.ckpt")
+            self.assertIsNone(load_checkpoint(path))
+            save_checkpoint(path, Checkpoint("video.mp4", 70, 10, [1, 0], {"a": [1, 0]}, [(5, "state", 9)]))
+            save_checkpoint(path, Checkpoint("video.mp4", 140, 20, [2, 1], {"a": [2, 1]}, []))
+            checkpoint = load_checkpoint(path)
+            self.assertEqual((checkpoint.position, checkpoint.in_out), (140, [2, 1]))
+            self.assertEqual(os.listdir(directory), ["run.ckpt"])
+
+    def frames(self):
+        rng = np.random.default_rng(7)
+        for _ in range(60):
+            ids = rng.choice(6, size=rng.integers(0, 4), replace=False)
+            x = rng.integers(0, 300, len(ids)).astype(float)
+            yield FrameDetections.from_arrays(ids, np.zeros(len(ids)), np.ones(len(ids)),
+                                              np.column_stack((x, x * 0, x + 20, x * 0 + 20)))
+
+    def test_restore_continues_counting(self):
+        doors = DoorList([Door("a", np.array([0, 0, 20, 20])), Door("b", np.array([200, 0, 220, 20]))],
+                         close=40, around=120)
+        frames = list(self.frames())
+        for window in (None, 4):
+            with self.subTest(window=window):
+                full = Tracking(doors=doors, window=window, confirm=2)
+                for detections in frames:
+                    full.track_detections(detections)
+
+                first = Tracking(doors=doors, window=window, confirm=2)
+                for detections in frames[:25]:
+                    first.track_detections(detections)
+                checkpoint = first.snapshot("video.mp4", 25 * 7)
+                resumed = Tracking(doors=doors, window=window, confirm=2)
+                resumed.restore(checkpoint)
+                self.assertEqual(resumed.frame_number, 25)
+                for detections in frames[25:]:
+                    resumed.track_detections(detections)
+                self.assertEqual(resumed.in_out, full.in_out)
+                self.assertEqual(resumed.door_in_out, full.door_in_out)
+                self.assertEqual(resumed.states.snapshot(), full.states.snapshot())
+
+    def test_restore_keeps_window(self):
+        doors = DoorList([Door("a", np.array([[90, 90, 110, 110]]))], close=50, around=150)
+
+        def person(y):
+            return FrameDetections.from_arrays(np.array([1]), np.array([0]), np.array([0.9]),
+                                               np.array([[95., y - 5, 105., y + 5]]))
+
+        first = Tracking(doors=doors, window=5)
+        for y in (200, 200, 200, 100, 100):
+            first.track_detections(person(y))
+        resumed = Tracking(doors=doors, window=5)
+        resumed.restore(first.snapshot("video.mp4", 5 * 7))
+        resumed.track_detections(person(100))
+        self.assertEqual(resumed.in_out, [0, 1])
+
+    def test_resumed_stream_starts_after_checkpoint(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = write_numbered_clip(os.path.join(directory, "clip.avi"), 30)
+            checkpoint_path = os.path.join(directory, "run.ckpt")
+            save_checkpoint(checkpoint_path, Checkpoint(path, 14, 2, [1, 0], {"a": [1, 0]}, []))
+            tracking = Tracking(doors=DoorList([Door("a", np.array([0, 0, 20, 20]))]))
+            with mock.patch.object(Tracking, "track_frame", side_effect=lambda model, frame: frame):
+                read = [frame_number(frame) for frame in tracking._resumable_stream(object(), path,
+                                                                                     checkpoint_path, 100)]
+            self.assertEqual(read, [20, 27])
+            self.assertEqual((tracking.frame_number, tracking.in_out), (2, [1, 0]))
+            self.assertEqual(load_checkpoint(checkpoint_path).position, 28)
+
+    def test_resume_appends_to_detection_cache(self):
+        with tempfile.TemporaryDirectory() as directory:
+            def append(recorder, frames):
+                for index in frames:
+                    recorder.append_arrays(index, np.array([index]), np.array([0]), np.array([0.9]),
+                                           np.array([[0., 0., 10., 10.]]))
+
+            # Без append кэш был бы перезаписан с нуля, поэтому продолжение отклоняется
+            with DetectionRecorder(directory) as recorder, self.assertRaises(ValueError):
+                Tracking(recorder=recorder, doors=DoorList([])).restore(Checkpoint("video.mp4", 42, 6, [0, 0], {}, []))
+
+            with DetectionRecorder(directory) as recorder:
+                append(recorder, range(10))
+            with DetectionRecorder(directory, append=True) as recorder:
+                Tracking(recorder=recorder, doors=DoorList([])).restore(Checkpoint("video.mp4", 42, 6, [0, 0], {}, []))
+                append(recorder, range(6, 9))
+            cache = DetectionCache(directory)
+            self.assertEqual(cache.frame_indices.tolist(), [0, 1, 2, 3, 4, 5, 6, 7, 8])
+            self.assertEqual([d.ids.tolist() for d in cache.detections()], [[i] for i in range(9)])
+
+
+class TestBackendConfig(unittest.TestCase):
+
+    def test_from_file(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "config.yaml")
+            self.assertEqual(BackendConfig.from_file(path), BackendConfig())
+            with open(path, "w") as file:
+                file.write("backend:\n  name: openvino\n  int8: true\n")
+            config = BackendConfig.from_file(path)
+            self.assertEqual((config.name, config.int8, config.key), ("openvino", True, "openvino:int8:640"))
+
+    def test_int8_only_where_supported(self):
+        with self.assertRaises(ValueError):
+            BackendConfig("onnx", int8=True)
+
+    def test_calibration_data(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = calibration_data("self development dataset", directory)
+            with open(path) as file:
+                text = file.read()
+            self.assertIn(os.path.abspath("self development dataset"), text)
+            self.assertIn("train: train/images", text)
+
+    def test_resolve_reuses_export(self):
+        with tempfile.TemporaryDirectory() as directory:
+            weights = os.path.join(directory, "best.pt")
+            exported = os.path.join(directory, "best.onnx")
+            for path in (weights, exported):
+                with open(path, "wb") as file:
+                    file.write(b"w")
+            self.assertEqual(resolve(weights), weights)
+            self.assertEqual(resolve(BackendConfig(weights=weights)), weights)
+            config = BackendConfig("onnx", weights=weights)
+            with open(os.path.join(directory, "exports.json"), "w") as file:
+                json.dump({config.key: {"path": exported, "weights_mtime": os.path.getmtime(weights)}}, file)
+            self.assertEqual(resolve(config), exported)
+            self.assertEqual(export(config), exported)
+            self.assertEqual(sorted(os.listdir(directory)), ["best.onnx", "best.pt", "exports.json"])
+
+
+class TestDetectionWindow(unittest.TestCase):
+
+    def push(self, window, ids, codes):
+        window.push(np.array(ids), np.zeros((len(ids), 2), dtype=int), np.array(codes))
+
+    def test_history_oldest_first_with_gaps(self):
+        window = DetectionWindow(size=3, max_detections=1)
+        self.push(window, [1], [0])
+        self.push(window, [1, 2], [1, 2])
+        self.push(window, [], [])
+        self.push(window, [2, 1], [0, 2])
+        np.testing.assert_array_equal(window.history(np.array([1, 2, 3])),
+                                      [[1, -1, 2], [2, -1, 0], [-1, -1, -1]])
+
+    def test_confirmed_skips_absent_frames(self):
+        window = DetectionWindow(size=5)
+        for ids, codes in [([1], [1]), ([1], [2]), ([], []), ([1], [2]), ([1], [2])]:
+            self.push(window, ids, codes)
+        self.push(window, [1, 2], [1, 1])
+        latest, agreed = window.confirmed(np.array([1, 2]), confirm=3)
+        np.testing.assert_array_equal(latest, [1, 1])
+        np.testing.assert_array_equal(agreed, [False, False])
+        latest, agreed = window.confirmed(np.array([1]), confirm=1)
+        self.assertTrue(agreed[0])
+
+    def test_confirm_must_fit_window(self):
+        with self.assertRaises(ValueError):
+            DetectionWindow(size=2, confirm=3)
+        with self.assertRaises(ValueError):
+            DetectionWindow(size=2, confirm=0)
+        with self.assertRaises(ValueError):
+            Tracking(doors=DoorList([Door("a", np.array([[0, 0, 10, 10]]))]), window=2, confirm=3)
+
+
+class TestWindowedTracking(unittest.TestCase):
+
+    def count(self, window, ys):
+        doors = DoorList([Door("a", np.array([[90, 90, 110, 110]]))], close=50, around=150)
+        tracking = Tracking(doors=doors, window=window)
+        for y in ys:
+            detections = FrameDetections.empty() if y is None else FrameDetections.from_arrays(
+                np.array([1]), np.array([0]), np.array([0.9]), np.array([[95., y - 5, 105., y + 5]]))
+            tracking.track_detections(detections)
+        return tracking.in_out
+
+    def test_single_noisy_frame_does_not_count(self):
+        noisy = [200] * 5 + [100] + [None] * 5
+        self.assertEqual(self.count(None, noisy), [0, 1])
+        self.assertEqual(self.count(5, noisy), [0, 0])
+
+    def test_confirmed_exit_counts_across_gap(self):
+        self.assertEqual(self.count(5, [200] * 5 + [100, None, 100, 100]), [0, 1])
+
+
+class ReferenceCounter:
+    """
+    Подсчёт по состояниям State в словаре - построчный вариант Tracking до DoorStates
+    """
+
+    def __init__(self, doors, store):
+        self.doors = doors
+        self.id_location = store
+        self.in_out = [0, 0]
+        self.door_in_out = {door.name: [0, 0] for door in doors}
+        self.events = []
+
+    def update(self, ids, classes, codes, nearest, frame):
+        for id_person, model_class, code, door_index in zip(ids.tolist(), classes.tolist(), codes.tolist(),
+                                                            nearest.tolist()):
+            if code < 0:
+                if id_person in self.id_location:
+                    self.id_location.touch(id_person, frame)
+                continue
+            now = Location(code)
+            name = self.doors.doors[door_index].name
+            door_in_out = self.door_in_out.setdefault(name, [0, 0])
+            if id_person not in self.id_location:
+                newborn = now is Location.Close
+                self.id_location.put(id_person, State(now, newborn), frame)
+                if newborn:
+                    self.in_out[0] += 1
+                    door_in_out[0] += 1
+                    self.events.append((EventKind.Enter, id_person, name, model_class, frame))
+                continue
+            state = self.id_location[id_person]
+            self.id_location.touch(id_person, frame)
+            before = state.location
+            if now is Location.Close and before is Location.Around:
+                self.in_out[1] += 1
+                door_in_out[1] += 1
+                self.events.append((EventKind.Exit, id_person, name, model_class, frame))
+            if not state.newborn and now is Location.Around and before is Location.Close:
+                self.in_out[1] -= 1
+                door_in_out[1] -= 1
+                self.events.append((EventKind.PassBy, id_person, name, model_class, frame))
+            state.update(now)
+        self.id_location.evict(frame)
+
+
+class ListSink:
+
+    def __init__(self):
+        self.events = []
+
+    def emit(self, kind, track_id, door, model_class, frame):
+        self.events.append((kind, track_id, door, model_class, frame))
+
+
+class TestDoorStatesEquivalence(unittest.TestCase):
+    doors = DoorList([Door(name, np.array([[x, 0, x + 20, 20]])) for name, x in (("a", 0), ("b", 100), ("c", 200))])
+
+    def random_frames(self, seed, frames=400, pool=40):
+        rng = np.random.default_rng(seed)
+        for frame in range(frames):
+            ids = rng.choice(pool, size=rng.integers(0, 12), replace=False)
+            codes = rng.choice([-1, 0, 1, 2], size=len(ids), p=[0.1, 0.2, 0.4, 0.3])
+            yield frame, ids, rng.integers(0, 3, len(ids)), codes, rng.integers(0, 3, len(ids))
+
+    def test_same_counts_and_events_as_reference(self):
+        for seed, ttl, capacity in [(0, 5, 4096), (1, 2, 8), (2, None, 3), (3, 50, 4096)]:
+            with self.subTest(seed=seed):
+                sink = ListSink()
+                tracking = Tracking(TrackStateStore(ttl_frames=ttl, capacity=capacity), doors=self.doors,
+                                    events=sink)
+                reference = ReferenceCounter(self.doors, TrackStateStore(ttl_frames=ttl, capacity=capacity))
+                for frame, ids, classes, codes, nearest in self.random_frames(seed):
+                    detections = FrameDetections.from_arrays(ids, classes, np.ones(len(ids)), np.zeros((len(ids), 4)))
+                    tracking._update_states(detections, codes, nearest, frame, frame)
+                    tracking.states.evict(frame)
+                    reference.update(ids, classes, codes, nearest, frame)
+                    self.assertEqual(tracking.in_out, reference.in_out)
+                self.assertEqual(tracking.door_in_out, reference.door_in_out)
+                self.assertEqual(sink.events, reference.events)
+                self.assertEqual(tracking.states.snapshot(), reference.id_location.snapshot())
+                self.assertGreater(len(sink.events), 100)
+
+    def test_restore_continues_like_reference(self):
+        frames = list(self.random_frames(4, frames=200))
+        reference = ReferenceCounter(self.doors, TrackStateStore(ttl_frames=10))
+        states = DoorStates(TrackStateStore(ttl_frames=10), capacity=2)
+        for frame, ids, classes, codes, nearest in frames:
+            if frame == 100:
+                restored = DoorStates(TrackStateStore(ttl_frames=10))
+                restored.restore(states.snapshot())
+                states = restored
+            states.update(ids, codes, frame)
+            states.evict(frame)
+            reference.update(ids, classes, codes, nearest, frame)
+        self.assertEqual(states.snapshot(), reference.id_location.snapshot())
+
+
+class TestSweepCacheKey(unittest.TestCase):
+
+    def test_key_depends_on_weights_and_model_args(self):
+        with tempfile.TemporaryDirectory() as directory:
+            weights = os.path.join(directory, "best.pt")
+            with open(weights, "wb") as file:
+                file.write(b"1")
+            key = sweep.cache_key("video.mp4", weights, "tracker_abc.yaml")
+            self.assertEqual(key, sweep.cache_key("video.mp4", weights, "tracker_abc.yaml"))
+            self.assertTrue(key.endswith("_tracker_abc"))
+            with mock.patch.dict(sweep.MODEL_ARGS, conf=0.3):
+                self.assertNotEqual(key, sweep.cache_key("video.mp4", weights, "tracker_abc.yaml"))
+            os.utime(weights, (0, 0))
+            self.assertNotEqual(key, sweep.cache_key("video.mp4", weights, "tracker_abc.yaml"))
+
+
+class TestDetectionCache(unittest.TestCase):
+
+    def test_record_replay_round_trip(self):
+        rng = np.random.default_rng(5)
+        frames = list()
+        for _ in range(30):
+            n = int(rng.integers(0, 5))
+            xyxy = rng.uniform(0, 500, (n, 2)).repeat(2, axis=0).reshape(n, 4) + [0, 0, 20, 40]
+            frames.append(FrameDetections.from_arrays(rng.integers(1, 10, n), rng.integers(0, 3, n),
+                                                      rng.uniform(0.5, 1, n), xyxy))
+        with tempfile.TemporaryDirectory() as directory:
+            with DetectionRecorder(directory, video="clip.mp4") as recorder:
+                for index, detections in enumerate(frames):
+                    xyxy = np.hstack((detections.centers - [10, 20], detections.centers + [10, 20]))
+                    recorder.append_arrays(index * 7 + 6, detections.ids, detections.classes,
+                                           detections.confidences, xyxy)
+            cache = DetectionCache(directory)
+            self.assertEqual(cache.meta["video"], "clip.mp4")
+            self.assertEqual(cache.frame_indices.tolist(), [index * 7 + 6 for index in range(30)])
+            replayed = list(cache.detections())
+        self.assertEqual(len(replayed), len(frames))
+        for expected, actual in zip(frames, replayed):
+            np.testing.assert_array_equal(actual.ids, expected.ids)
+            np.testing.assert_array_equal(actual.classes, expected.classes)
+            np.testing.assert_allclose(actual.confidences, expected.confidences, rtol=1e-6)
+            np.testing.assert_array_equal(actual.centers, expected.centers)
+            self.assertNotIsInstance(actual.ids, np.memmap)
+
+    def test_replayed_centers_match_live(self):
+        rng = np.random.default_rng(6)
+        n = 200_000
+        xyxy = rng.uniform(0, 2000, (n, 4)).astype(np.float32)
+        live = FrameDetections.from_arrays(np.arange(n), np.zeros(n), np.ones(n), xyxy)
+        with tempfile.TemporaryDirectory() as directory:
+            with DetectionRecorder(directory) as recorder:
+                recorder.append_arrays(0, live.ids, live.classes, live.confidences, xyxy)
+            replayed = DetectionCache(directory).frame_detections(0)
+        np.testing.assert_array_equal(replayed.centers, live.centers)
+
+
+class TestMultiCamera(unittest.TestCase):
+
+    def test_aggregate_view(self):
+        view = aggregate_counts([SourceCounts("north", [3, 1], {"a": [2, 1], "b": [1, 0]}),
+                                 SourceCounts("south", [1, 2], {"a": [1, 2]})])
+        self.assertEqual(view["north"], {"a": [2, 1], "b": [1, 0], "all": [3, 1]})
+        self.assertEqual(view["total"], {"all": [4, 3], "north/a": [2, 1], "north/b": [1, 0],
+                                         "south/a": [1, 2]})
+
+    def test_no_sources(self):
+        with self.assertRaises(ValueError):
+            process_sources([], "best.pt")
+
+
+class TestCli(unittest.TestCase):
+
+    def test_replay_from_config(self):
+        with tempfile.TemporaryDirectory() as directory:
+            doors_path = os.path.join(directory, "doors.txt")
+            with open(doors_path, "w") as file:
+                file.write("a 200 0 250 40\n")
+            config_path = os.path.join(directory, "config.yaml")
+            with open(config_path, "w") as file:
+                file.write(f"doors: {doors_path}\n")
+            cache_path = os.path.join(directory, "cache")
+            with DetectionRecorder(cache_path) as recorder:
+                for i in range(60):
+                    recorder.append_arrays(i, np.array([1]), np.array([0]), np.array([0.9]),
+                                           np.array([[200., i, 250., 40. + i]]))
+            output = StringIO()
+            with redirect_stdout(output):
+                main.main(["--config", config_path, "replay", cache_path])
+            self.assertIn('"in_out": [1, 0]', output.getvalue())
+
+    def test_replay_uses_run_options(self):
+        with tempfile.TemporaryDirectory() as directory:
+            doors_path = os.path.join(directory, "doors.txt")
+            with open(doors_path, "w") as file:
+                file.write("a 90 90 110 110\n")
+            cache_path = os.path.join(directory, "cache")
+            with DetectionRecorder(cache_path) as recorder:
+                # Один кадр в двери после кадров рядом с ней - шум, который окно не подтверждает
+                for i, y in enumerate([180] * 5 + [100]):
+                    recorder.append_arrays(i, np.array([1]), np.array([0]), np.array([0.9]),
+                                           np.array([[95., y - 5, 105., y + 5]]))
+                for i in range(6, 11):
+                    recorder.append_arrays(i, np.empty(0), np.empty(0), np.empty(0), np.empty((0, 4)))
+            counts = dict()
+            for window in ("null", 5):
+                config_path = os.path.join(directory, "config.yaml")
+                with open(config_path, "w") as file:
+                    file.write(f"doors: {doors_path}\nrun:\n  window: {window}\n  confirm: 3\n")
+                output = StringIO()
+                with redirect_stdout(output):
+                    main.main(["--config", config_path, "replay", cache_path])
+                counts[window] = json.loads(output.getvalue())["in_out"]
+            self.assertEqual(counts, {"null": [0, 1], 5: [0, 0]})
+
+
+    def test_metrics_from_config(self):
+        self.assertIs(main._metrics(None), NULL_METRICS)
+        self.assertIs(main._metrics({"jsonl": None, "prometheus_port": None}), NULL_METRICS)
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "metrics.jsonl")
+            metrics = main._metrics({"jsonl": path, "prometheus_port": 0})
+            try:
+                metrics.frame_done()
+                host, port = metrics._server.server_address
+                with urllib.request.urlopen(f"http://{host}:{port}/metrics") as response:
+                    self.assertIn("traffic_vision_frames_total 1", response.read().decode())
+            finally:
+                metrics.close()
+            with open(path) as file:
+                self.assertEqual(json.loads(file.readline())["frames"], 1)
+
+
 if __name__ == "__main__":
-    unittest.main()
\ No newline at end of file
+    unittest.main()
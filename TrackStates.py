@@ -0,0 +1,175 @@
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Callable, Generic, Iterator, TypeVar
+
+import yaml
+
+T = TypeVar("T")
+
+
+@dataclass(slots=True)
+class _Entry(Generic[T]):
+    value: T
+    last_frame: int
+    last_time: float
+
+
+class TrackStateStore(Generic[T]):
+    """
+    Хранилище состояний треков с вытеснением по времени жизни (TTL) и ёмкости.
+
+    Записи упорядочены по моменту последнего появления, поэтому устаревшие
+    треки снимаются с начала очереди за время, пропорциональное числу вытесненных.
+
+    >>> store = TrackStateStore(ttl_frames=2)
+    >>> store.put(1, "a", frame=0)
+    >>> store.evict(frame=3)
+    1
+    >>> 1 in store
+    False
+    """
+
+    def __init__(self, ttl_frames: int | None = 50, ttl_seconds: float | None = None,
+                 capacity: int = 4096, clock: Callable[[], float] = time.monotonic,
+                 on_evict: Callable[[int, T], None] | None = None) -> None:
+        """
+        :param ttl_frames: Сколько обработанных кадров трек может отсутствовать, None - без ограничения
+        :type ttl_frames: int | None
+        :param ttl_seconds: Сколько секунд трек может отсутствовать, None - без ограничения
+        :type ttl_seconds: float | None
+        :param capacity: Жёсткое ограничение на число хранимых треков
+        :type capacity: int
+        :param clock: Источник времени в секундах
+        :type clock: Callable[[], float]
+        :param on_evict: Вызывается с идентификатором и состоянием каждого вытесненного трека
+        :type on_evict: Callable[[int, T], None] | None
+        """
+        if capacity < 1:
+            raise ValueError(f"capacity должен быть положительным, получено {capacity}")
+        self.ttl_frames = ttl_frames
+        self.ttl_seconds = ttl_seconds
+        self.capacity = capacity
+        self.clock = clock
+        self.on_evict = on_evict
+        self.evicted_ttl = 0
+        self.evicted_capacity = 0
+        self._entries: OrderedDict[int, _Entry[T]] = OrderedDict()
+
+    @classmethod
+    def from_tracker_config(cls, path: str, **kwargs) -> "TrackStateStore":
+        """
+        Создаёт хранилище, у которого TTL в кадрах равен track_buffer трекера
+
+        :param path: Путь к конфигурации трекера, например botsort.yaml
+        :type path: str
+        :return: Хранилище состояний
+        :rtype: TrackStateStore
+        """
+        with open(path) as file:
+            config = yaml.safe_load(file)
+        return cls(ttl_frames=int(config["track_buffer"]), **kwargs)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, track_id: int) -> bool:
+        return track_id in self._entries
+
+    def __getitem__(self, track_id: int) -> T:
+        return self._entries[track_id].value
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(self._entries)
+
+    def items(self) -> Iterator[tuple[int, T]]:
+        for track_id, entry in self._entries.items():
+            yield track_id, entry.value
+
+    def get(self, track_id: int, default: T | None = None) -> T | None:
+        entry = self._entries.get(track_id)
+        return default if entry is None else entry.value
+
+    def put(self, track_id: int, value: T, frame: int) -> None:
+        """
+        Сохраняет состояние трека и отмечает его как увиденный
+
+        :param track_id: Идентификатор трека
+        :type track_id: int
+        :param value: Состояние трека
+        :param frame: Номер обработанного кадра
+        :type frame: int
+        """
+        self._entries[track_id] = _Entry(value, frame, self.clock())
+        self._entries.move_to_end(track_id)
+        while len(self._entries) > self.capacity:
+            self._drop_oldest()
+            self.evicted_capacity += 1
+
+    def touch(self, track_id: int, frame: int) -> None:
+        """
+        Отмечает трек как увиденный на кадре frame
+
+        :param track_id: Идентификатор трека
+        :type track_id: int
+        :param frame: Номер обработанного кадра
+        :type frame: int
+        """
+        entry = self._entries[track_id]
+        entry.last_frame = frame
+        entry.last_time = self.clock()
+        self._entries.move_to_end(track_id)
+
+    def evict(self, frame: int) -> int:
+        """
+        Удаляет треки, которые отсутствуют дольше TTL
+
+        :param frame: Номер текущего обработанного кадра
+        :type frame: int
+        :return: Количество удалённых треков
+        :rtype: int
+        """
+        now = self.clock()
+        evicted = 0
+        while self._entries:
+            entry = next(iter(self._entries.values()))
+            stale_frames = self.ttl_frames is not None and frame - entry.last_frame > self.ttl_frames
+            stale_time = self.ttl_seconds is not None and now - entry.last_time > self.ttl_seconds
+            if not (stale_frames or stale_time):
+                break
+            self._drop_oldest()
+            evicted += 1
+        self.evicted_ttl += evicted
+        return evicted
+
+    def _drop_oldest(self) -> None:
+        track_id, entry = self._entries.popitem(last=False)
+        if self.on_evict is not None:
+            self.on_evict(track_id, entry.value)
+
+    def snapshot(self) -> list[tuple[int, T, int]]:
+        """
+        Состояния треков для контрольной точки, в порядке последнего появления
+
+        :return: Список (идентификатор, состояние, последний кадр)
+        :rtype: list[tuple[int, T, int]]
+        """
+        return [(track_id, entry.value, entry.last_frame) for track_id, entry in self._entries.items()]
+
+    def restore(self, entries: list[tuple[int, T, int]]) -> None:
+        """
+        Заменяет содержимое хранилища состояниями из snapshot.
+        Время последнего появления отсчитывается заново от текущего момента.
+        """
+        self._entries.clear()
+        for track_id, value, last_frame in entries:
+            self.put(track_id, value, last_frame)
+
+    @property
+    def counters(self) -> dict[str, int]:
+        """
+        Счётчики для мониторинга: размер и число вытеснений по причинам
+        """
+        return {"size": len(self._entries),
+                "evicted_ttl": self.evicted_ttl,
+                "evicted_capacity": self.evicted_capacity}
@@ -1,68 +1,475 @@
+from __future__ import annotations
+
+import time
 from collections import defaultdict, deque
 from functools import partial
+from typing import TYPE_CHECKING, Generator, Iterable
 
 import cv2
 import numpy as np
-from ultralytics import YOLO
-from ultralytics.engine.results import Results
 
-from Debug_drawer import draw_debug
-from misc import Location
-from People import People, State, parse_results
+from Checkpoint import Checkpoint, load_checkpoint, restore_tracker, save_checkpoint, tracker_state
+from Debug_drawer import DebugRenderer
+from DetectionCache import DetectionRecorder
+from DoorStates import ENTER, EVENT_KINDS, EXIT, PASS_BY, DoorStates
+from Doors import DoorList, default_doors
+from Events import EventKind, EventSink
+from Live import LatestFrameCapture, LiveStats
+from Metrics import NULL_METRICS, Metrics
+from People import FrameDetections, parse_detections
+from Pipeline import Pipeline
+from Recorder import SegmentedRecorder
+from Sampling import MotionGate
+from TemporalWindow import DetectionWindow
+from TrackStates import TrackStateStore
+
+if TYPE_CHECKING:
+    from ultralytics import YOLO
+    from ultralytics.engine.results import Results
+
+MODEL_ARGS = {"iou": 0.4, "conf": 0.5, "persist": True,
+              "imgsz": 640, "verbose": False,
+              "tracker": "botsort.yaml",
+              "vid_stride": 7}
+
+_END = object()
 
 
 class Tracking:
-    def __init__(self) -> None:
+    def __init__(self, id_location: TrackStateStore[int] | None = None,
+                 doors: DoorList | None = None, metrics: Metrics = NULL_METRICS,
+                 recorder: DetectionRecorder | None = None, events: EventSink | None = None,
+                 zone_raster: bool = False, window: int | None = None, confirm: int = 3,
+                 reload_doors_every: int | None = 250) -> None:
+        """
+        :param id_location: Хранилище слотов DoorStates с TTL треков, по умолчанию TTL 50 кадров
+        :type id_location: TrackStateStore[int] | None
+        :param doors: Двери камеры, по умолчанию default_doors()
+        :type doors: DoorList | None
+        :param metrics: Замеры задержек по стадиям, по умолчанию выключены
+        :type metrics: Metrics
+        :param recorder: Если задан, выход трекера каждого кадра записывается в кэш для replay
+        :type recorder: DetectionRecorder | None
+        :param events: Приёмник событий входа, выхода и прохода мимо
+        :type events: EventSink | None
+        :param zone_raster: Строить по первому кадру растр зон дверей (DoorList.rasterize)
+        :type zone_raster: bool
+        :param window: Число кадров в окне DetectionWindow; None - решения по каждому кадру отдельно
+        :type window: int | None
+        :param confirm: Сколько последних наблюдений трека в окне должны совпасть, чтобы сменить его положение
+        :type confirm: int
+        :param reload_doors_every: Через сколько кадров проверять, не изменился ли файл дверей, None - не проверять
+        :type reload_doors_every: int | None
+        """
+        doors = default_doors() if doors is None else doors
+        self.doors = doors
+        self.metrics = metrics
+        self.recorder = recorder
+        self.events = events
+        self.zone_raster = zone_raster
         self.image_width = 1920
         self.image_height = 1080
-        self.id_state = dict()
-        self.id_location: dict[int, State] = dict()
-        self.predict_history = np.empty(10, dtype=Results)
+        self.states = DoorStates(id_location)
+        self.frame_number = 0
+        # Часы TTL треков: трекер не стареет на кадрах без обнаружений, поэтому и счёт идёт только по ним
+        self.tracker_frame = 0
+        self.near_door = False
+        self.window = DetectionWindow(window, confirm=confirm) if window else None
+        self.reload_doors_every = reload_doors_every
         self.in_out = [0, 0]
+        self.door_in_out: dict[str, list[int]] = {door.name: [0, 0] for door in doors}
+        self.renderer = DebugRenderer(doors)
+        self.last_detections = FrameDetections.empty()
 
-    def process_video_with_tracking(self, model: YOLO, video_path: str, show_video=True, save_path=None):
+    def process_video_with_tracking(self, model: YOLO, video_path: str, show_video=True, save_path=None,
+                                    segment_seconds: float | None = None, save_scale: float = 1.0,
+                                    checkpoint_path: str | None = None, checkpoint_every: int = 500):
         """
         TODO: документация
         :param model:
         :param video_path:
         :param show_video:
-        :param save_path:
-        :return:
+        :param save_path: Путь для сохранения размеченного видео, None - не сохранять
+        :param segment_seconds: Длина одного файла записи в секундах, None - один файл
+        :param save_scale: Масштаб кадра в записи
+        :param checkpoint_path: Файл контрольной точки; если он есть, обработка продолжается с него
+        :param checkpoint_every: Через сколько обработанных кадров сохранять контрольную точку
+        :return: Сколько кадров записи отброшено, потому что кодирование не успевало
+        :rtype: int
         """
         save_video = save_path is not None
-        out = None
+        out = self._open_recorder(save_path, video_path, segment_seconds, save_scale) if save_video else None
 
-        model_args = {"iou": 0.4, "conf": 0.5, "persist": True,
-                      "imgsz": 640, "verbose": False,
-                      "tracker": "botsort.yaml",
-                      "vid_stride": 7}
+        if checkpoint_path is None:
+            stream = model.track(video_path, stream=True, **MODEL_ARGS)
+        else:
+            stream = self._resumable_stream(model, video_path, checkpoint_path, checkpoint_every)
+        stream = self._timed(stream, "inference")
+        for results in stream:
+            self.tracking(results)
+            if save_video or show_video:
+                with self.metrics.timer("draw"):
+                    annotated = self.renderer.render(results, self.last_detections)
 
-        for frame_number, results in enumerate(model.track(video_path, stream=True, **model_args)):
             if save_video:
-                if out is None:
-                    fps = 25
-                    shape = results.orig_shape
-                    fourcc = cv2.VideoWriter_fourcc(*'mp4v')
-                    out = cv2.VideoWriter(save_path, fourcc, fps, shape)
-                out.write(results.plot())
+                out.write(annotated)
 
             if show_video:
-                frame = draw_debug(results, draw_lines=False)
-                cv2.imshow("frame", frame)
+                cv2.imshow("frame", self.renderer.display(annotated))
                 if cv2.waitKey(1) & 0xFF == ord("q"):
                     break
 
+            self.metrics.frame_done()
+
+        dropped = self._close_recorder(out) if save_video else 0
+        if show_video:
+            cv2.destroyAllWindows()
+        return dropped
+
+    def snapshot(self, video_path: str, position: int, tracker: bytes | None = None) -> Checkpoint:
+        """
+        Контрольная точка текущего состояния подсчёта
+
+        :param video_path: Обрабатываемое видео
+        :type video_path: str
+        :param position: Сколько кадров источника уже прочитано
+        :type position: int
+        :param tracker: Сериализованный трекер, см. Checkpoint.tracker_state
+        :type tracker: bytes | None
+        :rtype: Checkpoint
+        """
+        return Checkpoint(video_path, position, self.frame_number, list(self.in_out),
+                          {door: list(in_out) for door, in_out in self.door_in_out.items()},
+                          self.states.snapshot(), tracker, self.tracker_frame,
+                          self.window.snapshot() if self.window is not None else None)
+
+    def restore(self, checkpoint: Checkpoint) -> None:
+        """
+        Восстанавливает состояние подсчёта из контрольной точки.
+        Кэш обнаружений recorder, открытый с append=True, обрезается до кадра точки.
+        """
+        if self.recorder is not None:
+            self.recorder.rewind(checkpoint.frame_number)
+        self.frame_number = checkpoint.frame_number
+        self.tracker_frame = checkpoint.tracker_frame
+        self.in_out = list(checkpoint.in_out)
+        self.door_in_out.update({door: list(in_out) for door, in_out in checkpoint.door_in_out.items()})
+        self.states.restore(checkpoint.tracks)
+        if self.window is not None and checkpoint.window is not None:
+            self.window.restore(checkpoint.window)
+
+    def _resumable_stream(self, model: YOLO, video_path: str, checkpoint_path: str,
+                          every: int) -> Generator[Results, None, None]:
+        """
+        Поток результатов трекера, который продолжает обработку с контрольной точки
+        и сохраняет новую раз в every кадров и в конце видео.
+
+        Точка сохраняется после того, как кадр обработан телом цикла вызывающего кода.
+        События кадров после последней точки при продолжении отправляются повторно с теми же
+        номерами кадров; SQLiteEventSink пропускает уже записанные.
+        """
+        stride = MODEL_ARGS["vid_stride"]
+        track_args = {key: value for key, value in MODEL_ARGS.items() if key != "vid_stride"}
+        capture = cv2.VideoCapture(video_path)
+        position = 0
+        checkpoint = load_checkpoint(checkpoint_path)
+        if checkpoint is not None:
+            if checkpoint.video_path != video_path:
+                raise ValueError(f"Контрольная точка {checkpoint_path} относится к {checkpoint.video_path}")
+            self.restore(checkpoint)
+            position = checkpoint.position
+            capture.set(cv2.CAP_PROP_POS_FRAMES, position)
+
+        def save():
+            with self.metrics.timer("checkpoint"):
+                save_checkpoint(checkpoint_path, self.snapshot(video_path, position, tracker_state(model)))
+
+        try:
+            for frame in self._read_frames(capture, stride):
+                if checkpoint is not None and checkpoint.tracker is not None:
+                    restore_tracker(model, checkpoint.tracker, np.zeros_like(frame), **track_args)
+                    checkpoint = None
+                position += stride
+                yield self.track_frame(model, frame)
+                if self.frame_number % every == 0:
+                    save()
+            save()
+        finally:
+            capture.release()
+
+    def process_video_batched(self, model: YOLO, video_path: str, batch_size: int = 8, prefetch: int = 4):
+        """
+        Офлайн-обработка записанного видео: кадры декодируются заранее, детектор
+        работает по пачкам, а трекер и подсчёт получают кадры по порядку, поэтому
+        счётчики совпадают с process_video_with_tracking.
+
+        :param model: Модель YOLO
+        :type model: YOLO
+        :param video_path: Путь к видео
+        :type video_path: str
+        :param batch_size: Размер пачки кадров для детектора
+        :type batch_size: int
+        :param prefetch: Сколько пачек декодировать заранее
+        :type prefetch: int
+        """
+        from Batching import track_batched
+
+        for results in self._timed(track_batched(model, video_path, MODEL_ARGS, batch_size, prefetch), "inference"):
             self.tracking(results)
-            print(f"На данный момент Вышло: {self.in_out[1]} Зашло: {self.in_out[0]}")
-            # TODO: Замах на будущее
-            # self.predict_history[frame_number % 10] = results
-            #
-            # if frame_number % 100 == 0 and frame_number != 0:
-            #     self._tracking()
+            self.metrics.frame_done()
 
-        if save_video:
-            out.release()
-        cv2.destroyAllWindows()
+    def process_live(self, model: YOLO, source: str | int | Iterable[np.ndarray], show_video=False,
+                     ring_size: int = 1, fps: float | None = None, roi_margin: int | None = None) -> LiveStats:
+        """
+        Живой режим: обрабатывается самый свежий кадр, а устаревшие отбрасываются,
+        если инференс не успевает за камерой.
+
+        :param model: Модель YOLO
+        :type model: YOLO
+        :param source: Адрес камеры, файл или генератор кадров, см. LatestFrameCapture
+        :type source: str | int | Iterable[np.ndarray]
+        :param show_video: Показывать отладочное окно
+        :param ring_size: Сколько последних кадров хранить в очереди захвата
+        :type ring_size: int
+        :param fps: Темп выдачи кадров для файла или генератора, None - без ограничения
+        :type fps: float | None
+        :param roi_margin: Если задан, детектор видит только DoorList.roi с этим запасом
+        :type roi_margin: int | None
+        :return: Сколько кадров захвачено, отброшено и обработано и задержка от захвата до подсчёта
+        :rtype: LiveStats
+        """
+        latencies = deque(maxlen=10_000)
+        processed = 0
+        roi = None
+        with LatestFrameCapture(source, ring_size, fps) as capture:
+            for captured in capture:
+                if roi is None and roi_margin is not None:
+                    roi = self.doors.roi(captured.image.shape[:2], roi_margin)
+                with self.metrics.timer("inference"):
+                    results = self.track_frame(model, captured.image, roi)
+                self.tracking(results)
+                latency = time.perf_counter() - captured.captured_at
+                self.metrics.observe("end_to_end", latency)
+                self.metrics.frame_done()
+                latencies.append(latency)
+                processed += 1
+                if show_video:
+                    with self.metrics.timer("draw"):
+                        frame = self.renderer.render(results, self.last_detections)
+                    cv2.imshow("frame", self.renderer.display(frame))
+                    if cv2.waitKey(1) & 0xFF == ord("q"):
+                        break
+        if show_video:
+            cv2.destroyAllWindows()
+        latencies = np.array(latencies) * 1000 if latencies else np.zeros(1)
+        return LiveStats(capture.captured, capture.dropped, processed,
+                         float(latencies.mean()), float(np.percentile(latencies, 95)))
+
+    def process_video_pipelined(self, model: YOLO, video_path: str, show_video=True, save_path=None,
+                                queue_size: int = 8, drop_debug_frames: bool = True,
+                                segment_seconds: float | None = None, save_scale: float = 1.0) -> dict[str, int]:
+        """
+        То же, что process_video_with_tracking, но подсчёт, запись и отображение
+        выполняются в отдельных потоках параллельно с инференсом следующего кадра.
+
+        Подсчёт и отрисовка для записи получают каждый кадр: если они не успевают, инференс ждёт.
+        Кодирование идёт в потоке SegmentedRecorder и пропускает кадры, когда не успевает.
+        Отображение при drop_debug_frames пропускает кадры, когда не успевает.
+        Остановка - по клавише q в окне, по концу потока или по ошибке любой стадии.
+
+        :param model: Модель YOLO
+        :type model: YOLO
+        :param video_path: Путь к видео или адрес потока
+        :type video_path: str
+        :param show_video: Показывать отладочное окно
+        :param save_path: Путь для сохранения размеченного видео, None - не сохранять
+        :param queue_size: Размер очереди каждой стадии
+        :type queue_size: int
+        :param drop_debug_frames: Пропускать отладочные кадры, если отображение не успевает
+        :type drop_debug_frames: bool
+        :param segment_seconds: Длина одного файла записи в секундах, None - один файл
+        :type segment_seconds: float | None
+        :param save_scale: Масштаб кадра в записи
+        :type save_scale: float
+        :return: Количество пропущенных кадров по стадиям и в записи (recorder)
+        :rtype: dict[str, int]
+        """
+        recorder = self._open_recorder(save_path, video_path, segment_seconds, save_scale) \
+            if save_path is not None else None
+        pipeline = Pipeline()
+        pipeline.add_stage("count", self._count_results, queue_size)
+        stages = dict()
+        if save_path is not None:
+            # Кадр рисуется один раз: в файл идёт полный, на экран - он же, уменьшенный
+            pipeline.add_stage("encode", partial(self._write_results, recorder=recorder, stages=stages),
+                               queue_size)
+        if show_video:
+            stages["display"] = pipeline.add_stage("display", partial(self._show_results, pipeline=pipeline),
+                                                   queue_size, drop_when_full=drop_debug_frames,
+                                                   from_source=save_path is None)
+
+        try:
+            with pipeline:
+                for results in self._timed(model.track(video_path, stream=True, **MODEL_ARGS), "inference"):
+                    if pipeline.stopped:
+                        break
+                    pipeline.submit(results)
+        finally:
+            recorder_dropped = self._close_recorder(recorder) if recorder is not None else None
+            if show_video:
+                cv2.destroyAllWindows()
+        dropped = pipeline.dropped
+        if recorder_dropped is not None:
+            dropped["recorder"] = recorder_dropped
+        return dropped
+
+    def process_video_adaptive(self, model: YOLO, video_path: str, show_video=True,
+                               max_skip: int = 10, roi_margin: int | None = None, **gate_args) -> MotionGate:
+        """
+        Обработка видео с адаптивным пропуском кадров.
+
+        Кадры читаются с шагом vid_stride из MODEL_ARGS, но детектор запускается только
+        если MotionGate видит движение в зонах дверей, если рядом с дверями есть треки
+        или если подряд пропущено max_skip кадров.
+
+        :param model: Модель YOLO
+        :type model: YOLO
+        :param video_path: Путь к видео или адрес потока
+        :type video_path: str
+        :param show_video: Показывать отладочное окно
+        :param max_skip: Максимальное число пропущенных подряд кадров
+        :type max_skip: int
+        :param roi_margin: Если задан, детектор видит только DoorList.roi с этим запасом
+        :type roi_margin: int | None
+        :param gate_args: Остальные параметры MotionGate
+        :return: MotionGate со счётчиками пропущенных и обработанных кадров
+        :rtype: MotionGate
+        """
+        capture = cv2.VideoCapture(video_path)
+        shape = (int(capture.get(cv2.CAP_PROP_FRAME_HEIGHT)), int(capture.get(cv2.CAP_PROP_FRAME_WIDTH)))
+        gate = MotionGate(self.doors, shape, max_skip=max_skip, **gate_args)
+        roi = self.doors.roi(shape, roi_margin) if roi_margin is not None else None
+        try:
+            for frame in self._timed(self._read_frames(capture, MODEL_ARGS["vid_stride"]), "decode"):
+                if not gate.should_infer(frame, self.near_door):
+                    continue
+                with self.metrics.timer("inference"):
+                    results = self.track_frame(model, frame, roi)
+                self.tracking(results)
+                self.metrics.frame_done()
+                if show_video:
+                    with self.metrics.timer("draw"):
+                        frame = self.renderer.render(results, self.last_detections)
+                    cv2.imshow("frame", self.renderer.display(frame))
+                    if cv2.waitKey(1) & 0xFF == ord("q"):
+                        break
+        finally:
+            capture.release()
+            if show_video:
+                cv2.destroyAllWindows()
+        return gate
+
+    def process_video_roi(self, model: YOLO, video_path: str, show_video=True, margin: int = 150):
+        """
+        Обработка видео, при которой детектор видит только область вокруг дверей.
+
+        Кадр обрезается до DoorList.roi, поэтому при том же imgsz люди у дверей
+        получают большее разрешение, а через сеть проходит меньше пикселей.
+
+        :param model: Модель YOLO
+        :type model: YOLO
+        :param video_path: Путь к видео или адрес потока
+        :type video_path: str
+        :param show_video: Показывать отладочное окно
+        :param margin: Запас в пикселях вокруг зон дверей
+        :type margin: int
+        """
+        self.process_video_adaptive(model, video_path, show_video, max_skip=0, roi_margin=margin)
+
+    def _timed(self, iterable: Iterable, stage: str) -> Generator:
+        """
+        Отдаёт элементы iterable, замеряя время получения каждого как стадию stage
+        """
+        if not self.metrics.enabled:
+            yield from iterable
+            return
+        iterator = iter(iterable)
+        while True:
+            with self.metrics.timer(stage):
+                item = next(iterator, _END)
+            if item is _END:
+                return
+            yield item
+
+    @staticmethod
+    def _read_frames(capture: cv2.VideoCapture, stride: int) -> Generator[np.ndarray, None, None]:
+        while True:
+            for _ in range(stride - 1):
+                capture.grab()
+            ok, frame = capture.read()
+            if not ok:
+                return
+            yield frame
+
+    @staticmethod
+    def track_frame(model: YOLO, frame: np.ndarray, roi: np.ndarray | None = None) -> Results:
+        """
+        Запускает трекер на одном кадре или на его области roi.
+
+        Рамки из области переводятся в координаты полного кадра, поэтому дальнейшая
+        обработка не знает, что детектор видел только часть кадра.
+
+        :param model: Модель YOLO
+        :type model: YOLO
+        :param frame: Полный кадр
+        :type frame: np.ndarray
+        :param roi: Область формата xyxy, None - весь кадр
+        :type roi: np.ndarray | None
+        :return: Результат в координатах полного кадра
+        :rtype: Results
+        """
+        from ultralytics.engine.results import Results
+
+        model_args = {key: value for key, value in MODEL_ARGS.items() if key != "vid_stride"}
+        if roi is None:
+            return model.track(frame, **model_args)[0]
+        x1, y1, x2, y2 = roi
+        results = model.track(np.ascontiguousarray(frame[y1:y2, x1:x2]), **model_args)[0]
+        data = results.boxes.data.clone()
+        data[:, [0, 2]] += x1
+        data[:, [1, 3]] += y1
+        full = Results(frame, results.path, results.names, boxes=data)
+        full.speed = results.speed
+        return full
+
+    def _count_results(self, results: Results):
+        self.tracking(results)
+        self.metrics.frame_done()
+
+    def _open_recorder(self, save_path: str, video_path: str, segment_seconds: float | None,
+                       scale: float) -> SegmentedRecorder:
+        return SegmentedRecorder.for_source(save_path, video_path, MODEL_ARGS["vid_stride"],
+                                            segment_seconds=segment_seconds, scale=scale, metrics=self.metrics)
+
+    def _close_recorder(self, recorder: SegmentedRecorder) -> int:
+        recorder.close()
+        self.metrics.count("recorder_dropped", recorder.dropped)
+        return recorder.dropped
+
+    def _write_results(self, results: Results, recorder: SegmentedRecorder, stages: dict | None = None):
+        with self.metrics.timer("draw"):
+            annotated = self.renderer.render(results)
+        recorder.write(annotated)
+        if stages and "display" in stages:
+            stages["display"].submit(annotated)
+
+    def _show_results(self, frame: Results | np.ndarray, pipeline: Pipeline):
+        if not isinstance(frame, np.ndarray):
+            with self.metrics.timer("draw"):
+                frame = self.renderer.render(frame)
+        cv2.imshow("frame", self.renderer.display(frame))
+        if cv2.waitKey(1) & 0xFF == ord("q"):
+            pipeline.stop()
 
     def tracking(self, results: Results):
         """
@@ -71,68 +478,80 @@ class Tracking:
         :return:
         """
         # TODO: этот код нужно поделить на методы, каждый методы (зашел вышел прошел)
-        for person in parse_results(results):
-            now = person.check_how_close_to_door()
-            if person.id_person not in self.id_location:
-                newborn = now is Location.Close
-                self.id_location[person.id_person] = State(now, newborn)
-                if newborn:
-                    self.in_out[0] += 1
-                    nearest_door = person.nearest_door()
-                    print("Я родился!", nearest_door.name)
-                continue
-            state = self.id_location[person.id_person]
-            before = state.location
-            if now is Location.Close and before is Location.Around:
-                self.in_out[1] += 1
-                nearest_door = person.nearest_door()
-                print("Я вышел!", nearest_door.name)
-            if not state.newborn and now is Location.Around and before is Location.Close:
-                self.in_out[1] -= 1
-                nearest_door = person.nearest_door()
-                print("Погодите-ка, я просто мимо проходил", nearest_door.name)
-            self.id_location[person.id_person].update(now)
-
-    def _tracking(self):
-        # TODO: Так будет работать логика будущего, сначала парсинг result, потом парсинг массива каждым методом
-        # pass
-        frame_objects = np.empty(10, dtype=object)
-        for i, frame_result in enumerate(self.predict_history):
-            frame_objects[i] = parse_results(frame_result)
-
-        self._door_touch(frame_objects)
-
-        # self.people_coming(person)
-        # self._people_leave(frame_objects)
-
-    def _people_coming(self, person: People):
-        # TODO: Проверка, человек ушел
-        pass
+        if self.recorder is not None:
+            self.recorder.append(self.frame_number, results)
+        if self.zone_raster and (self.doors.raster is None or self.doors.raster.shape != results.orig_shape):
+            self.doors.rasterize(results.orig_shape)
+        with self.metrics.timer("parse_results"):
+            detections = parse_detections(results)
+        self.last_detections = detections
+        self.track_detections(detections)
 
-    @staticmethod
-    def _door_touch(peoples_from_frame) -> None:
-        # TODO: Не работает, нужно разбираться почему
-        person_door_relationship = dict()
-        for frame_object in peoples_from_frame:
-            for person in frame_object:
-                person_id = person.get_person_id()
-                location_person = person.check_how_close_to_door()
-                if not person_door_relationship.get(person_id):
-                    person_door_relationship[person_id] = location_person
-                    continue
-                last_location = person_door_relationship[person_id]
-                if last_location == Location.Far and location_person == Location.Close:
-                    print(
-                        "Мама что произошло за за 7 фреймов")  # Смотрим случай когда за 7 кадров человек улетел куда-то
-                elif last_location == Location.Around and location_person == Location.Close:
-                    print("Человек вошёл в дверь")
-                    person.print_person()
-                elif last_location == Location.Close and location_person == Location.Around:
-                    print("Человек вышел из двери")
-                    person.print_person()
-                elif last_location == Location.Close and location_person == Location.Far:
-                    print("Мама что произошло за за 7 фреймов")
-                person_door_relationship[person_id] = location_person
+    def track_detections(self, detections: FrameDetections):
+        """
+        Обновляет счётчики по обнаружениям одного кадра
+
+        :param detections: Обнаружения кадра
+        :type detections: FrameDetections
+        """
+        frame = self.frame_number
+        if self.reload_doors_every and frame % self.reload_doors_every == 0:
+            self.reload_doors()
+        self.near_door = False
+        if len(detections):
+            self.tracker_frame += 1
+        if len(detections) or self.window is not None:
+            with self.metrics.timer("door_state"):
+                codes, nearest = detections.locate(self.doors)
+                self.near_door = bool(codes.any())
+                if self.window is not None:
+                    # Положение меняется только после confirm совпавших наблюдений, -1 - ещё не подтверждено
+                    self.window.push(detections.ids, detections.centers, codes)
+                    confirmed, agreed = self.window.confirmed(detections.ids)
+                    codes = np.where(agreed, confirmed, -1)
+                self._update_states(detections, codes, nearest, frame, self.tracker_frame)
+        self.states.evict(self.tracker_frame)
+        self.frame_number += 1
+
+    def reload_doors(self) -> bool:
+        """
+        Перечитывает файл дверей, если он изменился. Новые двери получают нулевые счётчики,
+        счётчики удалённых дверей остаются в door_in_out.
+
+        :return: Были ли двери перечитаны
+        :rtype: bool
+        """
+        if not self.doors.reload_if_changed():
+            return False
+        for door in self.doors:
+            self.door_in_out.setdefault(door.name, [0, 0])
+        return True
+
+    def _update_states(self, detections: FrameDetections, codes: np.ndarray, nearest: np.ndarray, frame: int,
+                       clock: int):
+        # frame - номер кадра для событий, clock - часы TTL треков (tracker_frame)
+        events = self.states.update(detections.ids, codes, clock)
+        if not events.any():
+            return
+        doors = self.doors.doors
+        # Строка на дверь: [нет события, Enter, Exit, PassBy]
+        counts = np.bincount(nearest * len(EVENT_KINDS) + events,
+                             minlength=len(doors) * len(EVENT_KINDS)).reshape(len(doors), len(EVENT_KINDS))
+        enter = counts[:, ENTER]
+        out = counts[:, EXIT] - counts[:, PASS_BY]
+        self.in_out[0] += int(enter.sum())
+        self.in_out[1] += int(out.sum())
+        for index in np.flatnonzero((enter != 0) | (out != 0)).tolist():
+            door_in_out = self.door_in_out.setdefault(doors[index].name, [0, 0])
+            door_in_out[0] += int(enter[index])
+            door_in_out[1] += int(out[index])
+        if self.events is not None:
+            for i in np.flatnonzero(events).tolist():
+                self._emit(EVENT_KINDS[events[i]], int(detections.ids[i]), doors[nearest[i]].name,
+                           int(detections.classes[i]), frame)
+
+    def _emit(self, kind: EventKind, id_person: int, door: str, model_class: int, frame: int):
+        self.events.emit(kind, id_person, door, model_class, frame)
 
 
 if __name__ == "__main__":
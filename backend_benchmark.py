@@ -0,0 +1,118 @@
+import argparse
+import json
+import os
+import time
+from dataclasses import asdict
+
+import cv2
+import numpy as np
+
+from Backends import FORMATS, BackendConfig, load_model
+
+
+def load_images(directory: str, count: int) -> list[np.ndarray]:
+    """
+    Первые count изображений папки, по имени
+    """
+    names = sorted(name for name in os.listdir(directory) if name.lower().endswith((".jpg", ".jpeg", ".png")))
+    images = [cv2.imread(os.path.join(directory, name)) for name in names[:count]]
+    return [image for image in images if image is not None]
+
+
+def measure_backend(config: BackendConfig, images: list[np.ndarray], data: str | None = None,
+                    batch_size: int = 8, warmup: int = 3) -> dict[str, float]:
+    """
+    Замеряет задержку на одном кадре, пропускную способность на пачках и, если задан data, mAP
+
+    :param config: Бэкенд
+    :type config: BackendConfig
+    :param images: Кадры для замера
+    :type images: list[np.ndarray]
+    :param data: Описание размеченного набора для model.val, None - без mAP
+    :type data: str | None
+    :param batch_size: Размер пачки для замера пропускной способности
+    :type batch_size: int
+    :param warmup: Сколько кадров прогнать до замеров
+    :type warmup: int
+    :return: Задержки в миллисекундах, кадры в секунду и mAP
+    :rtype: dict[str, float]
+    """
+    start = time.perf_counter()
+    model = load_model(config)
+    stats = {"load_s": time.perf_counter() - start}
+    args = dict(imgsz=config.imgsz, conf=0.5, verbose=False)
+    for image in images[:warmup]:
+        model.predict(image, **args)
+
+    latencies = np.empty(len(images))
+    for i, image in enumerate(images):
+        start = time.perf_counter()
+        model.predict(image, **args)
+        latencies[i] = time.perf_counter() - start
+    latencies *= 1000
+    stats.update(mean_ms=float(latencies.mean()), p95_ms=float(np.percentile(latencies, 95)))
+
+    # Экспортированные модели с фиксированной формой входа обрабатывают пачку по кадру
+    start = time.perf_counter()
+    for i in range(0, len(images), batch_size):
+        model.predict(images[i:i + batch_size], **args)
+    stats["fps"] = len(images) / (time.perf_counter() - start)
+
+    if data is not None:
+        metrics = model.val(data=data, imgsz=config.imgsz, batch=1, verbose=False, plots=False)
+        stats.update(map50=float(metrics.box.map50), map=float(metrics.box.map))
+    return stats
+
+
+def compare(results: dict[str, dict[str, float]], baseline: str = "pytorch:fp32") -> dict[str, dict[str, float]]:
+    """
+    Отношение скорости и разница mAP каждого бэкенда к базовому
+
+    :return: {бэкенд: {"speedup": ..., "map50_delta": ...}}
+    :rtype: dict[str, dict[str, float]]
+    """
+    base = results[baseline]
+    view = dict()
+    for key, stats in results.items():
+        view[key] = {"speedup": base["mean_ms"] / stats["mean_ms"]}
+        if "map50" in stats and "map50" in base:
+            view[key]["map50_delta"] = stats["map50"] - base["map50"]
+    return view
+
+
+def main():
+    defaults = BackendConfig()
+    parser = argparse.ArgumentParser(description="Сравнение бэкендов детектора на CPU с исходными весами .pt")
+    parser.add_argument("--weights", default=defaults.weights)
+    parser.add_argument("--backends", default="pytorch,onnx,openvino,openvino-int8",
+                        help=f"Через запятую из {', '.join(FORMATS)}; суффикс -int8 - квантованный вариант")
+    parser.add_argument("--images", default="self development dataset/train/images")
+    parser.add_argument("--count", type=int, default=100)
+    parser.add_argument("--data", help="data.yaml размеченного набора для mAP")
+    parser.add_argument("--imgsz", type=int, default=defaults.imgsz)
+    parser.add_argument("--save", help="Сохранить результат в JSON")
+    args = parser.parse_args()
+
+    images = load_images(args.images, args.count)
+    configs = [BackendConfig("pytorch", args.weights, imgsz=args.imgsz)]
+    for name in args.backends.split(","):
+        backend, _, suffix = name.partition("-")
+        config = BackendConfig(backend, args.weights, int8=suffix == "int8", imgsz=args.imgsz)
+        if config not in configs:
+            configs.append(config)
+
+    results = {config.key: measure_backend(config, images, args.data) for config in configs}
+    speedups = compare(results, configs[0].key)
+    for key, stats in results.items():
+        line = f"{key:>24}: {stats['mean_ms']:8.2f} мс  p95 {stats['p95_ms']:8.2f} мс  {stats['fps']:7.1f} к/с" \
+               f"  x{speedups[key]['speedup']:.2f}"
+        if "map50" in stats:
+            line += f"  mAP50 {stats['map50']:.3f} ({speedups[key]['map50_delta']:+.3f})"
+        print(line)
+    if args.save:
+        with open(args.save, "w") as file:
+            json.dump({"configs": [asdict(config) for config in configs], "results": results}, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,230 @@
+import argparse
+import json
+import time
+import tracemalloc
+from dataclasses import asdict, dataclass
+from typing import Callable
+
+import cv2
+import numpy as np
+
+from Debug_drawer import DebugRenderer, draw_debug
+from Doors import Door, DoorList
+from People import parse_results
+from Tracking import Tracking
+
+
+@dataclass(frozen=True, slots=True)
+class StreamConfig:
+    """
+    Параметры синтетического потока обнаружений
+    """
+    frames: int = 500
+    crowd: int = 30
+    doors: int = 3
+    churn: float = 0.05
+    width: int = 1920
+    height: int = 1080
+    seed: int = 42
+
+
+class SyntheticBoxes:
+    """
+    Повторяет ту часть ultralytics Boxes, которую использует подсчёт
+    """
+
+    def __init__(self, ids: np.ndarray, cls: np.ndarray, conf: np.ndarray, xyxy: np.ndarray) -> None:
+        self.id = ids
+        self.cls = cls
+        self.conf = conf
+        self.xyxy = xyxy
+        self.data = np.column_stack((xyxy, ids, conf, cls))
+
+    def numpy(self) -> "SyntheticBoxes":
+        return self
+
+    def __len__(self) -> int:
+        return len(self.id)
+
+
+class SyntheticResults:
+    """
+    Повторяет ту часть ultralytics Results, которую используют подсчёт и отрисовка
+    """
+
+    def __init__(self, boxes: SyntheticBoxes, orig_img: np.ndarray) -> None:
+        self.boxes = boxes
+        self.orig_img = orig_img
+        self.orig_shape = orig_img.shape[:2]
+
+    def plot(self) -> np.ndarray:
+        frame = self.orig_img.copy()
+        for x1, y1, x2, y2 in self.boxes.xyxy.astype(int).tolist():
+            cv2.rectangle(frame, (x1, y1), (x2, y2), color=(255, 0, 0), thickness=2)
+        return frame
+
+
+def synthetic_doors(config: StreamConfig) -> DoorList:
+    """
+    Расставляет config.doors дверей вдоль верхнего края кадра
+    """
+    xs = np.linspace(100, config.width - 200, config.doors).astype(int)
+    return DoorList([Door(f"door{i}", np.array([x, 0, x + 100, 200])) for i, x in enumerate(xs)])
+
+
+def synthetic_stream(config: StreamConfig, doors: DoorList) -> list[SyntheticResults]:
+    """
+    Генерирует поток кадров: люди блуждают между дверями, часть треков
+    на каждом кадре исчезает и заменяется новыми (config.churn)
+
+    :param config: Параметры потока
+    :type config: StreamConfig
+    :param doors: Двери, к которым притягиваются люди
+    :type doors: DoorList
+    :return: Список результатов по кадрам
+    :rtype: list[SyntheticResults]
+    """
+    rng = np.random.default_rng(config.seed)
+    image = np.zeros((config.height, config.width, 3), dtype=np.uint8)
+    size = np.array([config.width, config.height])
+    targets = np.array(doors.centers, dtype=float).reshape(-1, 2)
+    positions = rng.uniform(0, 1, (config.crowd, 2)) * size
+    goals = targets[rng.integers(len(targets), size=config.crowd)]
+    ids = np.arange(config.crowd)
+    next_id = config.crowd
+    stream = list()
+    for _ in range(config.frames):
+        reborn = rng.random(config.crowd) < config.churn
+        count = int(reborn.sum())
+        ids[reborn] = np.arange(next_id, next_id + count)
+        next_id += count
+        positions[reborn] = rng.uniform(0, 1, (count, 2)) * size
+        goals[reborn] = targets[rng.integers(len(targets), size=count)]
+        positions += (goals - positions) * 0.05 + rng.normal(0, 5, positions.shape)
+        np.clip(positions, 0, size - 1, out=positions)
+        xyxy = np.hstack((positions - (25, 60), positions + (25, 60))).astype(np.float32)
+        boxes = SyntheticBoxes(ids.astype(np.float32), np.zeros(config.crowd, dtype=np.float32),
+                               rng.uniform(0.5, 1, config.crowd).astype(np.float32), xyxy)
+        stream.append(SyntheticResults(boxes, image))
+    return stream
+
+
+def measure(stage: Callable[[SyntheticResults], object], stream: list[SyntheticResults]) -> dict[str, float]:
+    """
+    Замеряет время обработки каждого кадра и пиковую память стадии
+
+    :param stage: Функция, которая обрабатывает один кадр
+    :param stream: Кадры
+    :return: Задержки в миллисекундах, кадры в секунду и пиковая память в КиБ
+    :rtype: dict[str, float]
+    """
+    latencies = np.empty(len(stream))
+    for i, results in enumerate(stream):
+        start = time.perf_counter()
+        stage(results)
+        latencies[i] = time.perf_counter() - start
+    tracemalloc.start()
+    for results in stream[:50]:
+        stage(results)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    latencies *= 1000
+    return {"mean_ms": float(latencies.mean()),
+            "p50_ms": float(np.percentile(latencies, 50)),
+            "p95_ms": float(np.percentile(latencies, 95)),
+            "fps": float(1000 / latencies.mean()),
+            "peak_kib": peak / 1024}
+
+
+def run(config: StreamConfig) -> dict:
+    """
+    Прогоняет стадии подсчёта по синтетическому потоку по отдельности
+
+    :param config: Параметры потока
+    :type config: StreamConfig
+    :return: Конфигурация и замеры по стадиям
+    :rtype: dict
+    """
+    doors = synthetic_doors(config)
+    stream = synthetic_stream(config, doors)
+
+    def check_how_close_to_door(results):
+        for person in parse_results(results):
+            person.check_how_close_to_door(doors)
+
+    stages = {
+        "parse_results": parse_results,
+        "check_how_close_to_door": check_how_close_to_door,
+        "tracking": Tracking(doors=doors).tracking,
+        "draw_debug": lambda results: draw_debug(results, doors=doors),
+        "render": DebugRenderer(doors).render,
+    }
+    return {"config": asdict(config),
+            "stages": {name: measure(stage, stream) for name, stage in stages.items()}}
+
+
+def compare(report: dict, baseline: dict, tolerance: float) -> list[str]:
+    """
+    Сравнивает среднюю задержку стадий с базовым прогоном
+
+    :param report: Текущий прогон
+    :param baseline: Базовый прогон
+    :param tolerance: Допустимое относительное замедление, например 0.2
+    :return: Описания регрессий
+    :rtype: list[str]
+    """
+    if report["config"] != baseline["config"]:
+        return [f"конфигурации отличаются: {report['config']} != {baseline['config']}"]
+    regressions = list()
+    for name, stats in report["stages"].items():
+        before = baseline["stages"].get(name)
+        if before is None:
+            continue
+        ratio = stats["mean_ms"] / before["mean_ms"]
+        if ratio > 1 + tolerance:
+            regressions.append(f"{name}: {before['mean_ms']:.3f} -> {stats['mean_ms']:.3f} мс (x{ratio:.2f})")
+    return regressions
+
+
+def print_report(report: dict) -> None:
+    for name, stats in report["stages"].items():
+        print(f"{name:>24}: {stats['mean_ms']:8.3f} мс  p95 {stats['p95_ms']:8.3f} мс  "
+              f"{stats['fps']:10.1f} к/с  {stats['peak_kib']:8.1f} КиБ")
+
+
+def build_parser() -> argparse.ArgumentParser:
+    # У dataclass со slots атрибуты класса - дескрипторы, значения по умолчанию берутся из экземпляра
+    defaults = StreamConfig()
+    parser = argparse.ArgumentParser(description="Бенчмарк горячего пути подсчёта")
+    parser.add_argument("--frames", type=int, default=defaults.frames)
+    parser.add_argument("--crowd", type=int, default=defaults.crowd)
+    parser.add_argument("--doors", type=int, default=defaults.doors)
+    parser.add_argument("--churn", type=float, default=defaults.churn)
+    parser.add_argument("--seed", type=int, default=defaults.seed)
+    parser.add_argument("--save", help="Сохранить результат в JSON")
+    parser.add_argument("--baseline", help="Сравнить с сохранённым JSON")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    return parser
+
+
+def main(argv: list[str] | None = None):
+    args = build_parser().parse_args(argv)
+
+    config = StreamConfig(frames=args.frames, crowd=args.crowd, doors=args.doors,
+                          churn=args.churn, seed=args.seed)
+    report = run(config)
+    print_report(report)
+    if args.save:
+        with open(args.save, "w") as file:
+            json.dump(report, file, indent=2)
+    if args.baseline:
+        with open(args.baseline) as file:
+            regressions = compare(report, json.load(file), args.tolerance)
+        for regression in regressions:
+            print("Регрессия:", regression)
+        if regressions:
+            raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
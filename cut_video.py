@@ -1,5 +1,5 @@
-from moviepy.video.io.VideoFileClip import VideoFileClip
 import os
+import subprocess
 
 
 def clean_output_folder():
@@ -19,16 +19,20 @@ def clean_output_folder():
 
 
 def cut_video(input_file, output_file_prefix, number_video=2, duration=30):
-    clip = VideoFileClip(input_file)
-
+    """
+    Режет видео на куски по duration секунд без перекодирования.
+
+    Поток копируется как есть (ffmpeg -c copy), поэтому каждый кусок начинается
+    с ключевого кадра не позже start и может быть чуть длиннее duration.
+    Для подсчёта по длинной записи используйте LongVideo.process_long_video:
+    куски, посчитанные отдельно, теряют или удваивают треки на границах.
+    """
     for i in range(number_video):
         start_time = i * duration
-        end_time = (i + 1) * duration
-        subclip = clip.subclip(start_time, end_time)
         output_file = f"{output_file_prefix}_{i + 1}.mp4"
-        subclip.write_videofile(output_file, codec="libx264", audio_codec="aac")
-
-    clip.close()
+        subprocess.run(["ffmpeg", "-y", "-v", "error", "-ss", str(start_time), "-i", input_file,
+                        "-t", str(duration), "-c", "copy", "-avoid_negative_ts", "make_zero", output_file],
+                       check=True)
 
 
 if __name__ == "__main__":
@@ -1,28 +1,179 @@
+import argparse
+import json
 import os
 
-from dotenv import load_dotenv
-from ultralytics import YOLO
+import yaml
 
-from CustomModel import CustomYOLOv8Model
-from Tracking import Tracking
+DEFAULT_CONFIG = "config.yaml"
 
-load_dotenv()
 
+def load_config(path: str) -> dict:
+    """
+    Читает YAML-конфигурацию запуска; отсутствующий файл - пустая конфигурация
 
-def main():
-    # model = CustomYOLOv8Model()
-    # model.download_dataset()
-    # model.train_my_model(50)
+    :param path: Путь к конфигурации
+    :type path: str
+    :rtype: dict
+    """
+    try:
+        with open(path) as file:
+            return yaml.safe_load(file) or dict()
+    except FileNotFoundError:
+        return dict()
 
-    tracking = Tracking()
-    model = YOLO('runs/detect/train2/weights/best.pt')
-    model.fuse()
-    # input_video = os.getenv("INPUT_VIDEO")
-    # input_video = r"C:\Users\Артём\Documents\GitHub\Traffic-Vision-\Test video output\output_8.mp4"
-    input_video = r"D:\я у мамы программист\3 курс 2 семестр IT-проекты\Traffic-Vision-\Test output video\output_9.mp4"
-    # input_video = r"D:\я у мамы программист\3 курс 2 семестр IT-проекты\Traffic-Vision-\Test input video\test.mp4"
 
-    tracking.process_video_with_tracking(model, input_video, show_video=True)
+def _doors(config: dict):
+    from Doors import DoorList
+
+    doors = DoorList.from_file(config.get("doors", "doors_corners.txt"))
+    if config.get("zones"):
+        doors.load_zones(config["zones"])
+    return doors
+
+
+def _tracking(config: dict, **kwargs):
+    """
+    Tracking с дверями и параметрами подсчёта из конфигурации, одинаковый для run и replay
+
+    :param config: Конфигурация запуска
+    :type config: dict
+    :param kwargs: Остальные аргументы Tracking, например recorder и events
+    :rtype: Tracking
+    """
+    from Tracking import Tracking
+
+    options = config.get("run", dict())
+    return Tracking(doors=_doors(config), zone_raster=options.get("zone_raster", False),
+                    window=options.get("window"), confirm=options.get("confirm", 3), **kwargs)
+
+
+def _metrics(options: dict | None):
+    """
+    Метрики из раздела run.metrics; если не заданы ни файл, ни порт - выключенные метрики.
+    Сервер Prometheus запускается сразу и останавливается в Metrics.close.
+
+    :param options: Раздел run.metrics
+    :type options: dict | None
+    :rtype: Metrics
+    """
+    from Metrics import NULL_METRICS, Metrics
+
+    options = options or dict()
+    port = options.get("prometheus_port")
+    if options.get("jsonl") is None and port is None:
+        return NULL_METRICS
+    metrics = Metrics(options.get("jsonl"), options.get("flush_interval", 10.0))
+    if port is not None:
+        metrics.serve_prometheus(port, options.get("prometheus_host", "127.0.0.1"))
+    return metrics
+
+
+def _print_counts(in_out: list[int], door_in_out: dict[str, list[int]], **extra) -> None:
+    print(json.dumps({"in_out": in_out, "doors": door_in_out, **extra}, ensure_ascii=False))
+
+
+def run(config: dict, args: argparse.Namespace) -> None:
+    """
+    Обработка видео или потока с моделью из раздела backend
+    """
+    from Backends import BackendConfig, load_model
+    from DetectionCache import DetectionRecorder
+    from Tracking import MODEL_ARGS
+
+    options = dict(config.get("run", dict()))
+    video = options.pop("video", None)
+    video = args.video or video
+    if video is None:
+        raise SystemExit("Не задано видео: run --video или run.video в конфигурации")
+    if args.show:
+        options["show_video"] = True
+    if args.save:
+        options["save_path"] = args.save
+    record = options.pop("record", None)
+    events = options.pop("events", None)
+    metrics = _metrics(options.pop("metrics", None))
+    for key in ("zone_raster", "window", "confirm"):
+        options.pop(key, None)
+
+    sink = None
+    if events:
+        from Events import SQLiteEventSink
+        sink = SQLiteEventSink(events)
+    # При продолжении с контрольной точки кэш дописывается, а не перезаписывается
+    resume = options.get("checkpoint_path") is not None and os.path.exists(options["checkpoint_path"])
+    recorder = DetectionRecorder(record, append=resume, video=video, vid_stride=MODEL_ARGS["vid_stride"]) \
+        if record else None
+    tracking = _tracking(config, recorder=recorder, events=sink, metrics=metrics)
+    try:
+        model = load_model(BackendConfig(**config.get("backend", dict())))
+        dropped = tracking.process_video_with_tracking(model, video, **{"show_video": False, **options})
+    finally:
+        if recorder is not None:
+            recorder.close()
+        if sink is not None:
+            sink.close()
+        metrics.close()
+    extra = {"recorder_dropped": dropped} if options.get("save_path") else dict()
+    _print_counts(tracking.in_out, tracking.door_in_out, **extra)
+
+
+def replay(config: dict, args: argparse.Namespace) -> None:
+    """
+    Подсчёт по записанному кэшу обнаружений без модели
+    """
+    from DetectionCache import DetectionCache, replay as replay_cache
+
+    tracking = _tracking(config)
+    replay_cache(DetectionCache(args.cache), tracking)
+    _print_counts(tracking.in_out, tracking.door_in_out)
+
+
+def bench(config: dict, args: argparse.Namespace) -> None:
+    """
+    Бенчмарк горячего пути подсчёта на синтетическом потоке
+    """
+    from benchmark import StreamConfig, print_report, run as run_benchmark
+
+    print_report(run_benchmark(StreamConfig(**config.get("bench", dict()))))
+
+
+def label(config: dict, args: argparse.Namespace) -> None:
+    """
+    Авторазметка кадров для самообучения
+    """
+    from self_development import auto_label
+
+    options = dict(config.get("label", dict()))
+    source = options.pop("source", None)
+    source = args.source or source
+    if source is None:
+        raise SystemExit("Не задана папка с кадрами: label SOURCE или label.source в конфигурации")
+    print(auto_label(source, **options))
+
+
+def main(argv: list[str] | None = None):
+    parser = argparse.ArgumentParser(description="Подсчёт людей у дверей")
+    parser.add_argument("--config", default=DEFAULT_CONFIG, help="YAML-конфигурация запуска")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="Обработать видео или поток")
+    run_parser.add_argument("--video", help="Видео или адрес потока, по умолчанию run.video")
+    run_parser.add_argument("--show", action="store_true", help="Показывать отладочное окно")
+    run_parser.add_argument("--save", help="Путь для записи размеченного видео")
+    run_parser.set_defaults(handler=run)
+
+    replay_parser = commands.add_parser("replay", help="Посчитать по кэшу обнаружений без модели")
+    replay_parser.add_argument("cache", help="Папка кэша DetectionRecorder")
+    replay_parser.set_defaults(handler=replay)
+
+    commands.add_parser("bench", help="Бенчмарк подсчёта на синтетическом потоке").set_defaults(handler=bench)
+
+    label_parser = commands.add_parser("label", help="Авторазметка кадров для самообучения")
+    label_parser.add_argument("source", nargs="?", help="Папка с кадрами, по умолчанию label.source")
+    label_parser.set_defaults(handler=label)
+
+    args = parser.parse_args(argv)
+    args.handler(load_config(args.config), args)
 
 
 if __name__ == "__main__":
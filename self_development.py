@@ -1,80 +1,250 @@
-import cv2
+import argparse
+import hashlib
+import json
 import os
-from ultralytics import YOLO
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+
+import cv2
+import numpy as np
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp")
+MANIFEST = "manifest.json"
+
+
+def file_hash(path: str) -> str:
+    """
+    Хэш содержимого файла
+
+    :param path: Путь к файлу
+    :type path: str
+    :return: sha1 в шестнадцатеричном виде
+    :rtype: str
+    """
+    digest = hashlib.sha1()
+    with open(path, "rb") as file:
+        for chunk in iter(lambda: file.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def yolo_lines(classes: np.ndarray, xyxy: np.ndarray, shape: tuple[int, ...]) -> str:
+    """
+    Переводит рамки в строки разметки YOLO: "класс cx cy w h" в долях кадра
+
+    :param classes: Классы, (n,)
+    :type classes: np.ndarray
+    :param xyxy: Углы рамок в пикселях, (n, 4)
+    :type xyxy: np.ndarray
+    :param shape: Размер кадра (h, w, ...)
+    :type shape: tuple[int, ...]
+    :return: Содержимое файла разметки
+    :rtype: str
+    """
+    h, w = shape[:2]
+    xyxy = np.asarray(xyxy, dtype=np.float64).reshape(-1, 4)
+    size = xyxy[:, 2:] - xyxy[:, :2]
+    rows = np.column_stack((xyxy[:, :2] + size / 2, size)) / (w, h, w, h)
+    classes = np.asarray(classes).astype(int).tolist()
+    return "".join(f"{c} {x:.6f} {y:.6f} {bw:.6f} {bh:.6f}\n" for c, (x, y, bw, bh) in zip(classes, rows.tolist()))
 
 
-def delete_files_in_folder(folder_path):
+def load_manifest(path: str, model_key: str) -> dict[str, str]:
     """
-    TODO: Удаляет все файлы из папки
-    :param folder_path:
-    :return:
+    Читает манифест размеченных изображений
+
+    :param path: Путь к манифесту
+    :type path: str
+    :param model_key: Ключ модели; если разметка сделана другой моделью, манифест считается пустым
+    :type model_key: str
+    :return: Имя изображения -> {"hash", "size", "mtime"} (в старых манифестах - только хэш)
+    :rtype: dict[str, dict | str]
     """
-    for root, dirs, files in os.walk(folder_path):
-        for file_name in files:
-            file_path = os.path.join(root, file_name)
-            try:
-                os.unlink(file_path)
-            except Exception as e:
-                print(f"Error deleting file: {file_path} -- {e}")
-
-
-# region Этот код используется для самообучения модели
-my_best_model = "runs/detect/train/weights/best.pt"  # Загружаем модель
-model = YOLO(my_best_model)
-# Отсюда берем кадры
-directory = r"D:\я у мамы программист\3 курс 2 семестр IT-проекты\Traffic-Vision-\self development images"
-train_images_path = 'self development dataset/train/images'  # Сюда складываем
-img_list = os.listdir(directory)
-print(f"В папке имеется {len(img_list)} изображений")
-
-delete_files_in_folder('self development dataset/train/images')
-delete_files_in_folder('self development dataset/train/labels')
-
-for img_name in img_list:
-    img_filepath = directory + "\\" + img_name
-    print(img_filepath)
-    img = cv2.imread(img_filepath)
-    img_copy = img
-
-    # получаем ширину и высоту картинки
-    h, w, _ = img.shape
-
-    # получаем предсказания по картинке
-    results = model.predict(source=img, conf=0.50)
-
-    # расшифровываем объект results
-    bboxes_ = results[0].boxes.xyxy.tolist()
-    bboxes = list(map(lambda x: list(map(lambda y: int(y), x)), bboxes_))
-    confs_ = results[0].boxes.conf.tolist()
-    confs = list(map(lambda x: int(x * 100), confs_))
-    classes_ = results[0].boxes.cls.tolist()
-    classes = list(map(lambda x: int(x), classes_))
-    cls_dict = results[0].names
-    class_names = list(map(lambda x: cls_dict[x], classes))
-
-    # приводим дешифрированные данные в удобный вид
-    annot_lines = []
-    for index, val in enumerate(class_names):
-        xmin, ymin, xmax, ymax = int(bboxes[index][0]), int(bboxes[index][1]), int(bboxes[index][2]), int(
-            bboxes[index][3])
-        width = xmax - xmin
-        height = ymax - ymin
-        center_x = xmin + (width / 2)
-        center_y = ymin + (height / 2)
-        annotation = f"{classes[index]} {center_x / w} {center_y / h} {width / w} {height / h}"
-        annot_lines.append(annotation)
-
-    # копируем картинку в папку базы изображений для импорта
-    cv2.imwrite(os.path.join(train_images_path, img_name), img_copy)
-
-    # определить расширение изображения (png или jpg)
-    img_extension = os.path.splitext(img_name)[-1].lower()
-
-    # записываем файл аннотации в папку базы изображений для импорта
-
-    txt_name = img_name.replace(img_extension, ".txt")
-    with open(os.path.join('self development dataset/train/labels', txt_name), 'w') as f:
-        for line in annot_lines:
-            f.write(line)
-            f.write('\n')
-# endregion
+    if not os.path.exists(path):
+        return dict()
+    with open(path) as file:
+        manifest = json.load(file)
+    if manifest.get("model") != model_key:
+        return dict()
+    return manifest["images"]
+
+
+def save_manifest(path: str, model_key: str, images: dict[str, dict | str]) -> None:
+    """
+    Атомарно записывает манифест
+    """
+    temporary = path + ".tmp"
+    with open(temporary, "w") as file:
+        json.dump({"model": model_key, "images": images}, file, indent=1, ensure_ascii=False)
+    os.replace(temporary, path)
+
+
+def _digest(entry: dict | str | None) -> str | None:
+    return entry["hash"] if isinstance(entry, dict) else entry
+
+
+def plan(source_dir: str, known: dict[str, dict | str],
+         executor: ThreadPoolExecutor) -> tuple[dict[str, dict], list[str], list[str]]:
+    """
+    Сравнивает папку с изображениями с манифестом.
+
+    Хэшируются только файлы, у которых размер или время изменения не совпадают с манифестом,
+    поэтому время проверки растёт с числом новых кадров, а не с размером папки.
+
+    :param source_dir: Папка с исходными изображениями
+    :param known: Манифест: имя -> {"hash", "size", "mtime"}
+    :param executor: Пул потоков для хэширования
+    :return: Записи манифеста для всех изображений, новые или изменённые имена, удалённые имена
+    :rtype: tuple[dict[str, dict], list[str], list[str]]
+    """
+    names = sorted(name for name in os.listdir(source_dir) if name.lower().endswith(IMAGE_EXTENSIONS))
+    entries = dict()
+    for name in names:
+        stat = os.stat(os.path.join(source_dir, name))
+        entries[name] = {"size": stat.st_size, "mtime": stat.st_mtime_ns}
+    unsure = list()
+    for name, entry in entries.items():
+        previous = known.get(name)
+        if isinstance(previous, dict) and (previous["size"], previous["mtime"]) == (entry["size"], entry["mtime"]):
+            entry["hash"] = previous["hash"]
+        else:
+            unsure.append(name)
+    for name, digest in zip(unsure, executor.map(file_hash, (os.path.join(source_dir, name) for name in unsure))):
+        entries[name]["hash"] = digest
+    changed = [name for name in unsure if _digest(known.get(name)) != entries[name]["hash"]]
+    removed = [name for name in known if name not in entries]
+    return entries, changed, removed
+
+
+def prune(images_dir: str, labels_dir: str, keep: set[str]) -> int:
+    """
+    Удаляет из набора изображения и разметку, которые не относятся к изображениям keep,
+    например оставшиеся от исходных кадров, которых больше нет в манифесте
+
+    :param images_dir: Папка изображений набора
+    :type images_dir: str
+    :param labels_dir: Папка разметки набора
+    :type labels_dir: str
+    :param keep: Имена изображений, которые должны остаться
+    :type keep: set[str]
+    :return: Количество удалённых изображений
+    :rtype: int
+    """
+    stems = {os.path.splitext(name)[0] for name in keep}
+    removed = 0
+    for name in os.listdir(images_dir):
+        path = os.path.join(images_dir, name)
+        if name not in keep and os.path.isfile(path):
+            os.unlink(path)
+            removed += 1
+    for name in os.listdir(labels_dir):
+        path = os.path.join(labels_dir, name)
+        if os.path.splitext(name)[0] not in stems and os.path.isfile(path):
+            os.unlink(path)
+    return removed
+
+
+def _link_or_copy(source: str, target: str) -> None:
+    if os.path.exists(target):
+        os.unlink(target)
+    try:
+        os.link(source, target)
+    except OSError:
+        shutil.copyfile(source, target)
+
+
+def _batches(names: list[str], batch_size: int):
+    iterator = iter(names)
+    while batch := list(islice(iterator, batch_size)):
+        yield batch
+
+
+def auto_label(source_dir: str, dataset_dir: str = "self development dataset/train",
+               weights: str = "runs/detect/train/weights/best.pt", conf: float = 0.5,
+               batch_size: int = 16, workers: int | None = None) -> dict[str, int]:
+    """
+    Размечает изображения моделью для самообучения.
+
+    Обрабатываются только новые и изменённые изображения: их хэши хранятся в манифесте
+    в dataset_dir. Изображения и разметка, которых нет среди кадров source_dir, удаляются
+    из набора. Смена весов или порога conf приводит к полной переразметке. Чтение идёт в пуле потоков заранее,
+    пока модель обрабатывает предыдущую пачку. Изображения, которые не удалось прочитать,
+    в манифест не попадают и будут обработаны при следующем запуске.
+
+    :param source_dir: Папка с кадрами
+    :type source_dir: str
+    :param dataset_dir: Папка набора с подпапками images и labels
+    :type dataset_dir: str
+    :param weights: Веса модели
+    :type weights: str
+    :param conf: Порог уверенности
+    :type conf: float
+    :param batch_size: Размер пачки для model.predict
+    :type batch_size: int
+    :param workers: Число потоков чтения, по умолчанию как у ThreadPoolExecutor
+    :type workers: int | None
+    :return: Количество размеченных, нечитаемых, пропущенных и удалённых изображений
+    :rtype: dict[str, int]
+    """
+    images_dir = os.path.join(dataset_dir, "images")
+    labels_dir = os.path.join(dataset_dir, "labels")
+    os.makedirs(images_dir, exist_ok=True)
+    os.makedirs(labels_dir, exist_ok=True)
+    manifest_path = os.path.join(dataset_dir, MANIFEST)
+    model_key = f"{file_hash(weights)}:{conf}"
+    known = load_manifest(manifest_path, model_key)
+
+    with ThreadPoolExecutor(workers) as executor:
+        entries, changed, _ = plan(source_dir, known, executor)
+        # Манифест другой модели пуст, поэтому файлы набора сверяются с кадрами, а не с манифестом
+        removed = prune(images_dir, labels_dir, set(entries))
+        # Неизменённые изображения получают записи с размером и временем изменения
+        changed_names = set(changed)
+        known = {name: entry for name, entry in entries.items() if name in known and name not in changed_names}
+        labelled = 0
+        print(f"В папке имеется {len(entries)} изображений, новых или изменённых {len(changed)}")
+
+        if changed:
+            from ultralytics import YOLO
+
+            model = YOLO(weights)
+            batches = _batches(changed, batch_size)
+
+            def read(batch):
+                return batch, executor.map(cv2.imread, (os.path.join(source_dir, name) for name in batch))
+
+            pending = read(next(batches))
+            while pending is not None:
+                readable = [(name, image) for name, image in zip(*pending) if image is not None]
+                batch = next(batches, None)
+                pending = read(batch) if batch is not None else None
+                images = [image for _, image in readable]
+                predictions = model.predict(images, conf=conf, verbose=False) if images else []
+                for (name, image), results in zip(readable, predictions):
+                    boxes = results.boxes.cpu().numpy()
+                    with open(os.path.join(labels_dir, os.path.splitext(name)[0] + ".txt"), "w") as file:
+                        file.write(yolo_lines(boxes.cls, boxes.xyxy, image.shape))
+                    _link_or_copy(os.path.join(source_dir, name), os.path.join(images_dir, name))
+                    known[name] = entries[name]
+                    labelled += 1
+                save_manifest(manifest_path, model_key, known)
+    save_manifest(manifest_path, model_key, known)
+    return {"labelled": labelled, "failed": len(changed) - labelled,
+            "skipped": len(entries) - len(changed), "removed": removed}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Авторазметка кадров для самообучения модели")
+    parser.add_argument("source", help="Папка с кадрами")
+    parser.add_argument("--dataset", default="self development dataset/train")
+    parser.add_argument("--weights", default="runs/detect/train/weights/best.pt")
+    parser.add_argument("--conf", type=float, default=0.5)
+    parser.add_argument("--batch-size", type=int, default=16)
+    parser.add_argument("--workers", type=int)
+    args = parser.parse_args()
+    print(auto_label(args.source, args.dataset, args.weights, args.conf, args.batch_size, args.workers))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,210 @@
+import argparse
+import hashlib
+import itertools
+import json
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import asdict, dataclass
+
+import yaml
+
+from Backends import load_model
+from DetectionCache import DetectionCache, DetectionRecorder, replay
+from Doors import DoorList
+from Tracking import MODEL_ARGS, Tracking
+
+
+@dataclass(frozen=True, slots=True)
+class DoorParams:
+    close: int
+    around: int
+    dx: int = 0
+    dy: int = 0
+
+
+@dataclass(slots=True)
+class SweepResult:
+    tracker: dict
+    doors: DoorParams
+    in_out: list[int]
+    error: int
+    replay_seconds: float
+    inference_seconds: float
+
+
+def tracker_config(base_path: str, overrides: dict, directory: str) -> str:
+    """
+    Записывает конфигурацию трекера с изменёнными порогами
+
+    :param base_path: Исходная конфигурация, например botsort.yaml
+    :type base_path: str
+    :param overrides: Изменённые параметры
+    :type overrides: dict
+    :param directory: Папка для новой конфигурации
+    :type directory: str
+    :return: Путь к новой конфигурации; имя зависит от содержимого
+    :rtype: str
+    """
+    with open(base_path) as file:
+        config = yaml.safe_load(file)
+    config.update(overrides)
+    text = yaml.safe_dump(config, sort_keys=True)
+    path = os.path.join(directory, f"tracker_{hashlib.sha1(text.encode()).hexdigest()[:12]}.yaml")
+    if not os.path.exists(path):
+        with open(path, "w") as file:
+            file.write(text)
+    return path
+
+
+def cache_key(video_path: str, weights: str, tracker_path: str) -> str:
+    """
+    Имя кэша обнаружений: зависит от видео, файла весов, аргументов модели и конфигурации трекера.
+    После переобучения или смены MODEL_ARGS старые обнаружения не используются.
+
+    :rtype: str
+    """
+    weights_stat = os.stat(weights)
+    source = json.dumps({"video": os.path.abspath(video_path), "weights": os.path.abspath(weights),
+                         "weights_mtime": weights_stat.st_mtime, "weights_size": weights_stat.st_size,
+                         "model_args": {key: value for key, value in MODEL_ARGS.items() if key != "tracker"}},
+                        sort_keys=True)
+    tracker = os.path.splitext(os.path.basename(tracker_path))[0]
+    return f"{hashlib.sha1(source.encode()).hexdigest()[:12]}_{tracker}"
+
+
+def record(video_path: str, weights: str, tracker_path: str, cache_path: str, threads: int) -> float:
+    """
+    Записывает обнаружения видео в кэш, если его ещё нет
+
+    :param threads: Число потоков torch в процессе
+    :type threads: int
+    :return: Время инференса в секундах (0, если кэш уже был)
+    :rtype: float
+    """
+    if os.path.exists(os.path.join(cache_path, "meta.json")):
+        return 0.0
+    import torch
+
+    torch.set_num_threads(threads)
+    start = time.perf_counter()
+    model = load_model(weights)
+    model_args = dict(MODEL_ARGS, tracker=tracker_path)
+    with DetectionRecorder(cache_path, video=video_path, vid_stride=model_args["vid_stride"]) as recorder:
+        for frame_index, results in enumerate(model.track(video_path, stream=True, **model_args)):
+            recorder.append(frame_index, results)
+    return time.perf_counter() - start
+
+
+def evaluate(cache_path: str, doors_path: str, params: DoorParams, truth: dict) -> tuple[list[int], int, float]:
+    """
+    Прогоняет логику подсчёта по кэшу с заданными параметрами дверей
+
+    :return: Счётчики [зашло, вышло], ошибка относительно truth и время прогона
+    :rtype: tuple[list[int], int, float]
+    """
+    doors = DoorList.from_file(doors_path).shifted(params.dx, params.dy, params.close, params.around)
+    tracking = Tracking(doors=doors)
+    start = time.perf_counter()
+    replay(DetectionCache(cache_path), tracking)
+    seconds = time.perf_counter() - start
+    error = abs(tracking.in_out[0] - truth["in"]) + abs(tracking.in_out[1] - truth["out"])
+    return tracking.in_out, error, seconds
+
+
+def sweep(video_path: str, doors_path: str, weights: str, truth: dict,
+          door_grid: list[DoorParams], tracker_grid: list[dict],
+          cache_dir: str = "sweep_cache", base_tracker: str = "botsort.yaml",
+          processes: int | None = None) -> list[SweepResult]:
+    """
+    Перебирает сочетания параметров дверей и трекера на всех ядрах.
+
+    Инференс запускается один раз на каждую конфигурацию трекера, результат кэшируется
+    в cache_dir и переиспользуется для всех параметров дверей и следующих запусков.
+
+    :param video_path: Размеченное видео
+    :param doors_path: Файл с углами дверей
+    :param weights: Путь к весам модели
+    :param truth: Эталон {"in": int, "out": int}
+    :param door_grid: Параметры дверей
+    :param tracker_grid: Изменения порогов трекера, {} - исходная конфигурация
+    :param cache_dir: Папка для кэшей обнаружений
+    :param base_tracker: Исходная конфигурация трекера
+    :param processes: Число процессов, по умолчанию os.cpu_count()
+    :return: Результаты, отсортированные по ошибке и затем по времени
+    :rtype: list[SweepResult]
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    caches = dict()
+    for overrides in tracker_grid:
+        tracker_path = tracker_config(base_tracker, overrides, cache_dir)
+        caches[tracker_path] = os.path.join(cache_dir, cache_key(video_path, weights, tracker_path))
+
+    cpu_count = os.cpu_count() or 1
+    processes = processes or cpu_count
+    # Инференс идёт одновременно не более чем в len(caches) процессах, ядра делятся между ними
+    threads = max(1, cpu_count // max(1, min(processes, len(caches))))
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=processes, mp_context=context) as executor:
+        recorded = {tracker_path: executor.submit(record, video_path, weights, tracker_path, cache_path, threads)
+                    for tracker_path, cache_path in caches.items()}
+        inference = {tracker_path: future.result() for tracker_path, future in recorded.items()}
+        jobs = list()
+        for overrides, params in itertools.product(tracker_grid, door_grid):
+            tracker_path = tracker_config(base_tracker, overrides, cache_dir)
+            future = executor.submit(evaluate, caches[tracker_path], doors_path, params, truth)
+            jobs.append((overrides, params, tracker_path, future))
+        results = list()
+        for overrides, params, tracker_path, future in jobs:
+            in_out, error, seconds = future.result()
+            results.append(SweepResult(overrides, params, in_out, error, seconds, inference[tracker_path]))
+    return sorted(results, key=lambda r: (r.error, r.replay_seconds))
+
+
+def _ints(text: str) -> list[int]:
+    return [int(value) for value in text.split(",")]
+
+
+def _tracker_grid(params: list[str]) -> list[dict]:
+    keys, values = list(), list()
+    for param in params:
+        key, options = param.split("=")
+        keys.append(key)
+        values.append([yaml.safe_load(option) for option in options.split(",")])
+    return [dict(zip(keys, combination)) for combination in itertools.product(*values)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Подбор порогов дверей и трекера по эталонным счётчикам")
+    parser.add_argument("video")
+    parser.add_argument("--doors", default="doors_corners.txt")
+    parser.add_argument("--weights", default="runs/detect/train2/weights/best.pt")
+    parser.add_argument("--truth", required=True, help='Путь к JSON-файлу вида {"in": 10, "out": 8}')
+    parser.add_argument("--close", type=_ints, default=[54])
+    parser.add_argument("--around", type=_ints, default=[100])
+    parser.add_argument("--dx", type=_ints, default=[0])
+    parser.add_argument("--dy", type=_ints, default=[0])
+    parser.add_argument("--tracker", action="append", default=[],
+                        help="Порог трекера и значения через запятую, например match_thresh=0.8,0.9")
+    parser.add_argument("--cache-dir", default="sweep_cache")
+    parser.add_argument("--processes", type=int)
+    parser.add_argument("--save", help="Сохранить результаты в JSON")
+    args = parser.parse_args()
+
+    with open(args.truth) as file:
+        truth = json.load(file)
+    door_grid = [DoorParams(*values) for values in itertools.product(args.close, args.around, args.dx, args.dy)
+                 if values[0] < values[1]]
+    results = sweep(args.video, args.doors, args.weights, truth, door_grid,
+                    _tracker_grid(args.tracker), args.cache_dir, processes=args.processes)
+    for result in results:
+        print(f"ошибка {result.error:3d}  {result.in_out}  {asdict(result.doors)}  {result.tracker}  "
+              f"подсчёт {result.replay_seconds:.2f} с  инференс {result.inference_seconds:.1f} с")
+    if args.save:
+        with open(args.save, "w") as file:
+            json.dump([asdict(result) for result in results], file, indent=2, ensure_ascii=False)
+
+
+if __name__ == "__main__":
+    main()